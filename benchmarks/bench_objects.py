@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark of the per-object memory and construction time of the easypay.api response and
+notification objects, next to the baseline: the same classes without __slots__, always keeping the raw payload.
+
+    python benchmarks/bench_objects.py [--number 20000] [--no-raw]
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+if not settings.configured:
+    settings.configure(EASYPAY_ACCOUNT_ID='account', EASYPAY_API_KEY='key')
+django.setup()
+
+from easypay import api  # noqa: E402
+
+
+PAYMENT_RESPONSE = {
+    'status': 'ok',
+    'message': ['Your request was successfully created'],
+    'id': '2f0ea3b9-0d7c-4b6a-8d50-7f0c4bd5c7a3',
+    'method': {'type': 'mb', 'status': 'pending', 'entity': 21098, 'reference': '123456789'},
+    'customer': {'id': 'a1c2b3d4-0000-4b6a-8d50-7f0c4bd5c7a3'},
+}
+GENERIC_NOTIFICATION = {
+    'id': '2f0ea3b9-0d7c-4b6a-8d50-7f0c4bd5c7a3',
+    'key': 'merchant-key',
+    'type': 'capture',
+    'status': 'success',
+    'messages': ['Your request was successfully completed'],
+    'date': '2019-01-01 10:00:00',
+}
+TRANSACTION_NOTIFICATION = {
+    'id': '2f0ea3b9-0d7c-4b6a-8d50-7f0c4bd5c7a3',
+    'value': 10.5,
+    'currency': 'EUR',
+    'key': 'merchant-key',
+    'expiration_time': None,
+    'customer': {'id': 'a1c2b3d4', 'name': 'John Doe', 'email': 'john@example.com', 'phone': '911234567',
+                 'phone_indicative': '+351', 'fiscal_number': 'PT123456789', 'key': '1'},
+    'method': 'mb',
+    'transaction': {'id': 'b7c1', 'key': 'transaction-key', 'type': 'capture', 'date': '2019-01-01 10:00:00',
+                    'values': {'requested': 10.5, 'paid': 10.5, 'fixed_fee': 0.5, 'variable_fee': 0, 'tax': 0.12,
+                               'transfer': 9.88},
+                    'transfer_date': '2019-01-03', 'document_number': 'DOC1'},
+    'account': {'id': 'a2b3'},
+}
+
+
+class FakeResponse:
+    """Stands in for a requests Response"""
+
+    def __init__(self, data):
+        self.content = json.dumps(data).encode()
+        self.status_code = 200
+        self.ok = True
+        self.url = 'https://api.test.easypay.pt/2.0/single'
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class BaselinePaymentMethod:
+    """easypay.api.PaymentMethod before __slots__"""
+
+    def __init__(self, dict):
+        self.method_type = api.MethodType(dict.get('type', '').lower())
+        self.entity = dict.get('entity')
+        self.reference = dict.get('reference')
+        self.url = dict.get('url')
+        self.last_four = dict.get('last_four')
+        self.card_type = dict.get('card_type')
+        self.expiration_date = dict.get('expiration_date')
+        self.alias = dict.get('alias')
+        self.status = dict.get('status')
+
+
+class BaselineCustomer:
+    """easypay.api.Customer before __slots__"""
+
+    def __init__(self, data):
+        self.id = data.get('id')
+        self.name = data.get('name')
+        self.email = data.get('email')
+        self.phone = data.get('phone')
+        self.phone_indicative = data.get('phone_indicative')
+        self.fiscal_number = data.get('fiscal_number')
+        self.key = data.get('key')
+
+
+class BaselineTransaction:
+    """easypay.api.Transaction before __slots__"""
+
+    def __init__(self, data):
+        self.id = data.get('id')
+        self.key = data.get('key')
+        self.transaction_type = data.get('type')
+        self.date = data.get('date')
+        self.values = data.get('values')
+        self.transfer_date = data.get('transfer_date')
+        self.document_number = data.get('document_number')
+
+
+class BaselinePaymentResponse:
+    """easypay.api.PaymentResponse before __slots__"""
+
+    def __init__(self, response):
+        response_dict = response.json()
+        self.status = response_dict.get('status')
+        self.messages = api.get_messages(response_dict)
+        self.id = response_dict.get('id')
+        self.method = BaselinePaymentMethod(response_dict.get('method'))
+        self.customer_id = response_dict.get('customer', {}).get('id')
+        self.response = response
+
+
+class BaselineGenericNotification:
+    """easypay.api.GenericNotification before __slots__"""
+
+    def __init__(self, request_dict):
+        self.id = request_dict.get('id')
+        self.merchant_key = request_dict.get('key')
+        self.type = api.NotificationType(request_dict.get('type', '').lower())
+        self.status = api.NotificationStatus(request_dict.get('status', '').lower())
+        self.messages = api.get_messages(request_dict)
+        self.date = request_dict.get('date')
+        self.request = request_dict
+
+
+class BaselineTransactionNotification:
+    """easypay.api.TransactionNotification before __slots__"""
+
+    def __init__(self, request_dict):
+        self.id = request_dict.get('id')
+        self.value = request_dict.get('value')
+        self.currency = request_dict.get('currency')
+        self.merchant_key = request_dict.get('key')
+        self.expiration_time = request_dict.get('expiration_time')
+        self.customer = BaselineCustomer(request_dict.get('customer', {}))
+        self.method = request_dict.get('method')
+        self.transaction = BaselineTransaction(request_dict.get('transaction', {}))
+        self.account_id = request_dict.get('account', {}).get('id')
+        self.request = request_dict
+
+
+def payment_response():
+    return api.PaymentResponse(FakeResponse(PAYMENT_RESPONSE))
+
+
+def generic_notification():
+    return api.GenericNotification(dict(GENERIC_NOTIFICATION))
+
+
+def transaction_notification():
+    return api.TransactionNotification(json.loads(json.dumps(TRANSACTION_NOTIFICATION)))
+
+
+def baseline_payment_response():
+    return BaselinePaymentResponse(FakeResponse(PAYMENT_RESPONSE))
+
+
+def baseline_generic_notification():
+    return BaselineGenericNotification(dict(GENERIC_NOTIFICATION))
+
+
+def baseline_transaction_notification():
+    return BaselineTransactionNotification(json.loads(json.dumps(TRANSACTION_NOTIFICATION)))
+
+
+BENCHMARKS = (
+    ('payment_response', baseline_payment_response, payment_response),
+    ('generic_notification', baseline_generic_notification, generic_notification),
+    ('transaction_notification', baseline_transaction_notification, transaction_notification),
+)
+
+
+def measure(factory, number):
+    factory()
+    seconds = min(timeit.repeat(factory, number=number, repeat=3)) / number
+
+    gc.collect()
+    tracemalloc.start()
+    objects = [factory() for _ in range(number)]
+    size = tracemalloc.get_traced_memory()[0] / number
+    tracemalloc.stop()
+    del objects
+    return seconds, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=20000, help='objects built per measurement')
+    parser.add_argument('--no-raw', action='store_true', help='run with EASYPAY_KEEP_RAW_PAYLOADS = False')
+    args = parser.parse_args()
+
+    if args.no_raw:
+        from easypay import settings as easypay_settings
+        easypay_settings.KEEP_RAW_PAYLOADS = False
+
+    print('{:<26} {:<9} {:>12} {:>14}'.format('object', 'variant', 'build (us)', 'retained (B)'))
+    for name, baseline, factory in BENCHMARKS:
+        for variant, func in (('baseline', baseline), ('slots', factory)):
+            seconds, size = measure(func, args.number)
+            print('{:<26} {:<9} {:>12.2f} {:>14.0f}'.format(name, variant, seconds * 1e6, size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark of the per-call CPU cost of building and encoding a single_payment request and of
+decoding its PaymentResponse, without any network I/O, next to the baseline: the payload built as a full nested
+dict, encoded and decoded with the stdlib json.
+
+    python benchmarks/bench_payload.py [--number 20000]
+"""
+import argparse
+import json
+from numbers import Number
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+if not settings.configured:
+    settings.configure(EASYPAY_ACCOUNT_ID='account', EASYPAY_API_KEY='key')
+django.setup()
+
+from easypay import api  # noqa: E402
+
+
+RESPONSE_BODY = json.dumps({
+    'status': 'ok',
+    'message': ['Your request was successfully created'],
+    'id': '2f0ea3b9-0d7c-4b6a-8d50-7f0c4bd5c7a3',
+    'method': {'type': 'mb', 'status': 'pending', 'entity': 21098, 'reference': '123456789'},
+    'customer': {'id': 'a1c2b3d4-0000-4b6a-8d50-7f0c4bd5c7a3'},
+}).encode()
+
+
+class FakeResponse:
+    """Stands in for a requests Response"""
+    content = RESPONSE_BODY
+    status_code = 201
+    ok = True
+    url = 'https://api.test.easypay.pt/2.0/single'
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class RecordingClient:
+    """Stands in for EasypayClient, returns a canned response without any I/O"""
+    account_id = 'account'
+
+    def post(self, path, data=None, **kwargs):
+        return FakeResponse()
+
+
+def baseline_single_payment_payload(value, payment_type='sale', method='mb', capture_transaction_key=None,
+                                    capture_date=None, capture_descriptive=None, expiration_time=None, currency='EUR',
+                                    customer_account_id=None, customer_name=None, customer_email=None,
+                                    customer_phone=None, customer_phone_indicative='+351', customer_fiscal_number=None,
+                                    customer_key=None, merchant_key=None):
+    """easypay.api.build_single_payment_payload before it omitted None values"""
+    if not isinstance(value, Number):
+        raise ValueError('value must be a number.')
+
+    if not any(method == item.value for item in api.MethodType):
+        raise ValueError('method must be one of {}.'.format(api.MethodType.list()))
+
+    return {
+        'type': payment_type,
+        'capture': {
+            'transaction_key': capture_transaction_key,
+            'capture_date': capture_date,
+            'account': {
+                'id': customer_account_id,
+            },
+            'descriptive': capture_descriptive,
+        },
+        'expiration_time': expiration_time,
+        'currency': currency,
+        'customer': {
+            'id': customer_account_id,
+            'name': customer_name,
+            'email': customer_email,
+            'phone': customer_phone,
+            'phone_indicative': customer_phone_indicative,
+            'fiscal_number': str(customer_fiscal_number),
+            'key': customer_key,
+        },
+        'key': merchant_key,
+        'value': value,
+        'method': method,
+    }
+
+
+def baseline_single_payment(client=RecordingClient()):
+    payload = baseline_single_payment_payload(10.5, method='mbw', expiration_time='2030-01-01 10:00',
+                                              customer_name='John Doe', customer_email='john@example.com',
+                                              customer_phone='911234567', customer_key='1',
+                                              merchant_key='merchant-key')
+    r = client.post('single', data=json.dumps(payload))
+    return api.PaymentResponse.from_dict(r.json())
+
+
+def baseline_build_payload():
+    return baseline_single_payment_payload(10.5, method='mbw', customer_name='John Doe',
+                                           customer_email='john@example.com', merchant_key='merchant-key')
+
+
+def baseline_decode_response(response=FakeResponse()):
+    return api.PaymentResponse.from_dict(response.json())
+
+
+def single_payment(client=RecordingClient()):
+    return api.single_payment(10.5, method='mbw', expiration_time='2030-01-01 10:00', customer_name='John Doe',
+                              customer_email='john@example.com', customer_phone='911234567',
+                              customer_key='1', merchant_key='merchant-key', client=client)
+
+
+def build_payload():
+    return api.build_single_payment_payload(10.5, method='mbw', customer_name='John Doe',
+                                            customer_email='john@example.com', merchant_key='merchant-key')
+
+
+def decode_response(response=FakeResponse()):
+    return api.PaymentResponse(response)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=20000, help='calls per measurement')
+    args = parser.parse_args()
+
+    print('{:<20} {:>12} {:>10}'.format('call', 'baseline us', 'us/call'))
+    for baseline, func in ((baseline_build_payload, build_payload), (baseline_single_payment, single_payment),
+                           (baseline_decode_response, decode_response)):
+        timings = []
+        for f in (baseline, func):
+            f()
+            timings.append(min(timeit.repeat(f, number=args.number, repeat=5)) / args.number * 1e6)
+        print('{:<20} {:>12.2f} {:>10.2f}'.format(func.__name__, *timings))
+
+
+if __name__ == '__main__':
+    main()
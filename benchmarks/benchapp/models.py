@@ -0,0 +1,5 @@
+from easypay.models import AbstractPayment
+
+
+class Payment(AbstractPayment):
+    pass
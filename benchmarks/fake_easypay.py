@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+Local stand-in for the Easypay 2.0 API with configurable latency and error injection.
+
+    python benchmarks/fake_easypay.py --port 8800 --latency 0.05 --error-rate 0.01
+"""
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import threading
+import time
+import uuid
+
+
+class FakeEasypayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/single'):
+            return self.respond(404, {'status': 'error', 'message': ['Not found']})
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return self.respond(400, {'status': 'error', 'message': ['Invalid JSON']})
+        self.respond(201, {
+            'status': 'ok',
+            'message': ['Your request was successfully created'],
+            'id': str(uuid.uuid4()),
+            'method': {'type': payload.get('method', 'mb'), 'status': 'pending', 'entity': 21098,
+                       'reference': '{:09d}'.format(random.randint(0, 999999999))},
+            'customer': {'id': str(uuid.uuid4())},
+        })
+
+    def do_GET(self):
+        self.respond(200, {
+            'status': 'ok',
+            'id': self.path.rstrip('/').rsplit('/', 1)[-1],
+            'method': {'type': 'mb', 'status': 'active', 'entity': 21098, 'reference': '123456789'},
+            'customer': {'id': str(uuid.uuid4())},
+        })
+
+    def do_DELETE(self):
+        self.respond(200, {'status': 'ok', 'message': ['Deleted']})
+
+    def respond(self, status, body):
+        server = self.server
+        if server.latency or server.jitter:
+            time.sleep(max(0.0, server.latency + random.uniform(-server.jitter, server.jitter)))
+        if server.error_rate and random.random() < server.error_rate:
+            status, body = server.error_status, {'status': 'error', 'message': ['Injected error']}
+
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeEasypayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503):
+        """
+        :param latency: seconds added to every response
+        :param jitter: random +/- seconds added to latency
+        :param error_rate: fraction of requests answered with error_status
+        :param error_status: HTTP status of injected errors
+        """
+        super().__init__((host, port), FakeEasypayHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://{}:{}/2.0'.format(*self.server_address)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random +/- seconds added to latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests that fail')
+    parser.add_argument('--error-status', type=int, default=503, help='HTTP status of injected errors')
+    args = parser.parse_args()
+
+    server = FakeEasypayServer(args.host, args.port, args.latency, args.jitter, args.error_rate, args.error_status)
+    print('Fake Easypay API listening on {}'.format(server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+"""
+Throughput and latency benchmarks of the easypay API calls and webhook views against a local fake Easypay server.
+
+    python benchmarks/run.py --concurrency 1,4,16 --requests 500 --latency 0.02 --output results.json
+
+Results are printed as a table and, with --output, written as JSON so runs can be compared between releases.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, '..'))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from fake_easypay import FakeEasypayServer  # noqa: E402
+
+from easypay.metrics import percentile  # noqa: E402
+
+
+def setup_django(backend_url, database_path):
+    import django
+    from django.conf import settings
+
+    settings.configure(
+        DEBUG=False,
+        SECRET_KEY='benchmark',
+        ALLOWED_HOSTS=['*'],
+        INSTALLED_APPS=['django.contrib.auth', 'django.contrib.contenttypes', 'easypay', 'benchapp'],
+        DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': database_path,
+                               'OPTIONS': {'timeout': 30}}},
+        ROOT_URLCONF='easypay.urls',
+        USE_TZ=True,
+        DEFAULT_AUTO_FIELD='django.db.models.AutoField',
+        LOGGING_CONFIG=None,
+        EASYPAY_BACKEND_URL=backend_url,
+        EASYPAY_ACCOUNT_ID='benchmark-account',
+        EASYPAY_API_KEY='benchmark-key',
+        EASYPAY_PERSIST_TRANSACTIONS_CLASS='benchapp.Payment',
+    )
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', run_syncdb=True, verbosity=0)
+
+
+def run_scenario(name, func, concurrency, requests):
+    """
+    Calls func requests times from concurrency threads
+    :return: dict with throughput, error count and latency percentiles in milliseconds
+    """
+    from django.db import close_old_connections
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def call(i):
+        start = time.perf_counter()
+        try:
+            func(i)
+            error = None
+        except Exception as e:
+            error = repr(e)
+        finally:
+            close_old_connections()
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if error:
+                errors.append(error)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(call, range(requests)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'scenario': name,
+        'concurrency': concurrency,
+        'requests': requests,
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'seconds': round(wall, 4),
+        'throughput': round(requests / wall, 2),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def build_scenarios(seed_payments):
+    from django.test import Client
+    from easypay import api, transaction
+
+    payment_ids = [p.id for p in seed_payments]
+    ids = itertools.cycle(payment_ids)
+    ids_lock = threading.Lock()
+
+    def next_id():
+        with ids_lock:
+            return next(ids)
+
+    client = Client()
+
+    def generic_notification(i):
+        body = {'id': next_id(), 'key': 'merchant-key', 'type': 'capture', 'status': 'success',
+                'messages': ['Your request was successfully completed'], 'date': '2019-01-01 10:00:00'}
+        response = client.post('/notify', json.dumps(body), content_type='application/json')
+        assert response.status_code == 200, response.status_code
+
+    def transaction_notification(i):
+        body = {'id': next_id(), 'value': 10, 'currency': 'EUR', 'key': 'merchant-key', 'method': 'mb',
+                'customer': {'id': 'customer', 'name': 'John Doe', 'email': 'john@example.com'},
+                'transaction': {'id': 'transaction-{}'.format(i), 'key': 'key', 'type': 'capture',
+                                'date': '2019-01-01 10:00:00', 'values': {'requested': 10, 'paid': 10}},
+                'account': {'id': 'benchmark-account'}}
+        response = client.post('/transaction_notify', json.dumps(body), content_type='application/json')
+        assert response.status_code == 200, response.status_code
+
+    def mbway_notification(i):
+        body = 'Cin=1&Entity=21098&Key=merchant-key&Reference={}&Status=success&StatusMessage=ok&Type=mbway'.format(i)
+        response = client.post('/mbway_notify', body, content_type='application/x-www-form-urlencoded')
+        assert response.status_code == 200, response.status_code
+
+    return [
+        ('transaction.single_payment', lambda i: transaction.single_payment(10, method='mb')),
+        ('api.get_payment', lambda i: api.get_payment(next_id())),
+        ('views.generic_notification', generic_notification),
+        ('views.transaction_notification', transaction_notification),
+        ('views.mbway_notification', mbway_notification),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', default='1,4,16', help='comma separated concurrency levels')
+    parser.add_argument('--requests', type=int, default=200, help='calls per scenario and concurrency level')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the fake server adds to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random +/- seconds added to latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of fake server responses that fail')
+    parser.add_argument('--scenario', action='append', help='only run scenarios containing this text, repeatable')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    server = FakeEasypayServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate).start()
+    database = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False)
+    database.close()
+    try:
+        setup_django(server.url, database.name)
+
+        import django
+        import easypay
+        from easypay import transaction
+
+        error_rate, server.error_rate = server.error_rate, 0.0
+        seed_payments = [transaction.single_payment(10) for _ in range(50)]
+        server.error_rate = error_rate
+
+        results = []
+        for name, func in build_scenarios(seed_payments):
+            if args.scenario and not any(s in name for s in args.scenario):
+                continue
+            for concurrency in [int(c) for c in args.concurrency.split(',')]:
+                result = run_scenario(name, func, concurrency, args.requests)
+                results.append(result)
+                print('{scenario:<32} c={concurrency:<3} {throughput:>9.1f} req/s  p50 {p50_ms:>8.2f} ms  '
+                      'p99 {p99_ms:>8.2f} ms  errors {errors}'.format(**result))
+    finally:
+        server.stop()
+        os.unlink(database.name)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'meta': {
+                    'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                    'easypay': easypay.__version__,
+                    'django': django.get_version(),
+                    'python': platform.python_version(),
+                    'latency': args.latency,
+                    'jitter': args.jitter,
+                    'error_rate': args.error_rate,
+                },
+                'results': results,
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
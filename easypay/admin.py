@@ -1,7 +1,206 @@
+import calendar
+import datetime
+import json
+
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
+from django.core.paginator import Paginator
+from django.db import connections, models
+from django.utils import formats, timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from django.utils.text import capfirst
+from django.utils.translation import gettext as _
+
+from . import settings
+
+CURSOR_VAR = 'cursor'
+
+
+def estimate_count(queryset):
+    """
+    Row count estimated from the PostgreSQL planner statistics, pg_class.reltuples for a whole table and the
+    EXPLAIN row estimate for a filtered queryset
+    :return: int or None when the database has no estimate
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                           [connection.ops.quote_name(queryset.model._meta.db_table)])
+            row = cursor.fetchone()
+            # reltuples is -1 on PostgreSQL 14+ until the table is first vacuumed or analyzed
+            return int(row[0]) if row and row[0] >= 0 else None
+
+        sql, params = queryset.order_by().query.sql_with_params()
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that uses the planner row estimate instead of COUNT(*) when it is above
+    EASYPAY_ADMIN_EXACT_COUNT_THRESHOLD, smaller results and databases without estimates are counted exactly
+    """
+    estimated = False
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate is None or estimate < settings.ADMIN_EXACT_COUNT_THRESHOLD:
+            return super().count
+        self.estimated = True
+        return estimate
+
+
+class EasypayChangeList(ChangeList):
+    """
+    ChangeList that pages by keyset on (created_at, pk) while the list has the default newest first ordering,
+    so older pages cost the same as the first one, and builds the date hierarchy from calendar ranges instead
+    of a DISTINCT over the whole table
+    """
+    keyset_ordering = ('-created_at', '-id')
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # filters, sorting and date links start again from the newest payments
+        return super().get_query_string(new_params, [CURSOR_VAR] + list(remove or []))
+
+    def parse_cursor(self, value):
+        created_at, _sep, pk = value.rpartition(',')
+        try:
+            created_at = parse_datetime(created_at)
+            pk = self.lookup_opts.pk.to_python(pk)
+        except Exception as e:
+            raise IncorrectLookupParameters(e)
+        if created_at is None or pk is None:
+            raise IncorrectLookupParameters('Invalid cursor %r' % value)
+        return created_at, pk
+
+    def get_results(self, request):
+        ordering = self.model_admin.get_ordering(request)
+        self.keyset = ORDER_VAR not in request.GET and tuple(ordering or ()) == self.keyset_ordering
+        self.cursor = request.GET.get(CURSOR_VAR)
+        if not self.keyset:
+            return super().get_results(request)
+
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        queryset = self.queryset
+        if self.cursor:
+            created_at, pk = self.parse_cursor(self.cursor)
+            queryset = queryset.filter(created_at__lte=created_at).exclude(created_at=created_at, pk__gte=pk)
+        rows = list(queryset[:self.list_per_page + 1])
+        result_list = rows[:self.list_per_page]
+
+        self.next_page_url = None
+        if len(rows) > self.list_per_page:
+            last = result_list[-1]
+            self.next_page_url = super().get_query_string(
+                {CURSOR_VAR: '{},{}'.format(last.created_at.isoformat(), last.pk)})
+        self.first_page_url = self.get_query_string() if self.cursor else None
+
+        self.result_count = paginator.count
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.full_result_count = None
+        self.result_list = result_list
+        self.can_show_all = False
+        self.show_all = False
+        self.multi_page = bool(self.cursor or self.next_page_url)
+        self.paginator = paginator
+
+    def date_hierarchy_links(self):
+        """
+        Same drill-down as the admin date_hierarchy tag, the first level uses an index backed MIN/MAX and the
+        lower levels list every month of the year and day of the month, empty ones included
+        :return: dict with the admin/date_hierarchy.html context
+        """
+        field_name = self.date_hierarchy
+        year_field = '%s__year' % field_name
+        month_field = '%s__month' % field_name
+        day_field = '%s__day' % field_name
+        year_lookup = self.params.get(year_field)
+        month_lookup = self.params.get(month_field)
+        day_lookup = self.params.get(day_field)
+
+        def link(filters):
+            return self.get_query_string(filters, ['%s__' % field_name])
+
+        if not (year_lookup or month_lookup or day_lookup):
+            date_range = self.queryset.aggregate(first=models.Min(field_name), last=models.Max(field_name))
+            if not (date_range['first'] and date_range['last']):
+                return {'show': True, 'choices': []}
+            first, last = (timezone.localtime(v) if timezone.is_aware(v) else v
+                           for v in (date_range['first'], date_range['last']))
+            if first.year != last.year:
+                return {
+                    'show': True,
+                    'choices': [{'link': link({year_field: year}), 'title': str(year)}
+                                for year in range(first.year, last.year + 1)],
+                }
+            year_lookup = first.year
+            if first.month == last.month:
+                month_lookup = first.month
+
+        try:
+            year = int(year_lookup)
+            if month_lookup and day_lookup:
+                day = datetime.date(year, int(month_lookup), int(day_lookup))
+                return {
+                    'show': True,
+                    'back': {
+                        'link': link({year_field: year_lookup, month_field: month_lookup}),
+                        'title': capfirst(formats.date_format(day, 'YEAR_MONTH_FORMAT')),
+                    },
+                    'choices': [{'title': capfirst(formats.date_format(day, 'MONTH_DAY_FORMAT'))}],
+                }
+            if month_lookup:
+                month = int(month_lookup)
+                return {
+                    'show': True,
+                    'back': {'link': link({year_field: year_lookup}), 'title': str(year_lookup)},
+                    'choices': [{
+                        'link': link({year_field: year_lookup, month_field: month_lookup, day_field: day}),
+                        'title': capfirst(formats.date_format(datetime.date(year, month, day), 'MONTH_DAY_FORMAT')),
+                    } for day in range(1, calendar.monthrange(year, month)[1] + 1)],
+                }
+        except ValueError:
+            return {'show': False}
+        return {
+            'show': True,
+            'back': {'link': link({}), 'title': _('All dates')},
+            'choices': [{
+                'link': link({year_field: year_lookup, month_field: month}),
+                'title': capfirst(formats.date_format(datetime.date(year, month, 1), 'YEAR_MONTH_FORMAT')),
+            } for month in range(1, 13)],
+        }
 
 
-# Register your models here.
 class EasypayPaymentAdmin(admin.ModelAdmin):
+    """
+    Admin for AbstractPayment subclasses that stays fast on very large tables: no COUNT(*) on page loads,
+    keyset pagination on created_at/id and no N+1 on user. Index created_at and id together on the
+    concrete model, easypay_payments.Payment does
+    """
     list_display = ('easypay_id', 'merchant_key', 'amount', 'status', 'method_type', 'customer_id',
                     'user', 'created_at', 'updated_at')
+    list_select_related = ('user',)
+    date_hierarchy = 'created_at'
+    ordering = EasypayChangeList.keyset_ordering
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    change_list_template = 'admin/easypay/change_list.html'
+
+    def get_changelist(self, request, **kwargs):
+        return EasypayChangeList
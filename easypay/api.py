@@ -1,14 +1,25 @@
+from datetime import datetime
 from enum import Enum, unique
 from numbers import Number
-import json
-import requests
-from . import settings
 
+from django.utils import timezone
 
-AUTH_HEADERS = {
-    'AccountId': settings.ACCOUNT_ID,
-    'ApiKey': settings.API_KEY,
-}
+from . import json_backend, settings
+from .circuit import EasypayCircuitOpenException, EasypayRateLimitException, EasypayUnavailableException  # noqa: F401
+from .client import check_auth_params, get_client  # noqa: F401
+
+
+EXPIRATION_TIME_FORMAT = '%Y-%m-%d %H:%M'
+
+
+def __getattr__(name):
+    # AUTH_HEADERS used to be built once at import, it now follows the current settings
+    if name == 'AUTH_HEADERS':
+        return {
+            'AccountId': settings.ACCOUNT_ID,
+            'ApiKey': settings.API_KEY,
+        }
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
 
 
 def get_messages(response_dict):
@@ -39,7 +50,7 @@ class MethodType(Enum):
 
     @classmethod
     def has_value(cls, value):
-        return any(value == item.value for item in cls)
+        return value in cls._value2member_map_
 
     @classmethod
     def list(cls):
@@ -51,6 +62,11 @@ class MethodStatus(Enum):
     PENDING = 'pending'
     ACTIVE = 'active'
     DELETED = 'deleted'
+    EXPIRED = 'expired'  # set locally by the easypay_expire_payments command
+
+    @classmethod
+    def has_value(cls, value):
+        return value in cls._value2member_map_
 
     @classmethod
     def list(cls):
@@ -98,7 +114,35 @@ class EasypayApiException(Exception):
         super(EasypayApiException, self).__init__(message)
 
 
-class PaymentMethod:
+class ApiObject:
+    """
+    Base of the Easypay response and notification objects, which use __slots__ to keep
+    the many instances held in backlogs and batch results small
+    """
+    __slots__ = ()
+
+    def as_dict(self):
+        """
+        :return: dict with the public attributes, vars() doesn't work on slotted objects
+        """
+        return {name: getattr(self, name) for cls in type(self).__mro__ for name in getattr(cls, '__slots__', ())
+                if not name.startswith('_')}
+
+    def __repr__(self):
+        return '<{}: {}>'.format(type(self).__name__, self)
+
+
+def _raw(value):
+    """
+    :return: value if EASYPAY_KEEP_RAW_PAYLOADS is set, None otherwise
+    """
+    return value if settings.KEEP_RAW_PAYLOADS else None
+
+
+class PaymentMethod(ApiObject):
+    __slots__ = ('method_type', 'entity', 'reference', 'url', 'last_four', 'card_type', 'expiration_date', 'alias',
+                 'status')
+
     def __init__(self, dict):
         """
         Initialise PaymentMethod
@@ -118,7 +162,9 @@ class PaymentMethod:
         return 'PaymentMethod reference: {}'.format(self.reference)
 
 
-class Customer:
+class Customer(ApiObject):
+    __slots__ = ('id', 'name', 'email', 'phone', 'phone_indicative', 'fiscal_number', 'key')
+
     def __init__(self, data):
         """
         Initialise Customer
@@ -136,7 +182,9 @@ class Customer:
         return 'Customer id: {}'.format(self.id)
 
 
-class Transaction:
+class Transaction(ApiObject):
+    __slots__ = ('id', 'key', 'transaction_type', 'date', 'values', 'transfer_date', 'document_number')
+
     def __init__(self, data):
         """
         Initialise Transaction
@@ -154,25 +202,50 @@ class Transaction:
         return 'Transaction id: {}'.format(self.id)
 
 
-class PaymentResponse:
+class PaymentResponse(ApiObject):
+    __slots__ = ('status', 'messages', 'id', 'method', 'customer_id', '_response')
+
     def __init__(self, response):
         """
         Initialise PaymentResponse
         :param response: requests Response from Easypay
         """
-        response_dict = response.json()
+        self._load(json_backend.loads(response.content))
+        self._response = _raw(response)
+
+    @classmethod
+    def from_dict(cls, response_dict):
+        """
+        Builds a PaymentResponse from an already decoded Easypay response body
+        :param response_dict: dict
+        :return: PaymentResponse
+        """
+        payment_response = cls.__new__(cls)
+        payment_response._load(response_dict)
+        payment_response._response = None
+        return payment_response
+
+    def _load(self, response_dict):
         self.status = response_dict.get('status')
         self.messages = get_messages(response_dict)
         self.id = response_dict.get('id')
         self.method = PaymentMethod(response_dict.get('method'))
         self.customer_id = response_dict.get('customer', {}).get('id')
-        self.response = response
+
+    @property
+    def response(self):
+        """
+        :return: requests Response from Easypay, None unless EASYPAY_KEEP_RAW_PAYLOADS is set
+        """
+        return self._response
 
     def __str__(self):
         return 'PaymentResponse id: {}'.format(self.id)
 
 
-class GenericNotification:
+class GenericNotification(ApiObject):
+    __slots__ = ('id', 'merchant_key', 'type', 'status', 'messages', 'date', '_request')
+
     def __init__(self, request_dict):
         self.id = request_dict.get('id')
         self.merchant_key = request_dict.get('key')
@@ -180,13 +253,23 @@ class GenericNotification:
         self.status = NotificationStatus(request_dict.get('status', '').lower())
         self.messages = get_messages(request_dict)
         self.date = request_dict.get('date')
-        self.request = request_dict
+        self._request = _raw(request_dict)
+
+    @property
+    def request(self):
+        """
+        :return: decoded notification body, None unless EASYPAY_KEEP_RAW_PAYLOADS is set
+        """
+        return self._request
 
     def __str__(self):
         return 'GenericNotification id: {}'.format(self.id)
 
 
-class TransactionNotification:
+class TransactionNotification(ApiObject):
+    __slots__ = ('id', 'value', 'currency', 'merchant_key', 'expiration_time', 'customer', 'method', 'transaction',
+                 'account_id', '_request')
+
     def __init__(self, request_dict):
         self.id = request_dict.get('id')
         self.value = request_dict.get('value')
@@ -197,13 +280,50 @@ class TransactionNotification:
         self.method = request_dict.get('method')
         self.transaction = Transaction(request_dict.get('transaction', {}))
         self.account_id = request_dict.get('account', {}).get('id')
-        self.request = request_dict
+        self._request = _raw(request_dict)
+
+    @property
+    def request(self):
+        """
+        :return: decoded notification body, None unless EASYPAY_KEEP_RAW_PAYLOADS is set
+        """
+        return self._request
 
     def __str__(self):
         return 'TransactionNotification id: {}'.format(self.id)
 
 
-class MbwayNotification:
+def notification_method_status(notification):
+    """
+    Default EASYPAY_NOTIFICATION_STATUS_RESOLVER, returns the payment method status a TransactionNotification
+    implies: a method status when the payload carries one, 'active' for a capture that paid the requested value.
+    Other transactions (authorisations, voids, partial captures) are ambiguous and return None
+    :param notification: TransactionNotification
+    :return: string MethodStatus value or None
+    """
+    method = notification.method
+    status = method.get('status') if isinstance(method, dict) else None
+    if isinstance(status, str) and MethodStatus.has_value(status.lower()):
+        return status.lower()
+
+    # transaction notifications usually carry the method as its type string, e.g. 'mb'
+    transaction = notification.transaction
+    if (transaction.transaction_type or '').lower() != NotificationType.CAPTURE.value:
+        return None
+    values = transaction.values if isinstance(transaction.values, dict) else {}
+    try:
+        requested = float(values['requested'])
+        paid = float(values['paid'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if paid > 0 and paid >= requested:
+        return MethodStatus.ACTIVE.value
+    return None
+
+
+class MbwayNotification(ApiObject):
+    __slots__ = ('cin', 'entity', 'key', 'reference', 'status', 'status_message', 'token', 'type', 'username')
+
     def __init__(self, query_dict):
         self.cin = query_dict.get('Cin')
         self.entity = query_dict.get('Entity')
@@ -216,14 +336,75 @@ class MbwayNotification:
         self.username = query_dict.get('Username')
 
     def __str__(self):
-        return 'TransactionNotification id: {}'.format(self.id)
+        return 'MbwayNotification reference: {}'.format(self.reference)
+
+
+_FAST_NUMBER_TYPES = frozenset([int, float])
+
+
+def _without_none(items):
+    return {key: value for key, value in items if value is not None}
+
+
+def build_single_payment_payload(value, payment_type=PaymentType.SALE.value, method=MethodType.MULTIBANCO.value,
+                                 capture_transaction_key=None, capture_date=None, capture_descriptive=None,
+                                 expiration_time=None, currency='EUR', customer_account_id=None, customer_name=None,
+                                 customer_email=None, customer_phone=None, customer_phone_indicative='+351',
+                                 customer_fiscal_number=None, customer_key=None, merchant_key=None):
+    """
+    Validates the arguments and builds the request payload for a single payment, see single_payment
+    :return: dict, fields left as None are not sent
+    """
+    if type(value) not in _FAST_NUMBER_TYPES and not isinstance(value, Number):
+        raise ValueError('value must be a number.')
+
+    if not MethodType.has_value(method):
+        raise ValueError('method must be one of {}.'.format(MethodType.list()))
+
+    if isinstance(expiration_time, datetime):
+        if timezone.is_aware(expiration_time):
+            expiration_time = timezone.localtime(expiration_time)
+        expiration_time = expiration_time.strftime(EXPIRATION_TIME_FORMAT)
+
+    payload = _without_none((
+        ('type', payment_type),
+        ('expiration_time', expiration_time),
+        ('currency', currency),
+        ('key', merchant_key),
+        ('value', value),
+        ('method', method),
+    ))
+
+    capture = _without_none((
+        ('transaction_key', capture_transaction_key),
+        ('capture_date', capture_date),
+        ('descriptive', capture_descriptive),
+    ))
+    if customer_account_id is not None:
+        capture['account'] = {'id': customer_account_id}
+    if capture:
+        payload['capture'] = capture
+
+    customer = _without_none((
+        ('id', customer_account_id),
+        ('name', customer_name),
+        ('email', customer_email),
+        ('phone', customer_phone),
+        ('phone_indicative', customer_phone_indicative),
+        ('fiscal_number', str(customer_fiscal_number) if customer_fiscal_number is not None else None),
+        ('key', customer_key),
+    ))
+    if customer:
+        payload['customer'] = customer
+
+    return payload
 
 
 def single_payment(value, payment_type=PaymentType.SALE.value, method=MethodType.MULTIBANCO.value,
                    capture_transaction_key=None, capture_date=None, capture_descriptive=None, expiration_time=None,
                    currency='EUR', customer_account_id=None, customer_name=None, customer_email=None,
                    customer_phone=None, customer_phone_indicative='+351', customer_fiscal_number=None,
-                   customer_key=None, merchant_key=None):
+                   customer_key=None, merchant_key=None, client=None, account=None):
     """
     Payments used on a one time purchase
 
@@ -233,7 +414,7 @@ def single_payment(value, payment_type=PaymentType.SALE.value, method=MethodType
     :param capture_transaction_key: string Your internal key identifying this capture
     :param capture_date: string <YYYY-mm-dd>
     :param capture_descriptive: string This will appear in the bank statement/mbway application
-    :param expiration_time: string <YYYY-mm-dd HH:MM> Optional - used only for expirable methods (mbw, cc , dd)
+    :param expiration_time: string <YYYY-mm-dd HH:MM> or datetime Optional - only for expirable methods (mbw, cc , dd)
     :param currency: string Default: "EUR" Valid values: "EUR" "BRL"
     :param customer_account_id:  string <uuid> Optional - uuid from previous created customers
     :param customer_name: string
@@ -243,86 +424,64 @@ def single_payment(value, payment_type=PaymentType.SALE.value, method=MethodType
     :param customer_fiscal_number: string Fiscal Number must be prefixed with country code
     :param customer_key: string
     :param merchant_key: string Merchant identification key
+    :param client: EasypayClient optional, defaults to the shared pooled client
+    :param account: string Easypay AccountId optional, uses that merchant account's client instead
     :return:
     """
-    check_auth_params()
-    url = "{}/single".format(settings.BACKEND_URL)
-
-    if not isinstance(value, Number):
-        raise ValueError('value must be a number.')
-
-    if not MethodType.has_value(method):
-        raise ValueError('method must be one of {}.'.format(MethodType.list()))
-
-    payload = {
-        'type': payment_type,
-        'capture': {
-            'transaction_key': capture_transaction_key,
-            'capture_date': capture_date,
-            'account': {
-                'id': customer_account_id,
-            },
-            'descriptive': capture_descriptive,
-        },
-        'expiration_time': expiration_time,
-        'currency': currency,
-        'customer': {
-            'id': customer_account_id,
-            'name': customer_name,
-            'email': customer_email,
-            'phone': customer_phone,
-            'phone_indicative': customer_phone_indicative,
-            'fiscal_number': str(customer_fiscal_number),
-            'key': customer_key,
-        },
-        'key': merchant_key,
-        'value': value,
-        'method': method,
-    }
-    r = requests.post(url, headers=AUTH_HEADERS, data=json.dumps(payload))
+    if client is None:
+        client = get_client(account)
+
+    payload = build_single_payment_payload(
+        value, payment_type=payment_type, method=method, capture_transaction_key=capture_transaction_key,
+        capture_date=capture_date, capture_descriptive=capture_descriptive, expiration_time=expiration_time,
+        currency=currency, customer_account_id=customer_account_id, customer_name=customer_name,
+        customer_email=customer_email, customer_phone=customer_phone,
+        customer_phone_indicative=customer_phone_indicative, customer_fiscal_number=customer_fiscal_number,
+        customer_key=customer_key, merchant_key=merchant_key)
+    r = client.post('single', data=json_backend.dumps(payload))
 
     if not r.ok:
         raise EasypayApiException(r)
     return PaymentResponse(r)
 
 
-def get_payment(id):
+def get_payment(id, client=None, account=None):
     """
     Shows single payment details
     :param id: string <uuid> Required  Resource Identification
+    :param client: EasypayClient optional, defaults to the shared pooled client
+    :param account: string Easypay AccountId optional, uses that merchant account's client instead
     :return:
     """
-    check_auth_params()
-    url = "{}/single/{}".format(settings.BACKEND_URL,id)
+    if client is None:
+        client = get_client(account)
 
     if not id:
         raise ValueError('id must be a UUID string.')
 
-    r = requests.get(url, headers=AUTH_HEADERS)
+    r = client.get('single/{}'.format(id))
 
     if not r.ok:
         raise EasypayApiException(r)
     return PaymentResponse(r)
 
 
-def delete_payment(id):
+def delete_payment(id, client=None, account=None):
     """
     Deletes single payment
     :param id: string <uuid> Required  Resource Identification
+    :param client: EasypayClient optional, defaults to the shared pooled client
+    :param account: string Easypay AccountId optional, uses that merchant account's client instead
     :return:
     """
-    check_auth_params()
-    url = "{}/single/{}".format(settings.BACKEND_URL,id)
+    if client is None:
+        client = get_client(account)
 
     if not id:
         raise ValueError('id must be a UUID string.')
 
-    r = requests.delete(url, headers=AUTH_HEADERS)
-    return r
-
+    r = client.delete('single/{}'.format(id))
 
-def check_auth_params():
-    if not (settings.ACCOUNT_ID and isinstance(settings.ACCOUNT_ID, str)):
-        raise ValueError('EASYPAY_ACCOUNT_ID setting is invalid.')
-    if not (settings.API_KEY and isinstance(settings.API_KEY, str)):
-        raise ValueError('API_KEY setting is invalid.')
+    from .payment_cache import invalidate_payment
+    invalidate_payment(id, client=client)
+    return r
@@ -0,0 +1,242 @@
+import asyncio
+from collections import OrderedDict
+import weakref
+
+from . import json_backend, settings
+from .api import EasypayApiException, PaymentResponse, build_single_payment_payload, check_auth_params
+from .circuit import get_guard
+from .client import account_credentials, endpoint_name
+from .metrics import get_metrics
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class AsyncEasypayClient:
+    """
+    asyncio HTTP client for the Easypay API, owns a pooled httpx AsyncClient.
+    Requires the optional httpx dependency: pip install django-easypay[async]
+    """
+
+    def __init__(self, account_id=None, api_key=None, backend_url=None, pool_maxsize=None,
+                 connect_timeout=None, read_timeout=None, max_retries=None):
+        """
+        Initialise AsyncEasypayClient, arguments not given default to the EASYPAY_* settings
+        :param account_id: string Easypay AccountId
+        :param api_key: string Easypay ApiKey
+        :param backend_url: string Easypay API base url
+        :param pool_maxsize: maximum number of connections kept alive
+        :param connect_timeout: seconds to wait for a connection
+        :param read_timeout: seconds to wait for a response
+        :param max_retries: retries on connection errors
+        """
+        if httpx is None:
+            raise ImportError('AsyncEasypayClient requires httpx, install it with: pip install django-easypay[async]')
+
+        self.account_id = account_id if account_id is not None else settings.ACCOUNT_ID
+        self.api_key = api_key if api_key is not None else settings.API_KEY
+        self.backend_url = (backend_url or settings.BACKEND_URL).rstrip('/')
+
+        pool_maxsize = pool_maxsize or settings.POOL_MAXSIZE
+        self.session = httpx.AsyncClient(
+            headers={
+                'AccountId': self.account_id,
+                'ApiKey': self.api_key,
+            },
+            timeout=httpx.Timeout(
+                read_timeout if read_timeout is not None else settings.READ_TIMEOUT,
+                connect=connect_timeout if connect_timeout is not None else settings.CONNECT_TIMEOUT,
+            ),
+            limits=httpx.Limits(max_connections=pool_maxsize, max_keepalive_connections=pool_maxsize),
+            # httpx only retries failed connection attempts, so this is safe for POST as well
+            transport=httpx.AsyncHTTPTransport(
+                retries=max_retries if max_retries is not None else settings.MAX_RETRIES),
+        )
+
+    def url(self, path):
+        return '{}/{}'.format(self.backend_url, path.lstrip('/'))
+
+    async def request(self, method, path, **kwargs):
+        """
+        Sends a request through the endpoint rate limiter and circuit breaker shared with the sync client, see
+        EASYPAY_CIRCUIT_*. Raises EasypayCircuitOpenException or EasypayRateLimitException without calling the API
+        :return: httpx Response
+        """
+        endpoint = endpoint_name(path)
+        guard = get_guard(self.account_id, endpoint)
+        if guard is not None:
+            await guard.before_call_async()
+        with get_metrics().timer('easypay_api_request_seconds', method=method, endpoint=endpoint) as labels:
+            labels['status'] = 'error'
+            try:
+                response = await self.session.request(method, self.url(path), **kwargs)
+            except Exception:
+                if guard is not None:
+                    guard.record()
+                raise
+            if guard is not None:
+                guard.record(response.status_code)
+            labels['status'] = response.status_code
+            return response
+
+    async def get(self, path, **kwargs):
+        return await self.request('GET', path, **kwargs)
+
+    async def post(self, path, data=None, **kwargs):
+        return await self.request('POST', path, content=data, **kwargs)
+
+    async def delete(self, path, **kwargs):
+        return await self.request('DELETE', path, **kwargs)
+
+    async def close(self):
+        await self.session.aclose()
+
+
+# httpx connections are bound to the event loop that opened them, so keep one default client per loop
+_default_clients = weakref.WeakKeyDictionary()
+
+
+def get_default_async_client():
+    """
+    Returns the AsyncEasypayClient built from settings for the running event loop, creating it on first use.
+    The credentials are validated once, when the client is built
+    :return: AsyncEasypayClient
+    """
+    loop = asyncio.get_running_loop()
+    client = _default_clients.get(loop)
+    if client is None:
+        check_auth_params()
+        client = _default_clients[loop] = AsyncEasypayClient()
+    return client
+
+
+@settings.on_change('BACKEND_URL', 'ACCOUNT_ID', 'API_KEY', 'POOL_MAXSIZE', 'CONNECT_TIMEOUT', 'READ_TIMEOUT',
+                    'MAX_RETRIES')
+def _reset_default_async_clients():
+    # closing needs each client's own loop, dropped clients close their connections when garbage collected
+    _default_clients.clear()
+
+
+# per loop as well, AccountId -> AsyncEasypayClient of the merchant accounts, least recently used first
+_account_clients = weakref.WeakKeyDictionary()
+
+# account credentials may hold EasypayClient arguments the async client has no use for, e.g. pool_connections
+_ASYNC_CLIENT_ARGUMENTS = ('account_id', 'api_key', 'backend_url', 'pool_maxsize', 'connect_timeout', 'read_timeout',
+                           'max_retries')
+
+
+def get_async_client(account=None):
+    """
+    Returns the AsyncEasypayClient of a merchant account for the running event loop, built from
+    EASYPAY_ACCOUNTS / EASYPAY_ACCOUNT_LOADER on first use. Each loop keeps up to EASYPAY_ACCOUNT_CLIENTS_MAXSIZE
+    of them, the least recently used one is dropped
+    :param account: string Easypay AccountId of a merchant, None or EASYPAY_ACCOUNT_ID for the default client
+    :return: AsyncEasypayClient
+    """
+    if account is None or account == settings.ACCOUNT_ID:
+        return get_default_async_client()
+
+    loop = asyncio.get_running_loop()
+    clients = _account_clients.get(loop)
+    if clients is None:
+        clients = _account_clients[loop] = OrderedDict()
+    client = clients.get(account)
+    if client is None:
+        credentials = account_credentials(account)
+        client = clients[account] = AsyncEasypayClient(
+            **{name: value for name, value in credentials.items() if name in _ASYNC_CLIENT_ARGUMENTS})
+        while len(clients) > settings.ACCOUNT_CLIENTS_MAXSIZE:
+            # requests in flight finish, the dropped client closes its connections when garbage collected
+            clients.popitem(last=False)
+    clients.move_to_end(account)
+    return client
+
+
+@settings.on_change('ACCOUNTS', 'ACCOUNT_LOADER', 'ACCOUNT_CLIENTS_MAXSIZE', 'BACKEND_URL', 'POOL_MAXSIZE',
+                    'CONNECT_TIMEOUT', 'READ_TIMEOUT', 'MAX_RETRIES')
+def _reset_account_async_clients():
+    _account_clients.clear()
+
+
+async def close_async_clients():
+    """
+    Closes every AsyncEasypayClient of the running event loop, the default one and those of merchant accounts
+    :return:
+    """
+    await close_default_async_client()
+    clients = _account_clients.pop(asyncio.get_running_loop(), None)
+    for client in (clients or {}).values():
+        await client.close()
+
+
+async def close_default_async_client():
+    """
+    Closes the AsyncEasypayClient of the running event loop
+    :return:
+    """
+    client = _default_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+
+async def async_single_payment(*args, client=None, account=None, **kwargs):
+    """
+    Payments used on a one time purchase, async counterpart of easypay.api.single_payment which
+    takes the same arguments
+    :param client: AsyncEasypayClient optional, defaults to the shared pooled client of the running loop
+    :param account: string Easypay AccountId optional, uses that merchant account's client instead
+    :return: PaymentResponse
+    """
+    if client is None:
+        client = get_async_client(account)
+
+    payload = build_single_payment_payload(*args, **kwargs)
+    r = await client.post('single', data=json_backend.dumps(payload))
+
+    if not r.is_success:
+        raise EasypayApiException(r)
+    return PaymentResponse(r)
+
+
+async def async_get_payment(id, client=None, account=None):
+    """
+    Shows single payment details
+    :param id: string <uuid> Required  Resource Identification
+    :param client: AsyncEasypayClient optional, defaults to the shared pooled client of the running loop
+    :param account: string Easypay AccountId optional, uses that merchant account's client instead
+    :return: PaymentResponse
+    """
+    if client is None:
+        client = get_async_client(account)
+
+    if not id:
+        raise ValueError('id must be a UUID string.')
+
+    r = await client.get('single/{}'.format(id))
+
+    if not r.is_success:
+        raise EasypayApiException(r)
+    return PaymentResponse(r)
+
+
+async def async_delete_payment(id, client=None, account=None):
+    """
+    Deletes single payment
+    :param id: string <uuid> Required  Resource Identification
+    :param client: AsyncEasypayClient optional, defaults to the shared pooled client of the running loop
+    :param account: string Easypay AccountId optional, uses that merchant account's client instead
+    :return: httpx Response
+    """
+    if client is None:
+        client = get_async_client(account)
+
+    if not id:
+        raise ValueError('id must be a UUID string.')
+
+    r = await client.delete('single/{}'.format(id))
+
+    from .payment_cache import invalidate_payment
+    invalidate_payment(id, client=client)
+    return r
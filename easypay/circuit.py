@@ -0,0 +1,386 @@
+import asyncio
+import threading
+import time
+
+from django.core.cache import caches
+
+from . import settings
+from .metrics import get_metrics
+
+
+CACHE_KEY = 'easypay:circuit:{}:{}:{}'
+
+
+class EasypayUnavailableException(Exception):
+    """Base of the exceptions raised instead of calling the Easypay API."""
+    endpoint = None
+
+    def __init__(self, endpoint, message):
+        self.endpoint = endpoint
+        super(EasypayUnavailableException, self).__init__(message)
+
+
+class EasypayCircuitOpenException(EasypayUnavailableException):
+    """Exception raised without calling the Easypay API while the endpoint circuit breaker is open."""
+    retry_after = None
+
+    def __init__(self, endpoint, retry_after):
+        self.retry_after = retry_after
+        super(EasypayCircuitOpenException, self).__init__(
+            endpoint, 'Easypay {} circuit is open, retry in {:.1f}s.'.format(endpoint, retry_after))
+
+
+class EasypayRateLimitException(EasypayUnavailableException):
+    """Exception raised when no rate limit token for the endpoint became free within the maximum wait."""
+
+    def __init__(self, endpoint):
+        super(EasypayRateLimitException, self).__init__(endpoint, 'Easypay {} rate limit exceeded.'.format(endpoint))
+
+
+def is_failure(status_code):
+    """
+    :return: True for the responses that count as circuit breaker failures, 429 and 5xx
+    """
+    return status_code == 429 or status_code >= 500
+
+
+class RateLimiter:
+    """
+    Base of the rate limiters, subclasses implement try_acquire
+    """
+
+    def try_acquire(self):
+        """
+        Takes a token if one is free
+        :return: None if a token was taken, else the seconds until one may be free
+        """
+        raise NotImplementedError
+
+    def acquire(self, max_wait):
+        """
+        Takes a token, sleeping up to max_wait seconds for one
+        :return: True if a token was taken
+        """
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = self.try_acquire()
+            if wait is None:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    async def acquire_async(self, max_wait):
+        """
+        Same as acquire, waiting without blocking the event loop
+        """
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = self.try_acquire()
+            if wait is None:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+
+class TokenBucket(RateLimiter):
+    """
+    In-process token bucket, refilled at rate tokens per second up to burst
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return None
+            return (1 - self._tokens) / self.rate
+
+
+class CacheRateLimiter(RateLimiter):
+    """
+    Rate limiter shared through a Django cache by every process using it. Calls are counted with cache.incr
+    in one second windows, so bursts are limited to rate calls per window
+    """
+
+    def __init__(self, cache, key, rate):
+        self.cache = cache
+        self.key = key
+        self.limit = max(1, int(rate))
+
+    def try_acquire(self):
+        now = time.time()
+        window_key = '{}:{}'.format(self.key, int(now))
+        self.cache.add(window_key, 0, timeout=2)
+        try:
+            count = self.cache.incr(window_key)
+        except ValueError:  # the window expired between add and incr
+            return 0
+        if count <= self.limit:
+            return None
+        return int(now) + 1 - now
+
+
+class CircuitBreaker:
+    """
+    In-process circuit breaker. Closed, it counts consecutive failures and opens after failure_threshold of
+    them. Open, calls fail fast for reset_timeout seconds, then it is half-open and a single trial call is let
+    through: success closes it, failure opens it again
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return self.CLOSED
+        if self._trial or time.time() >= self._opened_at + self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def retry_after(self):
+        """
+        :return: seconds until the open breaker lets a trial call through, None when it isn't open
+        """
+        opened_at = self._opened_at
+        if opened_at is None:
+            return None
+        retry_after = opened_at + self.reset_timeout - time.time()
+        return retry_after if retry_after > 0 else None
+
+    def before_call(self):
+        """
+        Claims the trial call when half-open
+        :return: None if the call may go ahead, else the seconds until the breaker lets a trial call through
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return None
+            retry_after = self._opened_at + self.reset_timeout - time.time()
+            if retry_after > 0:
+                return retry_after
+            if self._trial:
+                return self.reset_timeout
+            self._trial = True
+            return None
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        """
+        :return: True if this failure opened the breaker
+        """
+        with self._lock:
+            if self._opened_at is not None:
+                self._opened_at = time.time()
+                self._trial = False
+                return True
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.time()
+                return True
+            return False
+
+
+class CacheCircuitBreaker(CircuitBreaker):
+    """
+    CircuitBreaker keeping its state in a Django cache so every process using it opens and closes together,
+    cache.add makes sure a single process runs the half-open trial call
+    """
+
+    def __init__(self, cache, key, failure_threshold, reset_timeout):
+        super(CacheCircuitBreaker, self).__init__(failure_threshold, reset_timeout)
+        self.cache = cache
+        self.failures_key = '{}:failures'.format(key)
+        self.opened_key = '{}:opened'.format(key)
+        self.trial_key = '{}:trial'.format(key)
+
+    @property
+    def state(self):
+        opened_at = self.cache.get(self.opened_key)
+        if opened_at is None:
+            return self.CLOSED
+        if time.time() >= opened_at + self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def retry_after(self):
+        opened_at = self.cache.get(self.opened_key)
+        if opened_at is None:
+            return None
+        retry_after = opened_at + self.reset_timeout - time.time()
+        return retry_after if retry_after > 0 else None
+
+    def before_call(self):
+        opened_at = self.cache.get(self.opened_key)
+        if opened_at is None:
+            return None
+        retry_after = opened_at + self.reset_timeout - time.time()
+        if retry_after > 0:
+            return retry_after
+        # the trial key expires in case the process running the trial call dies
+        if not self.cache.add(self.trial_key, 1, timeout=self.reset_timeout):
+            return self.reset_timeout
+        return None
+
+    def record_success(self):
+        self.cache.delete_many([self.failures_key, self.opened_key, self.trial_key])
+
+    def record_failure(self):
+        if self.cache.get(self.opened_key) is not None:
+            self.cache.set(self.opened_key, time.time(), timeout=None)
+            self.cache.delete(self.trial_key)
+            return True
+        self.cache.add(self.failures_key, 0, timeout=None)
+        if self.cache.incr(self.failures_key) >= self.failure_threshold:
+            self.cache.set(self.opened_key, time.time(), timeout=None)
+            self.cache.delete(self.failures_key)
+            return True
+        return False
+
+
+class EndpointGuard:
+    """
+    Rate limiter and circuit breaker of one account endpoint, either may be None when disabled
+    """
+
+    def __init__(self, endpoint, limiter=None, breaker=None, max_wait=0):
+        self.endpoint = endpoint
+        self.limiter = limiter
+        self.breaker = breaker
+        self.max_wait = max_wait
+
+    def before_call(self):
+        """
+        Raises EasypayCircuitOpenException or EasypayRateLimitException when the call must not be made
+        """
+        # fail fast while open, before waiting for a token, and only claim a half-open trial once holding one
+        if self.breaker is not None:
+            self._check_breaker(self.breaker.retry_after())
+        if self.limiter is not None and not self.limiter.acquire(self.max_wait):
+            self._reject_rate_limited()
+        if self.breaker is not None:
+            self._check_breaker(self.breaker.before_call())
+
+    async def before_call_async(self):
+        """
+        Same as before_call, waiting for a rate limit token without blocking the event loop
+        """
+        if self.breaker is not None:
+            self._check_breaker(self.breaker.retry_after())
+        if self.limiter is not None and not await self.limiter.acquire_async(self.max_wait):
+            self._reject_rate_limited()
+        if self.breaker is not None:
+            self._check_breaker(self.breaker.before_call())
+
+    def _reject_rate_limited(self):
+        get_metrics().increment('easypay_api_rejected_total', endpoint=self.endpoint, reason='rate_limit')
+        raise EasypayRateLimitException(self.endpoint)
+
+    def _check_breaker(self, retry_after):
+        if retry_after is not None:
+            get_metrics().increment('easypay_api_rejected_total', endpoint=self.endpoint, reason='circuit_open')
+            raise EasypayCircuitOpenException(self.endpoint, retry_after)
+
+    def record(self, status_code=None):
+        """
+        :param status_code: response status, None when the request failed without a response
+        """
+        if self.breaker is None:
+            return
+        if status_code is None or is_failure(status_code):
+            if self.breaker.record_failure():
+                get_metrics().increment('easypay_circuit_opened_total', endpoint=self.endpoint)
+        else:
+            self.breaker.record_success()
+
+
+def endpoint_options(endpoint):
+    """
+    :return: dict of the rate limit and circuit breaker options of endpoint, the EASYPAY_CIRCUIT_* settings
+             updated with EASYPAY_CIRCUIT_ENDPOINTS[endpoint]
+    """
+    options = {
+        'rate': settings.CIRCUIT_RATE_LIMIT,
+        'burst': settings.CIRCUIT_RATE_BURST,
+        'max_wait': settings.CIRCUIT_RATE_MAX_WAIT,
+        'failure_threshold': settings.CIRCUIT_FAILURE_THRESHOLD,
+        'reset_timeout': settings.CIRCUIT_RESET_TIMEOUT,
+    }
+    options.update(settings.CIRCUIT_ENDPOINTS.get(endpoint, {}))
+    return options
+
+
+def _build_guard(account_id, endpoint):
+    options = endpoint_options(endpoint)
+    cache = caches[settings.CIRCUIT_CACHE_ALIAS] if settings.CIRCUIT_CACHE_ALIAS else None
+
+    limiter = None
+    if options['rate']:
+        if cache is not None:
+            limiter = CacheRateLimiter(cache, CACHE_KEY.format(account_id, endpoint, 'rate'), options['rate'])
+        else:
+            limiter = TokenBucket(options['rate'], options['burst'] or max(1, options['rate']))
+
+    breaker = None
+    if options['failure_threshold']:
+        if cache is not None:
+            breaker = CacheCircuitBreaker(cache, CACHE_KEY.format(account_id, endpoint, 'breaker'),
+                                          options['failure_threshold'], options['reset_timeout'])
+        else:
+            breaker = CircuitBreaker(options['failure_threshold'], options['reset_timeout'])
+
+    if limiter is None and breaker is None:
+        return None
+    return EndpointGuard(endpoint, limiter, breaker, options['max_wait'])
+
+
+_guards = {}
+_guards_lock = threading.Lock()
+
+
+def get_guard(account_id, endpoint):
+    """
+    :param account_id: string Easypay AccountId, every account has its own limits
+    :param endpoint: endpoint name, see easypay.client.endpoint_name
+    :return: the process wide EndpointGuard of account_id and endpoint, None when both are disabled
+    """
+    key = (account_id, endpoint)
+    try:
+        return _guards[key]
+    except KeyError:
+        pass
+    with _guards_lock:
+        if key not in _guards:
+            _guards[key] = _build_guard(account_id, endpoint)
+        return _guards[key]
+
+
+@settings.on_change('CIRCUIT_RATE_LIMIT', 'CIRCUIT_RATE_BURST', 'CIRCUIT_RATE_MAX_WAIT', 'CIRCUIT_FAILURE_THRESHOLD',
+                    'CIRCUIT_RESET_TIMEOUT', 'CIRCUIT_ENDPOINTS', 'CIRCUIT_CACHE_ALIAS')
+def _reset_guards():
+    with _guards_lock:
+        _guards.clear()
@@ -0,0 +1,266 @@
+from collections import OrderedDict
+import threading
+
+from django.utils.module_loading import import_string
+
+from . import settings
+from .circuit import get_guard
+from .metrics import get_metrics
+
+
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+RETRY_STATUS_CODES = frozenset([502, 503, 504])
+
+
+def endpoint_name(path):
+    """
+    :return: path without resource ids, used as metrics label, e.g. 'single/<uuid>' -> 'single'
+    """
+    return path.strip('/').split('/', 1)[0]
+
+
+def _build_retry(total, backoff_factor):
+    """
+    Builds a urllib3 Retry that only retries idempotent verbs, POSTs are never retried
+    :param total: maximum number of retries
+    :param backoff_factor: sleeps {backoff factor} * (2 ** ({number of retries} - 1)) between retries
+    :return: Retry
+    """
+    from urllib3.util.retry import Retry
+
+    kwargs = dict(total=total, connect=total, read=total, status=total, backoff_factor=backoff_factor,
+                  status_forcelist=RETRY_STATUS_CODES, raise_on_status=False)
+    try:
+        return Retry(allowed_methods=IDEMPOTENT_METHODS, **kwargs)
+    except TypeError:  # urllib3 < 1.26
+        return Retry(method_whitelist=IDEMPOTENT_METHODS, **kwargs)
+
+
+class EasypayClient:
+    """
+    HTTP client for the Easypay API, owns a keep-alive requests Session with a connection pool
+    so consecutive calls reuse TCP/TLS connections. requests is only imported when the first client is built.
+    """
+
+    def __init__(self, account_id=None, api_key=None, backend_url=None, pool_connections=None, pool_maxsize=None,
+                 connect_timeout=None, read_timeout=None, max_retries=None, retry_backoff_factor=None):
+        """
+        Initialise EasypayClient, arguments not given default to the EASYPAY_* settings
+        :param account_id: string Easypay AccountId
+        :param api_key: string Easypay ApiKey
+        :param backend_url: string Easypay API base url
+        :param pool_connections: number of connection pools to cache
+        :param pool_maxsize: maximum number of connections kept alive per pool
+        :param connect_timeout: seconds to wait for a connection
+        :param read_timeout: seconds to wait for a response
+        :param max_retries: retries for idempotent verbs on connection errors and 502/503/504
+        :param retry_backoff_factor: backoff factor between retries
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.account_id = account_id if account_id is not None else settings.ACCOUNT_ID
+        self.api_key = api_key if api_key is not None else settings.API_KEY
+        self.backend_url = (backend_url or settings.BACKEND_URL).rstrip('/')
+        self.timeout = (
+            connect_timeout if connect_timeout is not None else settings.CONNECT_TIMEOUT,
+            read_timeout if read_timeout is not None else settings.READ_TIMEOUT,
+        )
+
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections or settings.POOL_CONNECTIONS,
+            pool_maxsize=pool_maxsize or settings.POOL_MAXSIZE,
+            max_retries=_build_retry(
+                max_retries if max_retries is not None else settings.MAX_RETRIES,
+                retry_backoff_factor if retry_backoff_factor is not None else settings.RETRY_BACKOFF_FACTOR,
+            ),
+        )
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update(self.auth_headers)
+
+    @property
+    def auth_headers(self):
+        return {
+            'AccountId': self.account_id,
+            'ApiKey': self.api_key,
+        }
+
+    def url(self, path):
+        return '{}/{}'.format(self.backend_url, path.lstrip('/'))
+
+    def request(self, method, path, **kwargs):
+        """
+        Sends a request through the endpoint rate limiter and circuit breaker, see EASYPAY_CIRCUIT_*
+        Raises EasypayCircuitOpenException or EasypayRateLimitException without calling the API
+        :return: requests Response
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        endpoint = endpoint_name(path)
+        guard = get_guard(self.account_id, endpoint)
+        if guard is not None:
+            guard.before_call()
+        with get_metrics().timer('easypay_api_request_seconds', method=method, endpoint=endpoint) as labels:
+            labels['status'] = 'error'
+            try:
+                response = self.session.request(method, self.url(path), **kwargs)
+            except Exception:
+                if guard is not None:
+                    guard.record()
+                raise
+            if guard is not None:
+                guard.record(response.status_code)
+            labels['status'] = response.status_code
+            return response
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, data=None, **kwargs):
+        return self.request('POST', path, data=data, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+def check_auth_params():
+    if not (settings.ACCOUNT_ID and isinstance(settings.ACCOUNT_ID, str)):
+        raise ValueError('EASYPAY_ACCOUNT_ID setting is invalid.')
+    if not (settings.API_KEY and isinstance(settings.API_KEY, str)):
+        raise ValueError('API_KEY setting is invalid.')
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client():
+    """
+    Returns the process wide EasypayClient built from settings, creating it on first use.
+    The credentials are validated once, when the client is built
+    :return: EasypayClient
+    """
+    global _default_client
+    if _default_client is None:
+        with _default_client_lock:
+            if _default_client is None:
+                check_auth_params()
+                _default_client = EasypayClient()
+    return _default_client
+
+
+def close_default_client():
+    """
+    Closes the process wide EasypayClient, the next call to get_default_client() builds a new one
+    :return:
+    """
+    global _default_client
+    with _default_client_lock:
+        client, _default_client = _default_client, None
+    if client is not None:
+        client.close()
+
+
+def account_credentials(account_id):
+    """
+    Looks up the credentials of a merchant account in EASYPAY_ACCOUNTS, then with EASYPAY_ACCOUNT_LOADER
+    :param account_id: string Easypay AccountId
+    :return: dict of EasypayClient arguments
+    """
+    credentials = settings.ACCOUNTS.get(account_id)
+    if credentials is None and settings.ACCOUNT_LOADER:
+        credentials = import_string(settings.ACCOUNT_LOADER)(account_id)
+    if credentials is None:
+        raise ValueError('No Easypay credentials for account [{}].'.format(account_id))
+    if isinstance(credentials, str):
+        credentials = {'api_key': credentials}
+    credentials = dict(credentials, account_id=account_id)
+    if not (credentials.get('api_key') and isinstance(credentials['api_key'], str)):
+        raise ValueError('Easypay ApiKey of account [{}] is invalid.'.format(account_id))
+    return credentials
+
+
+class ClientRegistry:
+    """
+    EasypayClients of many merchant accounts, each with its own connection pool. Clients are built, and their
+    credentials validated, on first use and the least recently used one is closed once there are more than maxsize
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, account_id):
+        """
+        :param account_id: string Easypay AccountId
+        :return: EasypayClient
+        """
+        with self._lock:
+            client = self._clients.get(account_id)
+            if client is not None:
+                self._clients.move_to_end(account_id)
+                return client
+
+        credentials = account_credentials(account_id)
+        with self._lock:
+            client = self._clients.get(account_id)
+            if client is None:
+                client = self._clients[account_id] = EasypayClient(**credentials)
+            self._clients.move_to_end(account_id)
+            evicted = [self._clients.popitem(last=False)[1] for _ in range(len(self._clients) - self.maxsize)]
+        for evicted_client in evicted:
+            evicted_client.close()  # requests in flight finish, their connections are not reused
+        return client
+
+    def clear(self):
+        with self._lock:
+            clients, self._clients = list(self._clients.values()), OrderedDict()
+        for client in clients:
+            client.close()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """
+    :return: the process wide ClientRegistry, holding up to EASYPAY_ACCOUNT_CLIENTS_MAXSIZE clients
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ClientRegistry(settings.ACCOUNT_CLIENTS_MAXSIZE)
+    return _registry
+
+
+def get_client(account=None):
+    """
+    :param account: string Easypay AccountId of a merchant, None or EASYPAY_ACCOUNT_ID for the default client
+    :return: EasypayClient
+    """
+    if account is None or account == settings.ACCOUNT_ID:
+        return get_default_client()
+    return get_registry().get(account)
+
+
+@settings.on_change('BACKEND_URL', 'ACCOUNT_ID', 'API_KEY', 'POOL_CONNECTIONS', 'POOL_MAXSIZE', 'CONNECT_TIMEOUT',
+                    'READ_TIMEOUT', 'MAX_RETRIES', 'RETRY_BACKOFF_FACTOR')
+def _reset_default_client():
+    close_default_client()
+
+
+@settings.on_change('ACCOUNTS', 'ACCOUNT_LOADER', 'ACCOUNT_CLIENTS_MAXSIZE', 'BACKEND_URL', 'POOL_CONNECTIONS',
+                    'POOL_MAXSIZE', 'CONNECT_TIMEOUT', 'READ_TIMEOUT', 'MAX_RETRIES', 'RETRY_BACKOFF_FACTOR')
+def _reset_registry():
+    global _registry
+    with _registry_lock:
+        registry, _registry = _registry, None
+    if registry is not None:
+        registry.clear()
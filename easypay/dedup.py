@@ -0,0 +1,144 @@
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+import logging
+import threading
+
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import settings
+from .api import GenericNotification, TransactionNotification
+from .metrics import get_metrics
+from .models import ProcessedNotification
+
+log = logging.getLogger(__name__)
+
+CACHE_KEY = 'easypay:notification:{}:{}:{}'
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def notification_key(notification):
+    """
+    :param notification: GenericNotification or TransactionNotification
+    :return: tuple of notification id, type and status identifying a notification across retries
+    """
+    if isinstance(notification, GenericNotification):
+        return notification.id, notification.type.value, notification.status.value
+    if isinstance(notification, TransactionNotification):
+        # a payment gets one transaction notification per transaction (authorisation, capture...)
+        transaction_ = notification.transaction
+        return transaction_.id or notification.id, 'transaction_{}'.format(transaction_.transaction_type or ''), ''
+    raise TypeError('Unsupported notification {!r}'.format(notification))
+
+
+def _get_cache():
+    if settings.NOTIFICATION_DEDUP_CACHE_ALIAS:
+        return caches[settings.NOTIFICATION_DEDUP_CACHE_ALIAS]
+    return None
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+    get_metrics().increment('easypay_notification_dedup_total', result=name)
+
+
+def register_notification(notification):
+    """
+    Records notification as processed
+    :param notification: GenericNotification or TransactionNotification
+    :return: False if it was already processed, True otherwise (or when EASYPAY_NOTIFICATION_DEDUP is disabled)
+    """
+    if not settings.NOTIFICATION_DEDUP:
+        return True
+
+    key = notification_key(notification)
+    cache_key = CACHE_KEY.format(*key)
+    cache = _get_cache()
+    if cache is not None and cache.get(cache_key):
+        _count('hits')
+        log.info('Skipping duplicate notification %s (cache).', key)
+        return False
+
+    try:
+        with transaction.atomic():
+            ProcessedNotification.objects.create(notification_id=key[0], notification_type=key[1], status=key[2])
+    except IntegrityError:
+        _count('hits')
+        log.info('Skipping duplicate notification %s.', key)
+        duplicate = True
+    else:
+        _count('misses')
+        duplicate = False
+
+    if cache is not None:
+        cache.set(cache_key, 1, settings.NOTIFICATION_DEDUP_RETENTION_DAYS * 24 * 60 * 60)
+    return not duplicate
+
+
+def forget_notification(notification):
+    """
+    Removes notification from the processed ones, so a retry after a processing failure isn't skipped
+    :param notification: GenericNotification or TransactionNotification
+    :return:
+    """
+    if not settings.NOTIFICATION_DEDUP:
+        return
+
+    key = notification_key(notification)
+    ProcessedNotification.objects.filter(notification_id=key[0], notification_type=key[1], status=key[2]).delete()
+    cache = _get_cache()
+    if cache is not None:
+        cache.delete(CACHE_KEY.format(*key))
+
+
+@contextmanager
+def process_once(notification):
+    """
+    Registers notification as processed around its processing, yields False for a duplicate that must be skipped.
+    When the with block raises the notification is forgotten, so Easypay's retry or the queue's next attempt is
+    not skipped as a duplicate
+        with process_once(notification) as first:
+            if first:
+                ...
+    :param notification: GenericNotification or TransactionNotification
+    """
+    if not register_notification(notification):
+        yield False
+        return
+    try:
+        yield True
+    except BaseException:
+        forget_notification(notification)
+        raise
+
+
+def purge_notifications(days=None, batch_size=1000):
+    """
+    Deletes processed notifications older than days, in batches
+    :param days: defaults to EASYPAY_NOTIFICATION_DEDUP_RETENTION_DAYS
+    :param batch_size: rows deleted per query
+    :return: number of deleted rows
+    """
+    if days is None:
+        days = settings.NOTIFICATION_DEDUP_RETENTION_DAYS
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted = 0
+    while True:
+        pks = list(ProcessedNotification.objects.filter(created_at__lt=cutoff)
+                   .values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        deleted += ProcessedNotification.objects.filter(pk__in=pks).delete()[0]
+
+
+def dedup_stats():
+    """
+    :return: dict with this process' duplicate (hits) and first time (misses) notification counts
+    """
+    with _stats_lock:
+        return {'hits': _stats['hits'], 'misses': _stats['misses']}
@@ -0,0 +1,271 @@
+import asyncio
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+import time
+
+import django
+from django.db import close_old_connections
+
+from . import settings, signals
+from .metrics import get_metrics, send_signal
+
+log = logging.getLogger(__name__)
+
+
+def _receiver_name(receiver):
+    return getattr(receiver, '__qualname__', None) or repr(receiver)
+
+
+def _signal_name(signal):
+    for name in signals.__all__:
+        if getattr(signals, name) is signal:
+            return name
+    return repr(signal)
+
+
+def _live_receivers(signal, sender):
+    """
+    :return: list of the receivers of signal for sender. Django has no public API listing them, so this uses
+             Signal._live_receivers, which returns the sync and async receivers apart since Django 5.0
+    """
+    if not signal.has_listeners(sender):
+        return []
+    if django.VERSION >= (5, 0):
+        sync_receivers, async_receivers = signal._live_receivers(sender)
+        return list(sync_receivers) + list(async_receivers)
+    return list(signal._live_receivers(sender))
+
+
+class Dispatcher:
+    """
+    Runs signal receivers off the request thread: sync receivers on a thread pool, coroutine receivers on a
+    dedicated event loop, each one observed as easypay_signal_receiver_seconds and bounded by timeout.
+    Coroutines are cancelled at the timeout. Threads can't be interrupted: a sync receiver running over it is
+    only logged and keeps its pool thread until it returns, so sync receivers must bound their own I/O (e.g.
+    request timeouts) or a few hung ones exhaust the EASYPAY_SIGNAL_DISPATCH_WORKERS pool
+    """
+
+    def __init__(self, workers, timeout=None):
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='easypay-signal')
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    @property
+    def loop(self):
+        if self._loop is None:
+            with self._loop_lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name='easypay-signal-loop', daemon=True).start()
+                    self._loop = loop
+        return self._loop
+
+    def send(self, signal, name, sender, **kwargs):
+        for receiver in _live_receivers(signal, sender):
+            self.call(receiver, name, signal=signal, sender=sender, **kwargs)
+
+    def call(self, receiver, name, **kwargs):
+        if asyncio.iscoroutinefunction(receiver):
+            asyncio.run_coroutine_threadsafe(self._call_async(receiver, name, kwargs), self.loop)
+        else:
+            self.executor.submit(self._call_sync, receiver, name, kwargs)
+
+    def call_now(self, receiver, name, **kwargs):
+        """
+        Calls receiver on the calling thread, coroutine receivers on a new event loop
+        """
+        if asyncio.iscoroutinefunction(receiver):
+            asyncio.run(self._call_async(receiver, name, kwargs))
+        else:
+            self._call_sync(receiver, name, kwargs)
+
+    def _call_sync(self, receiver, name, kwargs):
+        receiver_name = _receiver_name(receiver)
+        start = time.perf_counter()
+        try:
+            with get_metrics().timer('easypay_signal_receiver_seconds', signal=name, receiver=receiver_name):
+                receiver(**kwargs)
+        except Exception as e:
+            log.error('Receiver %s of %s signal failed, error: %s.', receiver_name, name, e, exc_info=True)
+        finally:
+            close_old_connections()
+        elapsed = time.perf_counter() - start
+        if self.timeout and elapsed > self.timeout:
+            log.warning('Receiver %s of %s signal took %.3fs, over the %ss timeout.',
+                        receiver_name, name, elapsed, self.timeout)
+
+    async def _call_async(self, receiver, name, kwargs):
+        receiver_name = _receiver_name(receiver)
+        try:
+            with get_metrics().timer('easypay_signal_receiver_seconds', signal=name, receiver=receiver_name):
+                await asyncio.wait_for(receiver(**kwargs), self.timeout)
+        except asyncio.TimeoutError:
+            log.warning('Receiver %s of %s signal cancelled after %ss.', receiver_name, name, self.timeout)
+        except Exception as e:
+            log.error('Receiver %s of %s signal failed, error: %s.', receiver_name, name, e, exc_info=True)
+
+
+class BatchBuffer:
+    """
+    Collects the signal keyword arguments for a batch receiver and delivers them as a list, on the Dispatcher,
+    once batch_size are buffered or interval seconds after the first one
+    """
+
+    def __init__(self, signal, name, receiver, batch_size, interval):
+        self.signal = signal
+        self.name = name
+        self.receiver = receiver
+        self.batch_size = batch_size
+        self.interval = interval
+        self._items = []
+        self._sender = None
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def add(self, sender, kwargs):
+        with self._lock:
+            self._items.append(kwargs)
+            self._sender = sender
+            if len(self._items) < self.batch_size:
+                if self._timer is None:
+                    self._timer = threading.Timer(self.interval, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+            sender, batch = self._take()
+        self._deliver(sender, batch)
+
+    def flush(self, sync=False):
+        """
+        Delivers the buffered items now
+        :param sync: call the receiver on this thread instead of the Dispatcher, e.g. once the pool is shut down
+        """
+        with self._lock:
+            sender, batch = self._take()
+        if batch:
+            self._deliver(sender, batch, sync)
+
+    def _take(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._items = self._items, []
+        return self._sender, batch
+
+    def _deliver(self, sender, batch, sync=False):
+        kwargs = dict(signal=self.signal, sender=sender, batch=batch,
+                      notifications=[item.get('notification') for item in batch])
+        if sync:
+            get_dispatcher().call_now(self.receiver, self.name, **kwargs)
+        else:
+            get_dispatcher().call(self.receiver, self.name, **kwargs)
+
+
+_batch_buffers = {}
+_batch_buffers_lock = threading.Lock()
+
+
+def connect_batch(signal, receiver, batch_size=None, interval=None):
+    """
+    Connects a receiver that gets the notifications of signal in groups, called as
+    receiver(signal=signal, sender=sender, notifications=[...], batch=[{signal keyword arguments}, ...]).
+    Only sends made through easypay.dispatch.send reach batch receivers
+    :param signal: one of the easypay.signals
+    :param receiver: callable or coroutine function
+    :param batch_size: defaults to EASYPAY_SIGNAL_BATCH_SIZE
+    :param interval: seconds before a partial batch is delivered, defaults to EASYPAY_SIGNAL_BATCH_INTERVAL
+    :return:
+    """
+    buffer = BatchBuffer(signal, _signal_name(signal), receiver,
+                         batch_size or settings.SIGNAL_BATCH_SIZE, interval or settings.SIGNAL_BATCH_INTERVAL)
+    with _batch_buffers_lock:
+        _batch_buffers.setdefault(signal, []).append(buffer)
+
+
+def disconnect_batch(signal, receiver):
+    """
+    Flushes and disconnects a batch receiver
+    :return: True if it was connected
+    """
+    with _batch_buffers_lock:
+        buffers = _batch_buffers.get(signal, [])
+        removed = [b for b in buffers if b.receiver == receiver]
+        _batch_buffers[signal] = [b for b in buffers if b.receiver != receiver]
+    for buffer in removed:
+        buffer.flush()
+    return bool(removed)
+
+
+def batch_receiver(signal, **options):
+    """
+    Decorator connecting a batch receiver, see connect_batch
+        @batch_receiver(signals.transaction_notification, batch_size=50)
+        def sync_erp(sender, notifications, **kwargs):
+            ...
+    """
+    def decorator(receiver):
+        connect_batch(signal, receiver, **options)
+        return receiver
+    return decorator
+
+
+def flush_batches(sync=False):
+    """
+    Delivers all partially filled batches
+    :param sync: call the receivers on this thread and return once they are done
+    :return:
+    """
+    with _batch_buffers_lock:
+        buffers = [b for signal_buffers in _batch_buffers.values() for b in signal_buffers]
+    for buffer in buffers:
+        buffer.flush(sync)
+
+
+# the thread pools are shut down before atexit handlers run, so the last batches are delivered in place
+atexit.register(flush_batches, sync=True)
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """
+    :return: the process wide Dispatcher
+    """
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = Dispatcher(settings.SIGNAL_DISPATCH_WORKERS, settings.SIGNAL_RECEIVER_TIMEOUT)
+    return _dispatcher
+
+
+@settings.on_change('SIGNAL_DISPATCH_WORKERS', 'SIGNAL_RECEIVER_TIMEOUT')
+def _reset_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        dispatcher, _dispatcher = _dispatcher, None
+    if dispatcher is not None:
+        dispatcher.executor.shutdown(wait=False)  # lets receivers already submitted finish
+
+
+def send(signal, name, sender, **kwargs):
+    """
+    Sends one of the easypay signals according to EASYPAY_SIGNAL_DISPATCH and feeds its batch receivers
+    :param signal: django.dispatch.Signal
+    :param name: signal name, used in logs and metrics
+    :param sender: signal sender
+    :param kwargs: signal keyword arguments, e.g. notification
+    :return:
+    """
+    if settings.SIGNAL_DISPATCH == 'background':
+        get_dispatcher().send(signal, name, sender, **kwargs)
+    else:
+        send_signal(signal, name, sender=sender, **kwargs)
+
+    for buffer in _batch_buffers.get(signal, ()):
+        buffer.add(sender, kwargs)
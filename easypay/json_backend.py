@@ -0,0 +1,91 @@
+import json
+import threading
+
+from . import settings
+
+
+BACKENDS = ('orjson', 'ujson', 'json')
+
+
+class _StdlibBackend:
+    name = 'json'
+
+    @staticmethod
+    def dumps(obj):
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    loads = staticmethod(json.loads)
+
+
+class _OrjsonBackend:
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self.dumps = orjson.dumps
+        self.loads = orjson.loads
+
+
+class _UjsonBackend:
+    name = 'ujson'
+
+    def __init__(self):
+        import ujson
+        self._dumps = ujson.dumps
+        self.loads = ujson.loads
+
+    def dumps(self, obj):
+        return self._dumps(obj, ensure_ascii=False).encode('utf-8')
+
+
+def _load_backend(name):
+    if name == 'json':
+        return _StdlibBackend()
+    if name == 'orjson':
+        return _OrjsonBackend()
+    if name == 'ujson':
+        return _UjsonBackend()
+    if name == 'auto':
+        for candidate in BACKENDS:
+            try:
+                return _load_backend(candidate)
+            except ImportError:
+                continue
+    raise ValueError('EASYPAY_JSON_BACKEND must be one of {}.'.format(('auto',) + BACKENDS))
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """
+    :return: the EASYPAY_JSON_BACKEND implementation, with dumps returning bytes and loads accepting bytes or str
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _load_backend(settings.JSON_BACKEND)
+    return _backend
+
+
+@settings.on_change('JSON_BACKEND')
+def _reset_backend():
+    global _backend
+    _backend = None
+
+
+def dumps(obj):
+    """
+    :return: obj encoded as UTF-8 JSON bytes
+    """
+    return get_backend().dumps(obj)
+
+
+def loads(data):
+    """
+    :param data: JSON bytes or str
+    :return: decoded object
+    """
+    return get_backend().loads(data)
@@ -0,0 +1,82 @@
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+
+from ... import settings
+from ...api import MethodStatus
+from ...transaction import get_payments
+
+
+class Command(BaseCommand):
+    help = ('Marks pending Easypay payments (EASYPAY_PERSIST_TRANSACTIONS_CLASS) past their expiration_time as '
+            'expired, recently expired ones are confirmed with the API first')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of payments fetched from the database and marked per batch.')
+        parser.add_argument('--concurrency', type=int, default=settings.BULK_MAX_CONCURRENCY,
+                            help='Number of get_payment calls in flight.')
+        parser.add_argument('--confirm-window', type=int, default=settings.EXPIRY_CONFIRM_WINDOW,
+                            help='Payments that expired less than this many seconds ago are confirmed with the API, '
+                                 '0 marks every expired payment without asking.')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        if not settings.PERSIST_TRANSACTIONS_CLASS:
+            raise CommandError('EASYPAY_PERSIST_TRANSACTIONS_CLASS setting is not set.')
+        PaymentModel = apps.get_model(settings.PERSIST_TRANSACTIONS_CLASS)
+
+        now = timezone.now()
+        confirm_after = now - timedelta(seconds=options['confirm_window'])
+        queryset = PaymentModel.objects.filter(
+            status=MethodStatus.PENDING.value, expiration_time__lt=now,
+        ).order_by('expiration_time', 'pk').only('pk', 'easypay_id', 'expiration_time')
+
+        batch_size = options['batch_size']
+        totals = {'expired': 0, 'updated': 0, 'failed': 0}
+        chunk = queryset
+        while True:
+            # each chunk is read in full before its rows are updated, the next one starts after its last row,
+            # payments left pending by a failed API call are not read again
+            batch = list(chunk[:batch_size])
+            if not batch:
+                break
+            self.expire(PaymentModel, batch, confirm_after, options['concurrency'], totals)
+            last = batch[-1]
+            chunk = queryset.filter(Q(expiration_time__gt=last.expiration_time) |
+                                    Q(expiration_time=last.expiration_time, pk__gt=last.pk))
+
+        self.stdout.write(self.style.SUCCESS(
+            'Marked {expired} payments as expired, updated {updated} from the API, {failed} failed.'.format(**totals)))
+
+    def expire(self, PaymentModel, batch, confirm_after, concurrency, totals):
+        to_confirm = [p for p in batch if p.expiration_time >= confirm_after]
+        statuses = {p.pk: MethodStatus.EXPIRED.value for p in batch if p.expiration_time < confirm_after}
+
+        for payment_record, payment_response in zip(
+                to_confirm, get_payments([p.easypay_id for p in to_confirm], max_concurrency=concurrency)):
+            if isinstance(payment_response, Exception):
+                totals['failed'] += 1
+                self.stderr.write('Failed to get payment with id [{}]: {}'.format(
+                    payment_record.easypay_id, payment_response))
+            elif payment_response.method.status == MethodStatus.PENDING.value:
+                statuses[payment_record.pk] = MethodStatus.EXPIRED.value
+            else:
+                statuses[payment_record.pk] = payment_response.method.status
+
+        by_status = {}
+        for pk, status in statuses.items():
+            by_status.setdefault(status, []).append(pk)
+        now = timezone.now()
+        for status, pks in by_status.items():
+            # only rows still pending, a notification may have updated them since they were read
+            updated = PaymentModel.objects.filter(pk__in=pks, status=MethodStatus.PENDING.value).update(
+                status=status, updated_at=now)
+            totals['expired' if status == MethodStatus.EXPIRED.value else 'updated'] += updated
+
+        if self.verbosity > 1:
+            self.stdout.write('Checked {} payments up to expiration time {}, confirmed {} with the API.'.format(
+                len(batch), batch[-1].expiration_time, len(to_confirm)))
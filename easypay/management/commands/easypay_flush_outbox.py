@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import settings
+from ...outbox import flush_outbox
+
+
+class Command(BaseCommand):
+    help = ('Saves the Easypay payments left in the outbox (EASYPAY_PAYMENT_OUTBOX) in batches and marks the ones '
+            'never answered as unresolved')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.PAYMENT_OUTBOX_BATCH_SIZE,
+                            help='Number of payments saved per batch.')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling the outbox instead of exiting once it is flushed.')
+        parser.add_argument('--sleep', type=float, default=10.0,
+                            help='Seconds to wait before polling a flushed outbox again, used with --loop.')
+
+    def handle(self, *args, **options):
+        if not settings.PERSIST_TRANSACTIONS_CLASS:
+            raise CommandError('EASYPAY_PERSIST_TRANSACTIONS_CLASS setting is not set.')
+
+        total_saved = total_failed = total_unresolved = 0
+        while True:
+            saved, failed, unresolved = flush_outbox(options['batch_size'])
+            total_saved += saved
+            total_failed += failed
+            total_unresolved += unresolved
+            if saved or unresolved:
+                self.stdout.write('Saved {} payments, {} failed, {} marked unresolved.'.format(
+                    saved, failed, unresolved))
+            elif options['loop']:
+                time.sleep(options['sleep'])
+            else:
+                break
+
+        self.stdout.write(self.style.SUCCESS('Done, saved {} payments, {} failed, {} marked unresolved.'.format(
+            total_saved, total_failed, total_unresolved)))
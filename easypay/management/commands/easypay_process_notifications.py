@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ... import settings
+from ...dispatch import flush_batches
+from ...notification_queue import process_notifications
+
+
+class Command(BaseCommand):
+    help = 'Processes Easypay notifications stored in the queue (EASYPAY_NOTIFICATION_QUEUE)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.NOTIFICATION_QUEUE_BATCH_SIZE,
+                            help='Number of notifications claimed per batch.')
+        parser.add_argument('--concurrency', type=int, default=settings.NOTIFICATION_QUEUE_CONCURRENCY,
+                            help='Number of notifications processed in parallel.')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling the queue instead of exiting once it is drained.')
+        parser.add_argument('--sleep', type=float, default=1.0,
+                            help='Seconds to wait before polling an empty queue again, used with --loop.')
+
+    def handle(self, *args, **options):
+        total_processed = total_failed = 0
+        try:
+            while True:
+                processed, failed = process_notifications(options['batch_size'], options['concurrency'])
+                total_processed += processed
+                total_failed += failed
+                if processed or failed:
+                    self.stdout.write('Processed {} notifications, {} failed.'.format(processed, failed))
+                elif options['loop']:
+                    time.sleep(options['sleep'])
+                else:
+                    break
+        finally:
+            # deliver the partial batches of batch receivers before exiting
+            flush_batches(sync=True)
+
+        self.stdout.write(self.style.SUCCESS(
+            'Done, processed {} notifications, {} failed.'.format(total_processed, total_failed)))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from ... import settings
+from ...dedup import purge_notifications
+
+
+class Command(BaseCommand):
+    help = 'Deletes processed notification records used to skip duplicate Easypay notifications'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.NOTIFICATION_DEDUP_RETENTION_DAYS,
+                            help='Delete records older than this many days.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of records deleted per query.')
+
+    def handle(self, *args, **options):
+        deleted = purge_notifications(options['days'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('Deleted {} processed notifications.'.format(deleted)))
@@ -0,0 +1,100 @@
+import json
+import os
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ... import settings
+from ...api import MethodStatus
+from ...transaction import get_payments
+
+
+class Command(BaseCommand):
+    help = 'Refreshes the status of persisted Easypay payments (EASYPAY_PERSIST_TRANSACTIONS_CLASS) from the API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', action='append', dest='statuses',
+                            help='Status of the payments to reconcile, can be repeated. Defaults to pending.')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Number of payments fetched from the database and refreshed per batch.')
+        parser.add_argument('--concurrency', type=int, default=settings.BULK_MAX_CONCURRENCY,
+                            help='Number of get_payment calls in flight.')
+        parser.add_argument('--checkpoint',
+                            help='File storing the last reconciled primary key, an interrupted sweep resumes from it. '
+                                 'Removed once a sweep completes.')
+        parser.add_argument('--reset', action='store_true',
+                            help='Ignore the checkpoint and start from the first payment.')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        if not settings.PERSIST_TRANSACTIONS_CLASS:
+            raise CommandError('EASYPAY_PERSIST_TRANSACTIONS_CLASS setting is not set.')
+        PaymentModel = apps.get_model(settings.PERSIST_TRANSACTIONS_CLASS)
+
+        checkpoint = options['checkpoint']
+        last_pk = None if options['reset'] else self.read_checkpoint(checkpoint)
+
+        queryset = PaymentModel.objects.filter(
+            status__in=options['statuses'] or [MethodStatus.PENDING.value],
+        ).order_by('pk').only('pk', 'easypay_id', 'status')
+
+        chunk_size = options['chunk_size']
+        totals = {'checked': 0, 'updated': 0, 'failed': 0}
+        while True:
+            # each chunk is read in full before its rows are updated, writing to the table under an open cursor may
+            # skip or re-read rows (SQLite), and reading past the last primary key never sees a row twice
+            chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            batch = list(chunk[:chunk_size])
+            if not batch:
+                break
+            self.reconcile(PaymentModel, batch, options['concurrency'], totals)
+            last_pk = batch[-1].pk
+            self.write_checkpoint(checkpoint, last_pk)
+        # the sweep is complete, the next run starts from the first payment again
+        self.clear_checkpoint(checkpoint)
+
+        self.stdout.write(self.style.SUCCESS(
+            'Checked {checked} payments, updated {updated}, {failed} failed.'.format(**totals)))
+
+    def reconcile(self, PaymentModel, batch, concurrency, totals):
+        now = timezone.now()
+        changed = []
+        for payment_record, payment_response in zip(
+                batch, get_payments([p.easypay_id for p in batch], max_concurrency=concurrency)):
+            if isinstance(payment_response, Exception):
+                totals['failed'] += 1
+                self.stderr.write('Failed to get payment with id [{}]: {}'.format(
+                    payment_record.easypay_id, payment_response))
+            elif payment_response.method.status != payment_record.status:
+                payment_record.status = payment_response.method.status
+                payment_record.updated_at = now
+                changed.append(payment_record)
+
+        PaymentModel.objects.bulk_update(changed, ['status', 'updated_at'])
+        totals['checked'] += len(batch)
+        totals['updated'] += len(changed)
+        if self.verbosity > 1:
+            self.stdout.write('Checked {} payments up to pk {}, updated {}.'.format(
+                len(batch), batch[-1].pk, len(changed)))
+
+    @staticmethod
+    def read_checkpoint(path):
+        if not path or not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f).get('last_pk')
+
+    @staticmethod
+    def clear_checkpoint(path):
+        if path and os.path.exists(path):
+            os.remove(path)
+
+    @staticmethod
+    def write_checkpoint(path, last_pk):
+        if not path:
+            return
+        tmp_path = '{}.tmp'.format(path)
+        with open(tmp_path, 'w') as f:
+            json.dump({'last_pk': last_pk}, f)
+        os.replace(tmp_path, path)
@@ -0,0 +1,309 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import json
+import random
+import threading
+import time
+from urllib.parse import urlencode
+from uuid import uuid4
+
+from django.apps import apps
+from django.conf import settings as django_settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.urls import reverse
+from django.utils import timezone
+
+from ... import settings
+from ...metrics import percentile
+from ...transaction import get_payments
+
+
+KINDS = ('generic', 'transaction', 'mbway', 'authorisation')
+
+
+def generic_body(payment_id, i):
+    return {'id': payment_id, 'key': 'replay', 'type': 'capture', 'status': 'success',
+            'messages': ['Your request was successfully completed'],
+            'date': (timezone.now() + timedelta(seconds=i)).strftime('%Y-%m-%d %H:%M:%S')}
+
+
+def transaction_body(payment_id, i):
+    return {'id': payment_id, 'value': 10, 'currency': 'EUR', 'key': 'replay', 'method': 'mb',
+            'customer': {'id': str(uuid4())},
+            'transaction': {'id': str(uuid4()), 'key': 'replay', 'type': 'capture',
+                            'date': (timezone.now() + timedelta(seconds=i)).strftime('%Y-%m-%d %H:%M:%S'),
+                            'values': {'requested': 10, 'paid': 10}},
+            'account': {'id': settings.ACCOUNT_ID}}
+
+
+def mbway_body(payment_id, i):
+    return {'Cin': str(i), 'Entity': '21098', 'Key': 'replay', 'Reference': payment_id, 'Status': 'success',
+            'StatusMessage': 'ok', 'Type': 'mbway'}
+
+
+GENERATORS = {
+    'generic': generic_body,
+    'transaction': transaction_body,
+    'mbway': mbway_body,
+}
+
+VIEWS = {
+    'generic': ('generic_notification', 'NOTIFICATION_CODE_GENERIC'),
+    'transaction': ('transaction_notification', 'NOTIFICATION_CODE_TRANSACTION'),
+    'mbway': ('mbway_notification', None),
+    'authorisation': ('authorisation_notification', 'NOTIFICATION_CODE_AUTHORISATION'),
+}
+
+
+class Command(BaseCommand):
+    help = ('Replays recorded or synthetic Easypay notifications against the webhook views, in-process or over '
+            'HTTP, and reports throughput, errors and latency percentiles')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--input',
+                            help='JSON lines file of recorded notifications, {{"kind": "transaction", "body": {{...}}}} '
+                                 'or a bare body of --kind. Kinds: {}.'.format(', '.join(KINDS)))
+        parser.add_argument('--kind', choices=KINDS, default='transaction',
+                            help='Kind of the --input lines without one.')
+        parser.add_argument('--synthetic', action='append', choices=sorted(GENERATORS),
+                            help='Generate notifications of this kind, can be repeated.')
+        parser.add_argument('--count', type=int, default=1000,
+                            help='Number of synthetic notifications.')
+        parser.add_argument('--payments', type=int, default=50,
+                            help='Number of payments the synthetic notifications refer to, the latest persisted '
+                                 'payments (EASYPAY_PERSIST_TRANSACTIONS_CLASS) or random ids.')
+        parser.add_argument('--duplicates', type=float, default=0.0,
+                            help='Fraction of notifications delivered a second time, like Easypay retries.')
+        parser.add_argument('--shuffle', action='store_true',
+                            help='Deliver the notifications out of order.')
+        parser.add_argument('--url',
+                            help='Send over HTTP to this server, e.g. http://127.0.0.1:8000, instead of in-process.')
+        parser.add_argument('--rate', type=float, default=0,
+                            help='Notifications sent per second, 0 sends as fast as possible.')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Number of notifications in flight.')
+        parser.add_argument('--seed', type=int,
+                            help='Random seed, for repeatable duplicates and ordering.')
+        parser.add_argument('--check', action='store_true',
+                            help='After the replay, compare the persisted status of the payments notified by '
+                                 'transaction notifications with get_payment.')
+        parser.add_argument('--json', action='store_true',
+                            help='Print the report as JSON.')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        if options['input']:
+            deliveries = self.read_input(options['input'], options['kind'])
+        elif options['synthetic']:
+            deliveries = self.generate(options['synthetic'], options['count'], options['payments'], rng)
+        else:
+            raise CommandError('Either --input or --synthetic is required.')
+
+        deliveries += [d for d in deliveries if rng.random() < options['duplicates']]
+        if options['shuffle']:
+            rng.shuffle(deliveries)
+
+        sender = self.http_sender(options['url']) if options['url'] else self.client_sender()
+        report = self.replay(deliveries, sender, options['rate'], options['concurrency'])
+
+        if options['check']:
+            report['check'] = self.check_convergence(deliveries)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.write_report(report)
+
+    @staticmethod
+    def read_input(path, default_kind):
+        deliveries = []
+        with open(path) as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    raise CommandError('{}:{}: {}'.format(path, line_number, e))
+                if 'body' in record and record.get('kind', default_kind) in KINDS:
+                    deliveries.append((record.get('kind', default_kind), record['body']))
+                else:
+                    deliveries.append((default_kind, record))
+        return deliveries
+
+    @staticmethod
+    def generate(kinds, count, payments, rng):
+        payment_ids = []
+        if settings.PERSIST_TRANSACTIONS_CLASS:
+            PaymentModel = apps.get_model(settings.PERSIST_TRANSACTIONS_CLASS)
+            payment_ids = list(PaymentModel.objects.order_by('-pk').values_list('easypay_id', flat=True)[:payments])
+        payment_ids += [str(uuid4()) for _ in range(payments - len(payment_ids))]
+        return [(kinds[i % len(kinds)], GENERATORS[kinds[i % len(kinds)]](rng.choice(payment_ids), i))
+                for i in range(count)]
+
+    @staticmethod
+    def encode(kind, body):
+        """
+        :return: tuple of the request body and content type of a notification
+        """
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        if isinstance(body, bytes):
+            content_type = 'application/x-www-form-urlencoded' if kind == 'mbway' else 'application/json'
+            return body, content_type
+        if kind == 'mbway':
+            return urlencode(body).encode('utf-8'), 'application/x-www-form-urlencoded'
+        return json.dumps(body).encode('utf-8'), 'application/json'
+
+    @staticmethod
+    def headers(kind):
+        code_setting = VIEWS[kind][1]
+        code = getattr(settings, code_setting) if code_setting else None
+        return {'X-Easypay-Code': code} if code else {}
+
+    @staticmethod
+    def client_host():
+        """
+        :return: Host of the in-process requests, the first ALLOWED_HOSTS entry that is not a wildcard, the test
+                 client's default testserver fails host validation outside the test runner
+        """
+        for host in django_settings.ALLOWED_HOSTS:
+            host = host.lstrip('.')
+            if host and '*' not in host:
+                return host
+        return 'localhost'
+
+    def client_sender(self):
+        from django.test import Client
+
+        local = threading.local()
+        host = self.client_host()
+
+        def send(kind, body):
+            if not hasattr(local, 'client'):
+                local.client = Client(HTTP_HOST=host, SERVER_NAME=host)
+            data, content_type = self.encode(kind, body)
+            extra = {'HTTP_' + k.upper().replace('-', '_'): v for k, v in self.headers(kind).items()}
+            try:
+                return local.client.post(reverse(VIEWS[kind][0]), data, content_type=content_type, **extra).status_code
+            finally:
+                close_old_connections()
+        return send
+
+    def http_sender(self, url):
+        import requests
+
+        local = threading.local()
+        base_url = url.rstrip('/')
+
+        def send(kind, body):
+            if not hasattr(local, 'session'):
+                local.session = requests.Session()
+            data, content_type = self.encode(kind, body)
+            headers = dict(self.headers(kind), **{'Content-Type': content_type})
+            return local.session.post(base_url + reverse(VIEWS[kind][0]), data=data, headers=headers,
+                                      timeout=settings.READ_TIMEOUT).status_code
+        return send
+
+    def replay(self, deliveries, send, rate, concurrency):
+        latencies = []
+        statuses = {}
+        errors = []
+        lock = threading.Lock()
+        started = time.perf_counter()
+
+        def deliver(item):
+            i, (kind, body) = item
+            if rate:
+                delay = started + i / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            start = time.perf_counter()
+            try:
+                status = send(kind, body)
+                error = None if 200 <= status < 300 else 'HTTP {}'.format(status)
+            except Exception as e:
+                status, error = 'exception', repr(e)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                if error:
+                    errors.append(error)
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            list(executor.map(deliver, enumerate(deliveries)))
+        wall = time.perf_counter() - started
+
+        latencies.sort()
+        return {
+            'notifications': len(deliveries),
+            'concurrency': concurrency,
+            'seconds': round(wall, 4),
+            'throughput': round(len(deliveries) / wall, 2) if wall else None,
+            'errors': len(errors),
+            'error_rate': round(len(errors) / len(deliveries), 4) if deliveries else 0.0,
+            'first_error': errors[0] if errors else None,
+            'statuses': statuses,
+            'latency_ms': {name: round(percentile(latencies, fraction) * 1000, 3) if latencies else None
+                           for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1.0))},
+        }
+
+    def check_convergence(self, deliveries):
+        """
+        Compares the persisted status of every payment with a transaction notification in the replay with
+        get_payment, queued notifications (EASYPAY_NOTIFICATION_QUEUE) are processed first
+        :return: dict with the number of payments checked, converged, missing from the database and failed
+        """
+        if not settings.PERSIST_TRANSACTIONS_CLASS:
+            raise CommandError('--check requires the EASYPAY_PERSIST_TRANSACTIONS_CLASS setting.')
+        if settings.NOTIFICATION_QUEUE and not self.drain_queue():
+            self.stderr.write('Queued notifications failed, see easypay_process_notifications.')
+
+        payment_ids = sorted({body['id'] for kind, body in deliveries
+                              if kind == 'transaction' and isinstance(body, dict) and body.get('id')})
+        PaymentModel = apps.get_model(settings.PERSIST_TRANSACTIONS_CLASS)
+        persisted = dict(PaymentModel.objects.filter(easypay_id__in=payment_ids).values_list('easypay_id', 'status'))
+
+        result = {'payments': len(payment_ids), 'converged': 0, 'diverged': [], 'missing': 0, 'failed': 0}
+        checked = [id for id in payment_ids if id in persisted]
+        result['missing'] = len(payment_ids) - len(checked)
+        for id, payment_response in zip(checked, get_payments(checked)):
+            if isinstance(payment_response, Exception):
+                result['failed'] += 1
+            elif payment_response.method.status == persisted[id]:
+                result['converged'] += 1
+            else:
+                result['diverged'].append({'id': id, 'persisted': persisted[id],
+                                           'easypay': payment_response.method.status})
+        return result
+
+    @staticmethod
+    def drain_queue():
+        from ...notification_queue import process_notifications
+
+        while True:
+            processed, failed = process_notifications()
+            if failed:
+                return False
+            if not processed:
+                return True
+
+    def write_report(self, report):
+        self.stdout.write('Sent {notifications} notifications in {seconds}s, {throughput} notifications/s, '
+                          'concurrency {concurrency}.'.format(**report))
+        self.stdout.write('Latency ms: ' + ', '.join('{} {}'.format(k, v) for k, v in report['latency_ms'].items()))
+        self.stdout.write('Statuses: ' + ', '.join('{} x{}'.format(k, v) for k, v in sorted(report['statuses'].items())))
+        style = self.style.ERROR if report['errors'] else self.style.SUCCESS
+        self.stdout.write(style('Errors: {errors} ({error_rate:.2%}){}'.format(
+            ', first: {}'.format(report['first_error']) if report['first_error'] else '', **report)))
+
+        check = report.get('check')
+        if check is not None:
+            style = self.style.ERROR if check['diverged'] or check['failed'] else self.style.SUCCESS
+            self.stdout.write(style(
+                'Checked {payments} payments: {converged} converged, {diverged_count} diverged, '
+                '{missing} not persisted, {failed} failed.'.format(diverged_count=len(check['diverged']), **check)))
+            for diverged in check['diverged']:
+                self.stdout.write(' - {id}: persisted {persisted}, easypay {easypay}'.format(**diverged))
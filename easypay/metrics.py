@@ -0,0 +1,146 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+import math
+import threading
+import time
+
+from django.utils.module_loading import import_string
+
+from . import settings
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class NoOpMetrics:
+    """
+    Default EASYPAY_METRICS_BACKEND, discards everything. Backends implement increment and observe,
+    names are prefixed with 'easypay_' and labels are passed as keyword arguments
+    """
+
+    def increment(self, name, value=1, **labels):
+        pass
+
+    def observe(self, name, seconds, **labels):
+        pass
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Observes the duration of the with block, the yielded dict can be used to add labels known only at the end
+        """
+        extra_labels = {}
+        start = time.perf_counter()
+        try:
+            yield extra_labels
+        finally:
+            labels.update(extra_labels)
+            self.observe(name, time.perf_counter() - start, **labels)
+
+
+class PrometheusMetrics(NoOpMetrics):
+    """
+    In-process counters and histograms exported in the Prometheus text format by views.metrics
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def increment(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            histogram[0][bisect_left(self.buckets, seconds)] += 1
+            histogram[1] += seconds
+
+    def render(self):
+        """
+        :return: string with all metrics in the Prometheus text exposition format
+        """
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(counts), total)) for key, (counts, total) in self._histograms.items())
+
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE {} counter'.format(name))
+            lines.append('{}{} {}'.format(name, _format_labels(labels), value))
+        for (name, labels), (counts, total) in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE {} histogram'.format(name))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('{}_bucket{} {}'.format(name, _format_labels(labels + (('le', le),)), cumulative))
+            lines.append('{}_sum{} {}'.format(name, _format_labels(labels), total))
+            lines.append('{}_count{} {}'.format(name, _format_labels(labels), cumulative))
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, v.replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels) + '}'
+
+
+def percentile(sorted_values, fraction):
+    """
+    Nearest-rank percentile, used by the replay command and the benchmarks
+    :param sorted_values: list of numbers in ascending order
+    :param fraction: float between 0 and 1, e.g. 0.99 for p99
+    :return: the value at that rank, None for an empty list
+    """
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """
+    :return: the EASYPAY_METRICS_BACKEND instance
+    """
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = import_string(settings.METRICS_BACKEND)()
+    return _metrics
+
+
+@settings.on_change('METRICS_BACKEND')
+def _reset_metrics():
+    global _metrics
+    _metrics = None
+
+
+def send_signal(signal, name, **kwargs):
+    """
+    Sends signal observing the time its receivers take as easypay_signal_seconds{signal=name}
+    :return: signal.send result
+    """
+    with get_metrics().timer('easypay_signal_seconds', signal=name):
+        return signal.send(**kwargs)
@@ -0,0 +1,38 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:17
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedNotification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('generic', 'Generic'), ('transaction', 'Transaction')], max_length=20, verbose_name='Kind')),
+                ('body', models.BinaryField(verbose_name='Body')),
+                ('encoding', models.CharField(default='utf-8', max_length=40, verbose_name='Encoding')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('failed', 'Failed')], default='pending', max_length=20, verbose_name='Status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Attempts')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Next attempt at')),
+                ('last_error', models.TextField(blank=True, verbose_name='Last error')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'easypay queued notification',
+                'verbose_name_plural': 'easypay queued notifications',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='queuednotification',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='easypay_que_status_59b06f_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('easypay', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessedNotification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('notification_id', models.CharField(max_length=100, verbose_name='Notification ID')),
+                ('notification_type', models.CharField(max_length=100, verbose_name='Notification Type')),
+                ('status', models.CharField(blank=True, max_length=100, verbose_name='Status')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'easypay processed notification',
+                'verbose_name_plural': 'easypay processed notifications',
+                'unique_together': {('notification_id', 'notification_type', 'status')},
+            },
+        ),
+    ]
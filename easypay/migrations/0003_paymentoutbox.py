@@ -0,0 +1,41 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:49
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('easypay', '0002_processednotification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentOutbox',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('merchant_key', models.CharField(blank=True, max_length=100, verbose_name='Merchant Key')),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Amount')),
+                ('expiration_time', models.DateTimeField(blank=True, null=True, verbose_name='Expiration time')),
+                ('account_id', models.CharField(blank=True, max_length=100, verbose_name='Account ID')),
+                ('easypay_id', models.CharField(blank=True, max_length=100, verbose_name='Easypay ID')),
+                ('response', models.BinaryField(blank=True, null=True, verbose_name='Response')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('received', 'Received'), ('unresolved', 'Unresolved')], default='pending', max_length=20, verbose_name='Status')),
+                ('last_error', models.TextField(blank=True, verbose_name='Last error')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'easypay payment outbox entry',
+                'verbose_name_plural': 'easypay payment outbox',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='paymentoutbox',
+            index=models.Index(fields=['status', 'created_at'], name='easypay_pay_status_588a77_idx'),
+        ),
+    ]
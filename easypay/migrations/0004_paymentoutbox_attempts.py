@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('easypay', '0003_paymentoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentoutbox',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0, verbose_name='Failed attempts'),
+        ),
+        migrations.AddField(
+            model_name='paymentoutbox',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Next attempt at'),
+        ),
+    ]
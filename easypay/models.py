@@ -1,5 +1,6 @@
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
 from .api import MethodStatus, MethodType
@@ -17,6 +18,7 @@ class AbstractPayment(models.Model):
     status = models.CharField(_('Status'), max_length=100, choices=METHOD_STATUS_CHOICES)
     method_type = models.CharField(_('Method Type'), max_length=10, choices=METHOD_TYPE_CHOICES, blank=True)
     customer_id = models.CharField(_('Customer ID'), max_length=100, blank=True)
+    expiration_time = models.DateTimeField(_('Expiration time'), null=True, blank=True, db_index=True)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
                              related_name='easypay_payments')
 
@@ -35,19 +37,42 @@ class AbstractPayment(models.Model):
         """
         Updates an AbstractPayment record from payment_response
         :param payment_response:
-        :return:
+        :return: True if the record changed
+        """
+        return self.update_status(payment_response.method.status)
+
+    def update_status(self, status):
+        """
+        Updates an AbstractPayment record status, writing only the changed columns
+        :param status: string MethodStatus value
+        :return: True if the record changed
+        """
+        updated = self.__class__.update_status_by_easypay_id(self.easypay_id, status)
+        if updated:
+            self.status = status
+        return updated
+
+    @classmethod
+    def update_status_by_easypay_id(cls, easypay_id, status):
+        """
+        Updates the status of the record with easypay_id in a single conditional UPDATE, so duplicate
+        notifications never touch a row already on status
+        :param easypay_id: string <uuid>
+        :param status: string MethodStatus value
+        :return: True if the record changed
         """
-        self.status = payment_response.method.status
-        return self.save()
+        return cls.objects.filter(easypay_id=easypay_id).exclude(status=status).update(
+            status=status, updated_at=timezone.now()) > 0
 
     @classmethod
-    def create(cls, merchant_key, value, payment_response, user):
+    def create(cls, merchant_key, value, payment_response, user, expiration_time=None):
         """
         Creates an AbstractPayment record from payment_response
         :param merchant_key:
         :param value:
         :param payment_response:
         :param user:
+        :param expiration_time: datetime the payment expires at, for expirable methods (mbw, cc , dd)
         :return:
         """
         return cls(easypay_id=payment_response.id,
@@ -56,4 +81,105 @@ class AbstractPayment(models.Model):
                    status=payment_response.method.status,
                    method_type=payment_response.method.method_type.value,
                    customer_id=payment_response.customer_id,
+                   expiration_time=expiration_time,
                    user=user)
+
+
+class QueuedNotification(models.Model):
+    """
+    Raw Easypay notification waiting to be processed, see EASYPAY_NOTIFICATION_QUEUE
+    """
+    KIND_GENERIC = 'generic'
+    KIND_TRANSACTION = 'transaction'
+    KIND_CHOICES = [
+        (KIND_GENERIC, _('Generic')),
+        (KIND_TRANSACTION, _('Transaction')),
+    ]
+
+    STATUS_PENDING = 'pending'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, _('Pending')),
+        (STATUS_FAILED, _('Failed')),
+    ]
+
+    kind = models.CharField(_('Kind'), max_length=20, choices=KIND_CHOICES)
+    body = models.BinaryField(_('Body'))
+    encoding = models.CharField(_('Encoding'), max_length=40, default='utf-8')
+    status = models.CharField(_('Status'), max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(_('Attempts'), default=0)
+    next_attempt_at = models.DateTimeField(_('Next attempt at'), default=timezone.now)
+    last_error = models.TextField(_('Last error'), blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _('easypay queued notification')
+        verbose_name_plural = _('easypay queued notifications')
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return '{} notification {}'.format(self.kind, self.pk)
+
+
+class ProcessedNotification(models.Model):
+    """
+    Notification already processed, used to skip Easypay retries, see EASYPAY_NOTIFICATION_DEDUP
+    """
+    notification_id = models.CharField(_('Notification ID'), max_length=100)
+    notification_type = models.CharField(_('Notification Type'), max_length=100)
+    status = models.CharField(_('Status'), max_length=100, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = _('easypay processed notification')
+        verbose_name_plural = _('easypay processed notifications')
+        unique_together = [('notification_id', 'notification_type', 'status')]
+
+    def __str__(self):
+        return '{} {} {}'.format(self.notification_type, self.notification_id, self.status)
+
+
+class PaymentOutbox(models.Model):
+    """
+    Payment creation journaled before calling Easypay and removed once its AbstractPayment record is saved, see
+    EASYPAY_PAYMENT_OUTBOX. Leftover entries are saved in batches by the easypay_flush_outbox management command
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RECEIVED = 'received'
+    STATUS_UNRESOLVED = 'unresolved'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, _('Pending')),  # the API call hasn't answered yet
+        (STATUS_RECEIVED, _('Received')),  # created at Easypay, the payment record wasn't saved
+        (STATUS_UNRESOLVED, _('Unresolved')),  # no answer recorded, the payment may exist at Easypay
+    ]
+
+    merchant_key = models.CharField(_('Merchant Key'), max_length=100, blank=True)
+    amount = models.DecimalField(_('Amount'), max_digits=10, decimal_places=2, null=True, blank=True)
+    expiration_time = models.DateTimeField(_('Expiration time'), null=True, blank=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                             related_name='+')
+    account_id = models.CharField(_('Account ID'), max_length=100, blank=True)
+    easypay_id = models.CharField(_('Easypay ID'), max_length=100, blank=True)
+    response = models.BinaryField(_('Response'), null=True, blank=True)
+    status = models.CharField(_('Status'), max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    last_error = models.TextField(_('Last error'), blank=True)
+    attempts = models.PositiveIntegerField(_('Failed attempts'), default=0)
+    next_attempt_at = models.DateTimeField(_('Next attempt at'), null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _('easypay payment outbox entry')
+        verbose_name_plural = _('easypay payment outbox')
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return '{} payment {}'.format(self.status, self.easypay_id or self.merchant_key or self.pk)
@@ -0,0 +1,107 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import logging
+
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import settings
+from .models import QueuedNotification
+from .webhooks import decode_json
+
+log = logging.getLogger(__name__)
+
+
+def enqueue_notification(kind, body, encoding='utf-8'):
+    """
+    Stores a raw notification body to be processed later by process_notifications
+    :param kind: QueuedNotification.KIND_GENERIC or QueuedNotification.KIND_TRANSACTION
+    :param body: bytes raw request body
+    :param encoding: string body charset
+    :return: QueuedNotification
+    """
+    return QueuedNotification.objects.create(kind=kind, body=body, encoding=encoding)
+
+
+def claim_notifications(batch_size):
+    """
+    Claims up to batch_size due notifications. Claimed notifications are hidden for EASYPAY_NOTIFICATION_QUEUE_LEASE
+    seconds, so a worker that dies mid-batch only delays them instead of losing them
+    :param batch_size: maximum number of notifications to claim
+    :return: list of QueuedNotification
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        notifications = list(
+            QueuedNotification.objects.select_for_update(skip_locked=True)
+            .filter(status=QueuedNotification.STATUS_PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        QueuedNotification.objects.filter(pk__in=[n.pk for n in notifications]).update(
+            attempts=F('attempts') + 1,
+            next_attempt_at=now + timedelta(seconds=settings.NOTIFICATION_QUEUE_LEASE),
+        )
+    for notification in notifications:
+        notification.attempts += 1
+    return notifications
+
+
+def process_notification(queued):
+    """
+    Decodes and handles a queued notification. On success it is removed from the queue, on failure it is
+    rescheduled with exponential backoff or marked as failed after EASYPAY_NOTIFICATION_QUEUE_MAX_ATTEMPTS
+    :param queued: QueuedNotification
+    :return: True if the notification was handled
+    """
+    from .views import process_generic_notification, process_transaction_notification
+
+    try:
+        data = decode_json(queued.body, queued.encoding)
+        if queued.kind == QueuedNotification.KIND_TRANSACTION:
+            process_transaction_notification(data, fail_silently=False)
+        else:
+            process_generic_notification(data)
+    except Exception as e:
+        log.warning('Failed to process queued %s notification [%s], attempt %s, error: %s.',
+                    queued.kind, queued.pk, queued.attempts, e, exc_info=True)
+        if queued.attempts >= settings.NOTIFICATION_QUEUE_MAX_ATTEMPTS:
+            queued.status = QueuedNotification.STATUS_FAILED
+        else:
+            delay = settings.NOTIFICATION_QUEUE_RETRY_DELAY * 2 ** (queued.attempts - 1)
+            queued.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+        queued.last_error = str(e)
+        queued.save(update_fields=['status', 'next_attempt_at', 'last_error', 'updated_at'])
+        return False
+
+    queued.delete()
+    return True
+
+
+def _process_in_thread(queued):
+    try:
+        return process_notification(queued)
+    finally:
+        close_old_connections()
+
+
+def process_notifications(batch_size=None, concurrency=None):
+    """
+    Claims a batch of due notifications and processes them concurrently
+    :param batch_size: defaults to EASYPAY_NOTIFICATION_QUEUE_BATCH_SIZE
+    :param concurrency: defaults to EASYPAY_NOTIFICATION_QUEUE_CONCURRENCY
+    :return: tuple of the number of processed and failed notifications
+    """
+    notifications = claim_notifications(batch_size or settings.NOTIFICATION_QUEUE_BATCH_SIZE)
+    if not notifications:
+        return 0, 0
+
+    concurrency = concurrency or settings.NOTIFICATION_QUEUE_CONCURRENCY
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(notifications))) as executor:
+            results = list(executor.map(_process_in_thread, notifications))
+    else:
+        results = [process_notification(n) for n in notifications]
+
+    processed = sum(1 for r in results if r)
+    return processed, len(results) - processed
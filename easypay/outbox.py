@@ -0,0 +1,213 @@
+from datetime import timedelta
+import logging
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import json_backend, settings
+from .api import PaymentResponse
+from .metrics import get_metrics
+from .models import PaymentOutbox
+
+log = logging.getLogger(__name__)
+
+
+def outbox_db():
+    """
+    :return: database alias the outbox is written to, EASYPAY_PAYMENT_OUTBOX_DATABASE or the PaymentOutbox router
+             default
+    """
+    return settings.PAYMENT_OUTBOX_DATABASE or router.db_for_write(PaymentOutbox)
+
+
+def record_intent(merchant_key, value, user, expiration_time, account=None):
+    """
+    Journals a payment about to be requested from Easypay. Inside a transaction on the outbox database the entry
+    is only committed with it, so an error or crash during the API call loses it: point
+    EASYPAY_PAYMENT_OUTBOX_DATABASE to a second alias of the same database to journal on its own connection
+    :param merchant_key: string
+    :param value: number
+    :param user: Django User object or None
+    :param expiration_time: datetime or None
+    :param account: string Easypay AccountId the payment is requested on, None for the default account
+    :return: PaymentOutbox
+    """
+    db = outbox_db()
+    if connections[db].in_atomic_block:
+        log.warning('Payment with merchant key [%s] journaled inside a transaction on the %r database, it is lost '
+                    'if the transaction rolls back. Set EASYPAY_PAYMENT_OUTBOX_DATABASE to another alias.',
+                    merchant_key, db)
+    return PaymentOutbox.objects.using(db).create(merchant_key=merchant_key or '', amount=value, user=user,
+                                                  expiration_time=expiration_time, account_id=account or '')
+
+
+def response_dict(payment_response):
+    """
+    :param payment_response: PaymentResponse
+    :return: dict with the PaymentResponse fields, in the Easypay response layout read by PaymentResponse.from_dict
+    """
+    method = payment_response.method.as_dict()
+    method['type'] = method.pop('method_type').value
+    return {'id': payment_response.id, 'status': payment_response.status, 'messages': payment_response.messages,
+            'method': method, 'customer': {'id': payment_response.customer_id}}
+
+
+def _delete_intent(intent):
+    try:
+        intent.delete()
+    except Exception as e:
+        # easypay_flush_outbox skips the already saved record and removes the entry
+        log.error('Failed to remove payment with id [%s] from the outbox, error: %s.', intent.easypay_id, e)
+
+
+def complete_intent(intent, payment_response):
+    """
+    Records the Easypay response on a journaled payment, saves its payment record and removes it from the outbox
+    once the record is committed. When the record can't be saved the entry is left for easypay_flush_outbox
+    :param intent: PaymentOutbox returned by record_intent
+    :param payment_response: PaymentResponse
+    :return: the saved EASYPAY_PERSIST_TRANSACTIONS_CLASS record, None if it couldn't be saved
+    """
+    intent.easypay_id = payment_response.id
+    intent.response = json_backend.dumps(response_dict(payment_response))
+    intent.status = PaymentOutbox.STATUS_RECEIVED
+    try:
+        intent.save(update_fields=['easypay_id', 'response', 'status', 'updated_at'])
+    except Exception as e:
+        # the entry stays pending and easypay_flush_outbox marks it unresolved
+        log.error('Failed to record payment with id [%s] in the outbox, error: %s.',
+                  payment_response.id, e, exc_info=True)
+
+    PaymentModel = apps.get_model(settings.PERSIST_TRANSACTIONS_CLASS)
+    db = router.db_for_write(PaymentModel)
+    try:
+        with get_metrics().timer('easypay_persist_seconds', operation='create'), transaction.atomic(using=db):
+            payment_record = PaymentModel.create(intent.merchant_key, intent.amount, payment_response, intent.user,
+                                                 intent.expiration_time)
+            payment_record.save(using=db)
+    except Exception as e:
+        log.error('Failed to save payment with id [%s] to database, left in the outbox, error: %s.',
+                  payment_response.id, e, exc_info=True)
+        intent.last_error = str(e)
+        try:
+            intent.save(update_fields=['last_error', 'updated_at'])
+        except Exception:
+            pass
+        return None
+
+    # inside a caller transaction the record may still roll back, keep the entry until it commits
+    transaction.on_commit(lambda: _delete_intent(intent), using=db)
+    return payment_record
+
+
+def discard_intent(intent, error=None):
+    """
+    Closes a journaled payment whose Easypay request failed
+    :param intent: PaymentOutbox returned by record_intent
+    :param error: exception when the outcome is unknown (e.g. a timeout or a 5xx) and the payment may exist at
+                  Easypay, the entry is kept with the error. None when no payment was created
+    """
+    if error is None:
+        intent.delete()
+        return
+    log.warning('Easypay payment request with merchant key [%s] failed without a definite answer, kept in the '
+                'outbox, error: %s.', intent.merchant_key, error)
+    intent.last_error = str(error)
+    intent.save(update_fields=['last_error', 'updated_at'])
+
+
+def _retry_later(entry, error, now):
+    """
+    Records a failed save of entry, easypay_flush_outbox skips it until its next attempt so a payment that can't be
+    saved doesn't hold back the ones behind it. The wait doubles after every failure, see
+    EASYPAY_PAYMENT_OUTBOX_RETRY_BACKOFF
+    """
+    entry.attempts += 1
+    entry.last_error = str(error)
+    backoff = min(settings.PAYMENT_OUTBOX_RETRY_BACKOFF * 2 ** (entry.attempts - 1),
+                  settings.PAYMENT_OUTBOX_RETRY_BACKOFF_MAX)
+    entry.next_attempt_at = now + timedelta(seconds=backoff)
+    entry.save(update_fields=['attempts', 'last_error', 'next_attempt_at', 'updated_at'])
+
+
+def _save_batch(PaymentModel, entries, now):
+    """
+    Saves the payment records of entries, one by one when the batch insert fails
+    :return: list of the entries saved
+    """
+    db = router.db_for_write(PaymentModel)
+    # users are read from the payment database, the outbox may be on another alias
+    users = get_user_model()._default_manager.db_manager(db).in_bulk(
+        {entry.user_id for entry in entries if entry.user_id is not None})
+    built = []
+    for entry in entries:
+        try:
+            built.append((entry, PaymentModel.create(
+                entry.merchant_key, entry.amount, PaymentResponse.from_dict(json_backend.loads(bytes(entry.response))),
+                users.get(entry.user_id), entry.expiration_time)))
+        except Exception as e:
+            log.error('Failed to build outbox payment with id [%s], error: %s.', entry.easypay_id, e, exc_info=True)
+            _retry_later(entry, e, now)
+    if not built:
+        return []
+
+    try:
+        with transaction.atomic(using=db):
+            # ignore_conflicts skips records saved meanwhile by the request that journaled them
+            PaymentModel.objects.bulk_create([payment_record for entry, payment_record in built],
+                                             ignore_conflicts=True)
+        return [entry for entry, payment_record in built]
+    except Exception as e:
+        log.warning('Failed to save %s outbox payments in a batch, saving them one by one, error: %s.',
+                    len(built), e)
+
+    saved = []
+    for entry, payment_record in built:
+        try:
+            with transaction.atomic(using=db):
+                PaymentModel.objects.bulk_create([payment_record], ignore_conflicts=True)
+            saved.append(entry)
+        except Exception as e:
+            log.error('Failed to save outbox payment with id [%s] to database, error: %s.',
+                      entry.easypay_id, e, exc_info=True)
+            _retry_later(entry, e, now)
+    return saved
+
+
+def flush_outbox(batch_size=None):
+    """
+    Saves a batch of the payments left in the outbox by requests that couldn't save them, and marks the entries
+    pending for longer than EASYPAY_PAYMENT_OUTBOX_PENDING_TIMEOUT as unresolved. Entries younger than
+    EASYPAY_PAYMENT_OUTBOX_FLUSH_DELAY are left to the request that journaled them, entries that failed to save are
+    skipped until their next attempt
+    :param batch_size: defaults to EASYPAY_PAYMENT_OUTBOX_BATCH_SIZE
+    :return: tuple of the number of payments saved, failed and marked unresolved
+    """
+    PaymentModel = apps.get_model(settings.PERSIST_TRANSACTIONS_CLASS)
+    db = outbox_db()
+    now = timezone.now()
+
+    with get_metrics().timer('easypay_persist_seconds', operation='flush_outbox'), transaction.atomic(using=db):
+        entries = list(
+            PaymentOutbox.objects.using(db).select_for_update(skip_locked=True)
+            .filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now),
+                    status=PaymentOutbox.STATUS_RECEIVED,
+                    created_at__lt=now - timedelta(seconds=settings.PAYMENT_OUTBOX_FLUSH_DELAY))
+            .order_by('created_at')[:batch_size or settings.PAYMENT_OUTBOX_BATCH_SIZE]
+        )
+        saved = _save_batch(PaymentModel, entries, now) if entries else []
+        PaymentOutbox.objects.using(db).filter(pk__in=[entry.pk for entry in saved]).delete()
+
+    stale = PaymentOutbox.objects.using(db).filter(
+        status=PaymentOutbox.STATUS_PENDING,
+        created_at__lt=now - timedelta(seconds=settings.PAYMENT_OUTBOX_PENDING_TIMEOUT))
+    merchant_keys = list(stale.values_list('merchant_key', flat=True))
+    unresolved = stale.update(status=PaymentOutbox.STATUS_UNRESOLVED, updated_at=now) if merchant_keys else 0
+    if unresolved:
+        log.warning('%s outbox payments never got an Easypay answer and were marked unresolved, merchant keys: %s.',
+                    unresolved, merchant_keys)
+
+    return len(saved), len(entries) - len(saved), unresolved
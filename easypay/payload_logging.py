@@ -0,0 +1,99 @@
+from enum import Enum
+import json
+import logging
+import random
+
+from django.http import QueryDict
+
+from . import settings
+from .api import ApiObject
+
+
+REDACTED = '***'
+
+
+def _to_data(value):
+    if isinstance(value, ApiObject):
+        value = value.as_dict()
+    if isinstance(value, dict):
+        return {k: _to_data(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_data(v) for v in value]
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+
+def redact(data, fields=None):
+    """
+    Masks the values of the keys in fields, matched case-insensitively at any depth
+    :param data: decoded payload
+    :param fields: keys to mask, defaults to EASYPAY_PAYLOAD_LOG_REDACT_FIELDS
+    :return: copy of data
+    """
+    if fields is None:
+        fields = {f.lower() for f in settings.PAYLOAD_LOG_REDACT_FIELDS}
+    if isinstance(data, dict):
+        return {k: REDACTED if str(k).lower() in fields and v not in (None, '') else redact(v, fields)
+                for k, v in data.items()}
+    if isinstance(data, list):
+        return [redact(v, fields) for v in data]
+    return data
+
+
+class LazyPayload:
+    """
+    Log argument that decodes, redacts and serializes a payload only when the log record is formatted
+    """
+    __slots__ = ('payload', 'encoding')
+
+    def __init__(self, payload, encoding='utf-8'):
+        """
+        :param payload: raw body bytes (JSON or form encoded), dict or ApiObject
+        :param encoding: charset of raw bodies
+        """
+        self.payload = payload
+        self.encoding = encoding
+
+    def to_data(self):
+        payload = self.payload
+        if isinstance(payload, (bytes, bytearray, memoryview)):
+            payload = bytes(payload)
+            try:
+                payload = json.loads(payload.decode(self.encoding))
+            except (ValueError, LookupError):  # invalid JSON or body, unknown charset
+                try:
+                    payload = QueryDict(payload, encoding=self.encoding).dict()
+                except Exception:
+                    return '<{} bytes>'.format(len(payload))
+        return redact(_to_data(payload))
+
+    def __str__(self):
+        return json.dumps(self.to_data(), default=str, sort_keys=True)
+
+
+def log_payload(logger, message, payload, level=logging.INFO, encoding='utf-8', **fields):
+    """
+    Logs payload, sampled with EASYPAY_PAYLOAD_LOG_SAMPLE_RATE and redacted. Nothing is serialized unless
+    the record is emitted. With EASYPAY_STRUCTURED_LOGGING the payload and fields are set on the record
+    'easypay' attribute instead of being formatted into the message
+    :param logger: logging.Logger
+    :param message: string
+    :param payload: raw body bytes, dict or ApiObject
+    :param level: logging level
+    :param encoding: charset of raw bodies
+    :param fields: extra structured fields, e.g. view name
+    :return:
+    """
+    if not logger.isEnabledFor(level):
+        return
+    sample_rate = settings.PAYLOAD_LOG_SAMPLE_RATE
+    if sample_rate < 1 and random.random() >= sample_rate:
+        return
+
+    lazy_payload = LazyPayload(payload, encoding)
+    if settings.STRUCTURED_LOGGING:
+        fields['payload'] = lazy_payload
+        logger.log(level, message, extra={'easypay': fields})
+    else:
+        logger.log(level, '%s: \n%s', message, lazy_payload)
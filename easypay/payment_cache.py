@@ -0,0 +1,106 @@
+import threading
+
+from django.core.cache import caches
+
+from . import settings
+from .api import get_payment as api_get_payment
+
+
+PAYMENT_KEY = 'easypay:payment:{}:{}'
+NOTIFICATION_DATE_KEY = 'easypay:payment:{}:{}:notification_date'
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def _get_cache():
+    return caches[settings.PAYMENT_CACHE_ALIAS]
+
+
+def _account(client, account):
+    if client is not None:
+        return client.account_id
+    return account or settings.ACCOUNT_ID
+
+
+def get_payment(id, client=None, account=None):
+    """
+    Read-through cached easypay.api.get_payment. Concurrent lookups for the same id share a single API call
+    and, when EASYPAY_PAYMENT_CACHE_TTL is set, the result is cached for that many seconds
+    :param id: string <uuid> Required  Resource Identification
+    :param client: EasypayClient optional, defaults to the shared pooled client
+    :param account: string Easypay AccountId optional, uses that merchant account's client instead
+    :return: PaymentResponse
+    """
+    key = PAYMENT_KEY.format(_account(client, account), id)
+    if settings.PAYMENT_CACHE_TTL:
+        payment_response = _get_cache().get(key)
+        if payment_response is not None:
+            return payment_response
+
+    with _in_flight_lock:
+        call = _in_flight.get(key)
+        leader = call is None
+        if leader:
+            call = _in_flight[key] = _Call()
+
+    if not leader:
+        call.event.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    try:
+        call.result = api_get_payment(id, client=client, account=account)
+        if settings.PAYMENT_CACHE_TTL:
+            _get_cache().set(key, call.result, settings.PAYMENT_CACHE_TTL)
+        return call.result
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _in_flight_lock:
+            del _in_flight[key]
+        call.event.set()
+
+
+def invalidate_payment(id, client=None, account=None):
+    """
+    Drops the cached get_payment result for id
+    :param id: string <uuid>
+    :param client: EasypayClient optional
+    :param account: string Easypay AccountId optional
+    :return:
+    """
+    if settings.PAYMENT_CACHE_TTL:
+        _get_cache().delete(PAYMENT_KEY.format(_account(client, account), id))
+
+
+def notification_received(id, date, client=None, account=None):
+    """
+    Invalidates the cached payment when a notification newer than the last one seen for it arrives,
+    so retries of the same notification keep hitting the cache
+    :param id: string <uuid> payment id
+    :param date: string notification date, 'YYYY-mm-dd HH:MM:SS'
+    :param client: EasypayClient optional
+    :param account: string Easypay AccountId optional
+    :return:
+    """
+    if not settings.PAYMENT_CACHE_TTL:
+        return
+
+    cache = _get_cache()
+    date_key = NOTIFICATION_DATE_KEY.format(_account(client, account), id)
+    last_date = cache.get(date_key)
+    if date is None or last_date is None or str(date) > last_date:
+        invalidate_payment(id, client=client, account=account)
+        if date is not None:
+            cache.set(date_key, str(date), settings.PAYMENT_CACHE_TTL)
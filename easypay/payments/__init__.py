@@ -0,0 +1,9 @@
+# coding: utf-8
+"""
+Ready to use Easypay payment model. Add 'easypay.payments' to INSTALLED_APPS and set
+EASYPAY_PERSIST_TRANSACTIONS_CLASS = 'easypay_payments.Payment', instead of subclassing AbstractPayment.
+"""
+import django
+
+if django.VERSION < (3, 2):
+    default_app_config = 'easypay.payments.apps.EasypayPaymentsConfig'
@@ -0,0 +1,11 @@
+from django.contrib import admin
+
+from ..admin import EasypayPaymentAdmin
+from .models import Payment
+
+
+@admin.register(Payment)
+class PaymentAdmin(EasypayPaymentAdmin):
+    list_filter = ('status', 'method_type')
+    search_fields = ('=easypay_id', '=merchant_key')  # exact lookups use the easypay_id and merchant_key indexes
+    raw_id_fields = ('user',)
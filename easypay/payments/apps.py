@@ -0,0 +1,7 @@
+from django.apps import AppConfig
+
+
+class EasypayPaymentsConfig(AppConfig):
+    name = 'easypay.payments'
+    label = 'easypay_payments'
+    verbose_name = 'Easypay payments'
@@ -0,0 +1,53 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Payment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('easypay_id', models.CharField(max_length=100, unique=True, verbose_name='Easypay ID')),
+                ('merchant_key', models.CharField(blank=True, max_length=100, verbose_name='Merchant Key')),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Amount')),
+                ('status', models.CharField(choices=[('pending', 'PENDING'), ('active', 'ACTIVE'), ('deleted', 'DELETED')], max_length=100, verbose_name='Status')),
+                ('method_type', models.CharField(blank=True, choices=[('mb', 'MULTIBANCO'), ('cc', 'CC'), ('bb', 'BB'), ('mbw', 'MBWAY'), ('dd', 'DEBITO_DIRECTO')], max_length=10, verbose_name='Method Type')),
+                ('customer_id', models.CharField(blank=True, max_length=100, verbose_name='Customer ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='easypay_payments', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'easypay payment',
+                'verbose_name_plural': 'easypay payments',
+                'abstract': False,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['status', 'method_type', 'created_at'], name='easypay_pay_status_method_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['method_type', 'created_at'], name='easypay_pay_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['merchant_key'], name='easypay_pay_merchant_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['user', '-created_at'], name='easypay_pay_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('easypay_payments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['created_at', 'id'], name='easypay_pay_created_id_idx'),
+        ),
+    ]
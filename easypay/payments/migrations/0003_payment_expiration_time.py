@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('easypay_payments', '0002_payment_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='expiration_time',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Expiration time'),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='status',
+            field=models.CharField(choices=[('pending', 'PENDING'), ('active', 'ACTIVE'), ('deleted', 'DELETED'), ('expired', 'EXPIRED')], max_length=100, verbose_name='Status'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import models
+
+from ..api import MethodStatus
+from ..models import AbstractPayment
+
+
+class Payment(AbstractPayment):
+    """
+    Concrete AbstractPayment with indexes for the usual lookups: pending payments by method and age,
+    payments by merchant_key, a user's payments by date and the admin changelist by created_at
+    """
+
+    class Meta(AbstractPayment.Meta):
+        indexes = [
+            models.Index(fields=['status', 'method_type', 'created_at'], name='easypay_pay_status_method_idx'),
+            models.Index(fields=['method_type', 'created_at'], name='easypay_pay_pending_idx',
+                         condition=models.Q(status=MethodStatus.PENDING.value)),
+            models.Index(fields=['merchant_key'], name='easypay_pay_merchant_key_idx'),
+            models.Index(fields=['user', '-created_at'], name='easypay_pay_user_created_idx'),
+            # admin keyset pagination and date hierarchy
+            models.Index(fields=['created_at', 'id'], name='easypay_pay_created_id_idx'),
+        ]
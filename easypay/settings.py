@@ -1,14 +1,188 @@
+"""
+easypay settings, each NAME below is read from the EASYPAY_NAME Django setting, falling back to its default.
+Values are read on first access and re-read when Django's setting_changed signal reports an EASYPAY_ setting,
+e.g. under override_settings. Modules holding objects built from settings reset them with on_change.
+"""
 from django.conf import settings
+from django.core.signals import setting_changed
 
 
-BACKEND_URL = getattr(settings, 'EASYPAY_BACKEND_URL', 'https://api.test.easypay.pt/2.0')
-ACCOUNT_ID = getattr(settings, 'EASYPAY_ACCOUNT_ID', None)
-API_KEY = getattr(settings, 'EASYPAY_API_KEY', None)
+PREFIX = 'EASYPAY_'
 
-GENERATE_MERCHANT_KEY = getattr(settings, 'EASYPAY_GENERATE_MERCHANT_KEY', True)
 
-PERSIST_TRANSACTIONS_CLASS = getattr(settings, 'EASYPAY_PERSIST_TRANSACTIONS_CLASS', None)  # app_label.model_name
+class _SameAs:
+    """
+    Default taken from another setting
+    """
 
-NOTIFICATION_CODE_GENERIC = getattr(settings, 'EASYPAY_NOTIFICATION_CODE_GENERIC', None)
-NOTIFICATION_CODE_AUTHORISATION = getattr(settings, 'EASYPAY_NOTIFICATION_CODE_AUTHORISATION', None)
-NOTIFICATION_CODE_TRANSACTION = getattr(settings, 'EASYPAY_NOTIFICATION_CODE_TRANSACTION', None)
+    def __init__(self, name):
+        self.name = name
+
+
+DEFAULTS = {
+    'BACKEND_URL': 'https://api.test.easypay.pt/2.0',
+    'ACCOUNT_ID': None,
+    'API_KEY': None,
+
+    'GENERATE_MERCHANT_KEY': True,
+
+    'PERSIST_TRANSACTIONS_CLASS': None,  # app_label.model_name
+
+    # With PERSIST_TRANSACTIONS_CLASS, journal single payments in the PaymentOutbox table before calling Easypay and
+    # remove them once their record is saved. easypay_flush_outbox saves the ones left behind in batches, at least
+    # PAYMENT_OUTBOX_FLUSH_DELAY after they were journaled, and marks those never answered within
+    # PAYMENT_OUTBOX_PENDING_TIMEOUT unresolved. A payment that fails to save is retried after
+    # PAYMENT_OUTBOX_RETRY_BACKOFF, doubled after every failure up to PAYMENT_OUTBOX_RETRY_BACKOFF_MAX
+    'PAYMENT_OUTBOX': False,
+    'PAYMENT_OUTBOX_BATCH_SIZE': 500,
+    'PAYMENT_OUTBOX_FLUSH_DELAY': 60,  # seconds
+    'PAYMENT_OUTBOX_PENDING_TIMEOUT': 600,  # seconds
+    'PAYMENT_OUTBOX_RETRY_BACKOFF': 60,  # seconds
+    'PAYMENT_OUTBOX_RETRY_BACKOFF_MAX': 3600,  # seconds
+    # Database alias the outbox is journaled on, a second alias of the payments database keeps the journal on its
+    # own connection, committed before the API call even inside a transaction (ATOMIC_REQUESTS)
+    'PAYMENT_OUTBOX_DATABASE': None,
+
+    'NOTIFICATION_CODE_GENERIC': None,
+    'NOTIFICATION_CODE_AUTHORISATION': None,
+    'NOTIFICATION_CODE_TRANSACTION': None,
+
+    # HTTP connection pool used for calls to the Easypay API
+    'POOL_CONNECTIONS': 10,
+    'POOL_MAXSIZE': 10,
+    'CONNECT_TIMEOUT': 5,  # seconds
+    'READ_TIMEOUT': 30,  # seconds
+    'MAX_RETRIES': 3,  # only applied to idempotent verbs
+    'RETRY_BACKOFF_FACTOR': 0.3,
+
+    'BULK_MAX_CONCURRENCY': _SameAs('POOL_MAXSIZE'),
+
+    # When enabled, generic and transaction notifications are stored in a queue table and processed by
+    # the easypay_process_notifications management command instead of inside the webhook request
+    'NOTIFICATION_QUEUE': False,
+    'NOTIFICATION_QUEUE_BATCH_SIZE': 100,
+    'NOTIFICATION_QUEUE_CONCURRENCY': 4,
+    'NOTIFICATION_QUEUE_MAX_ATTEMPTS': 5,
+    'NOTIFICATION_QUEUE_RETRY_DELAY': 30,  # seconds, doubles
+    'NOTIFICATION_QUEUE_LEASE': 300,  # seconds claimed items stay hidden
+
+    # get_payment read-through cache used when handling notifications, 0 disables caching
+    'PAYMENT_CACHE_TTL': 0,  # seconds
+    'PAYMENT_CACHE_ALIAS': 'default',
+
+    # How transaction notifications refresh the persisted payment status:
+    # 'api' always calls get_payment, 'payload' uses the status carried by the notification when
+    # EASYPAY_NOTIFICATION_STATUS_RESOLVER finds one and only falls back to get_payment otherwise
+    'NOTIFICATION_UPDATE_POLICY': 'api',
+    'NOTIFICATION_STATUS_RESOLVER': 'easypay.api.notification_method_status',
+
+    # Skips retried notifications already processed, keyed on notification id, type and status
+    'NOTIFICATION_DEDUP': False,
+    'NOTIFICATION_DEDUP_CACHE_ALIAS': None,  # front cache
+    'NOTIFICATION_DEDUP_RETENTION_DAYS': 7,
+
+    # Keep the raw request dict / requests Response on notifications and PaymentResponse (.request/.response)
+    'KEEP_RAW_PAYLOADS': True,
+
+    # Dotted path to the metrics backend class, e.g. 'easypay.metrics.PrometheusMetrics'
+    'METRICS_BACKEND': 'easypay.metrics.NoOpMetrics',
+
+    # Webhook payload logging: fraction of payloads logged, keys whose values are masked and whether the payload
+    # goes to the log record 'easypay' attribute (for structured/JSON formatters) instead of the message
+    'PAYLOAD_LOG_SAMPLE_RATE': 1.0,
+    'PAYLOAD_LOG_REDACT_FIELDS': ['name', 'email', 'phone', 'fiscal_number'],
+    'STRUCTURED_LOGGING': False,
+
+    # JSON library used for API requests and responses: 'auto' picks orjson or ujson when installed, else 'json'
+    'JSON_BACKEND': 'auto',
+
+    # Webhook requests with a larger body are rejected with 413
+    'WEBHOOK_MAX_BODY_SIZE': 256 * 1024,  # bytes
+    # Handlers replacing the default of a notification type, {'authorisation_notification': 'dotted.path'}, the
+    # default authorisation_notification handler raises NotImplementedError
+    'WEBHOOK_HANDLERS': {},
+
+    # How the easypay signals reach their receivers: 'sync' runs them inside the webhook request, 'background'
+    # runs each receiver on a thread pool (async receivers on an event loop) so the webhook answers right away
+    'SIGNAL_DISPATCH': 'sync',
+    'SIGNAL_DISPATCH_WORKERS': 4,
+    # seconds, coroutine receivers are cancelled after it, sync receivers can't be interrupted and are only logged
+    'SIGNAL_RECEIVER_TIMEOUT': None,
+    'SIGNAL_BATCH_SIZE': 100,
+    'SIGNAL_BATCH_INTERVAL': 1.0,  # seconds
+
+    # Admin changelists with more rows than this, by the PostgreSQL planner estimate, show the estimate
+    # instead of COUNT(*)
+    'ADMIN_EXACT_COUNT_THRESHOLD': 10000,
+
+    # easypay_expire_payments asks the API before marking payments that expired less than this long ago, a late payment
+    # or a delayed notification may still land; older ones are marked expired without an API call
+    'EXPIRY_CONFIRM_WINDOW': 24 * 60 * 60,  # seconds
+
+    # Merchant accounts, Easypay AccountId -> ApiKey or dict of EasypayClient arguments, for the account argument
+    # of the API calls. EASYPAY_ACCOUNT_LOADER is the dotted path of a callable(account_id) returning the same for
+    # accounts not listed, e.g. read from the database. At most ACCOUNT_CLIENTS_MAXSIZE clients are kept open
+    'ACCOUNTS': {},
+    'ACCOUNT_LOADER': None,
+    'ACCOUNT_CLIENTS_MAXSIZE': 32,
+
+    # Rate limiter and circuit breaker around every API call, per account and endpoint ('single', ...).
+    # CIRCUIT_RATE_LIMIT is a token bucket of calls per second, a call waits up to CIRCUIT_RATE_MAX_WAIT for a
+    # token. After CIRCUIT_FAILURE_THRESHOLD consecutive 429/5xx responses or connection errors calls fail fast
+    # for CIRCUIT_RESET_TIMEOUT, then a single trial call decides whether to close again. None disables them.
+    # CIRCUIT_ENDPOINTS overrides them per endpoint, e.g. {'single': {'rate': 20, 'failure_threshold': 3}}, and
+    # with CIRCUIT_CACHE_ALIAS the state is shared through that cache by every process
+    'CIRCUIT_RATE_LIMIT': None,
+    'CIRCUIT_RATE_BURST': None,  # defaults to the rate
+    'CIRCUIT_RATE_MAX_WAIT': 1.0,  # seconds
+    'CIRCUIT_FAILURE_THRESHOLD': None,
+    'CIRCUIT_RESET_TIMEOUT': 30,  # seconds
+    'CIRCUIT_ENDPOINTS': {},
+    'CIRCUIT_CACHE_ALIAS': None,
+}
+
+_callbacks = []
+
+
+def __getattr__(name):
+    if name not in DEFAULTS:
+        raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
+    default = DEFAULTS[name]
+    if isinstance(default, _SameAs):
+        default = __getattr__(default.name)
+    value = globals()[name] = getattr(settings, PREFIX + name, default)
+    return value
+
+
+def reload():
+    """
+    Forgets the values read so far, they are read again from the Django settings on next access
+    :return:
+    """
+    for name in DEFAULTS:
+        globals().pop(name, None)
+
+
+def on_change(*names):
+    """
+    Decorator registering func to be called, without arguments, after one of the named settings changes,
+    or any easypay setting when no names are given
+    :param names: setting names without the EASYPAY_ prefix
+    """
+    def decorator(func):
+        _callbacks.append((frozenset(names), func))
+        return func
+    return decorator
+
+
+def _setting_changed(setting, **kwargs):
+    if not setting.startswith(PREFIX):
+        return
+    reload()
+    name = setting[len(PREFIX):]
+    for names, func in list(_callbacks):
+        if not names or name in names:
+            func()
+
+
+setting_changed.connect(_setting_changed, dispatch_uid='easypay.settings')
@@ -3,8 +3,11 @@ from __future__ import unicode_literals
 from django.dispatch import Signal
 
 
+__all__ = ['generic_notification', 'authorisation_notification', 'transaction_notification', 'mbway_notification']
+
+
 generic_notification = Signal(providing_args=["notification"])
 authorisation_notification = Signal(providing_args=["notification"])
-transaction_notification = Signal(providing_args=["notification"])
+transaction_notification = Signal(providing_args=["notification", "payment_updated"])
 
 mbway_notification = Signal(providing_args=["notification"])
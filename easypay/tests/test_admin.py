@@ -0,0 +1,56 @@
+from unittest import mock
+
+from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.auth import get_user_model
+from django.http import QueryDict
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+
+from ..admin import EstimatedCountPaginator, estimate_count
+from .utils import get_payment_model, requires_payments
+
+
+@requires_payments
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        Payment = get_payment_model()
+        self.superuser = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.payments = [Payment.objects.create(easypay_id='p{}'.format(i), status='pending') for i in range(5)]
+        # equal created_at values are ordered by pk
+        Payment.objects.update(created_at=timezone.now())
+        self.model_admin = admin.site._registry[Payment]
+
+    def changelist(self, params=None):
+        request = RequestFactory().get('/', params or {})
+        request.user = self.superuser
+        with mock.patch.object(self.model_admin, 'list_per_page', 2):
+            return self.model_admin.get_changelist_instance(request)
+
+    def test_pages_follow_the_cursor(self):
+        seen = []
+        changelist = self.changelist()
+        while True:
+            seen += [p.pk for p in changelist.result_list]
+            if not changelist.next_page_url:
+                break
+            changelist = self.changelist(QueryDict(changelist.next_page_url.lstrip('?')).dict())
+        self.assertEqual(seen, sorted((p.pk for p in self.payments), reverse=True))
+
+    def test_explicit_ordering_uses_offset_pagination(self):
+        changelist = self.changelist({'o': '1'})
+        self.assertFalse(changelist.keyset)
+        self.assertEqual(len(changelist.result_list), 2)
+
+    def test_invalid_cursor(self):
+        for cursor in ('junk', 'junk,1', '2020-01-01T00:00:00,'):
+            with self.assertRaises(IncorrectLookupParameters):
+                self.changelist({'cursor': cursor})
+
+    def test_count_is_exact_without_an_estimate(self):
+        queryset = get_payment_model().objects.order_by('pk')
+        self.assertIsNone(estimate_count(queryset))
+        paginator = EstimatedCountPaginator(queryset, 2)
+        self.assertEqual(paginator.count, 5)
+        self.assertFalse(paginator.estimated)
@@ -0,0 +1,115 @@
+from datetime import datetime
+import pickle
+
+from django.test import SimpleTestCase, override_settings
+
+from ..api import GenericNotification, MbwayNotification, MethodType, NotificationStatus, NotificationType
+from ..api import PaymentResponse, TransactionNotification, build_single_payment_payload
+from .utils import generic_body, transaction_body
+
+MBWAY_BODY = {'Cin': '1', 'Entity': '21098', 'Key': 'k', 'Reference': 'r1', 'Status': 'success',
+              'StatusMessage': 'ok', 'Type': 'mbway'}
+
+
+class ApiObjectTests(SimpleTestCase):
+
+    def objects(self):
+        return [
+            PaymentResponse.from_dict({'id': 'p1', 'status': 'ok', 'message': ['created'],
+                                       'method': {'type': 'MB', 'status': 'pending', 'entity': 21098},
+                                       'customer': {'id': 'c1'}}),
+            GenericNotification(generic_body()),
+            TransactionNotification(transaction_body()),
+            MbwayNotification(MBWAY_BODY),
+        ]
+
+    def test_objects_have_no_instance_dict(self):
+        for obj in self.objects():
+            self.assertFalse(hasattr(obj, '__dict__'), type(obj).__name__)
+
+    def test_as_dict(self):
+        payment_response, generic, transaction, mbway = self.objects()
+        self.assertEqual(payment_response.as_dict()['id'], 'p1')
+        self.assertEqual(payment_response.method.as_dict()['method_type'], MethodType.MULTIBANCO)
+        self.assertEqual(payment_response.method.as_dict()['entity'], 21098)
+        self.assertEqual(generic.as_dict(), {'id': 'p1', 'merchant_key': 'k', 'type': NotificationType.CAPTURE,
+                                             'status': NotificationStatus.SUCCESS, 'messages': [],
+                                             'date': '2020-01-01 10:00:00'})
+        self.assertEqual(transaction.as_dict()['account_id'], 'acc')
+        self.assertEqual(transaction.transaction.as_dict()['transaction_type'], 'capture')
+        self.assertEqual(mbway.as_dict()['status_message'], 'ok')
+        for obj in self.objects():
+            self.assertFalse([name for name in obj.as_dict() if name.startswith('_')])
+
+    def test_pickle_round_trip(self):
+        for obj in self.objects():
+            copy = pickle.loads(pickle.dumps(obj))
+            self.assertIs(type(copy), type(obj))
+            self.assertEqual(str(copy), str(obj))
+            for name, value in obj.as_dict().items():
+                value_copy = getattr(copy, name)
+                if hasattr(value, 'as_dict'):
+                    self.assertEqual(value_copy.as_dict(), value.as_dict())
+                else:
+                    self.assertEqual(value_copy, value)
+        notification = pickle.loads(pickle.dumps(GenericNotification(generic_body())))
+        self.assertEqual(notification.request, generic_body())
+
+    @override_settings(EASYPAY_KEEP_RAW_PAYLOADS=False)
+    def test_raw_payloads_can_be_dropped(self):
+        self.assertIsNone(GenericNotification(generic_body()).request)
+        self.assertIsNone(TransactionNotification(transaction_body()).request)
+
+
+class SinglePaymentPayloadTests(SimpleTestCase):
+
+    def test_payload_matches_the_full_request(self):
+        payload = build_single_payment_payload(
+            10.5, payment_type='authorisation', method='mbw', capture_transaction_key='t1', capture_date='2030-01-01',
+            capture_descriptive='Shop', expiration_time='2030-01-01 10:00', currency='BRL', customer_account_id='c1',
+            customer_name='John', customer_email='john@example.com', customer_phone='911234567',
+            customer_phone_indicative='+55', customer_fiscal_number=123, customer_key='u1', merchant_key='k')
+        self.assertEqual(payload, {
+            'type': 'authorisation',
+            'capture': {
+                'transaction_key': 't1',
+                'capture_date': '2030-01-01',
+                'account': {
+                    'id': 'c1',
+                },
+                'descriptive': 'Shop',
+            },
+            'expiration_time': '2030-01-01 10:00',
+            'currency': 'BRL',
+            'customer': {
+                'id': 'c1',
+                'name': 'John',
+                'email': 'john@example.com',
+                'phone': '911234567',
+                'phone_indicative': '+55',
+                'fiscal_number': '123',
+                'key': 'u1',
+            },
+            'key': 'k',
+            'value': 10.5,
+            'method': 'mbw',
+        })
+
+    def test_none_values_are_omitted(self):
+        self.assertEqual(build_single_payment_payload(10), {
+            'type': 'sale', 'currency': 'EUR', 'value': 10, 'method': 'mb', 'customer': {'phone_indicative': '+351'},
+        })
+        payload = build_single_payment_payload(10, customer_phone_indicative=None, customer_name='John')
+        self.assertEqual(payload['customer'], {'name': 'John'})
+        self.assertNotIn('capture', payload)
+        self.assertNotIn('key', payload)
+
+    def test_datetime_expiration_time(self):
+        payload = build_single_payment_payload(10, method='mbw', expiration_time=datetime(2030, 1, 1, 10, 0))
+        self.assertEqual(payload['expiration_time'], '2030-01-01 10:00')
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            build_single_payment_payload('10')
+        with self.assertRaises(ValueError):
+            build_single_payment_payload(10, method='bitcoin')
@@ -0,0 +1,178 @@
+import asyncio
+import gc
+import json
+from unittest import mock, skipIf
+
+from django.test import SimpleTestCase, override_settings
+
+from .. import async_api
+from ..api import EasypayApiException, PaymentResponse
+from ..async_api import AsyncEasypayClient, async_delete_payment, async_get_payment, async_single_payment
+from ..async_api import close_async_clients, get_async_client, get_default_async_client
+
+PAYMENT = {'id': 'p1', 'status': 'ok', 'message': ['created'], 'method': {'type': 'mb', 'status': 'pending'},
+           'customer': {'id': 'c1'}}
+
+
+def mock_transport(handler):
+    """
+    Patches the httpx transport of the AsyncEasypayClients built meanwhile with an httpx.MockTransport
+    """
+    return mock.patch.object(async_api.httpx, 'AsyncHTTPTransport',
+                             return_value=async_api.httpx.MockTransport(handler))
+
+
+@skipIf(async_api.httpx is None, 'requires httpx')
+@override_settings(EASYPAY_ACCOUNT_ID='acc', EASYPAY_API_KEY='key', EASYPAY_BACKEND_URL='https://easypay.test/2.0')
+class AsyncApiTests(SimpleTestCase):
+
+    def setUp(self):
+        self.requests = []
+        self.status_code = 201
+        patcher = mock_transport(self.handle)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def handle(self, request):
+        self.requests.append(request)
+        return async_api.httpx.Response(self.status_code, json=PAYMENT)
+
+    async def test_single_payment(self):
+        payment_response = await async_single_payment(10, method='mb', merchant_key='k')
+        self.assertIsInstance(payment_response, PaymentResponse)
+        self.assertEqual((payment_response.id, payment_response.method.status), ('p1', 'pending'))
+
+        request = self.requests[0]
+        self.assertEqual((request.method, str(request.url)), ('POST', 'https://easypay.test/2.0/single'))
+        self.assertEqual((request.headers['AccountId'], request.headers['ApiKey']), ('acc', 'key'))
+        payload = json.loads(request.content)
+        self.assertEqual((payload['value'], payload['method'], payload['key']), (10, 'mb', 'k'))
+
+    async def test_error_response_raises(self):
+        self.status_code = 400
+        with self.assertRaises(EasypayApiException):
+            await async_single_payment(10, method='mb')
+        with self.assertRaises(EasypayApiException):
+            await async_get_payment('p1')
+
+    async def test_get_payment(self):
+        payment_response = await async_get_payment('p1')
+        self.assertEqual(payment_response.id, 'p1')
+        self.assertEqual((self.requests[0].method, self.requests[0].url.path), ('GET', '/2.0/single/p1'))
+        with self.assertRaises(ValueError):
+            await async_get_payment('')
+
+    async def test_delete_payment_invalidates_the_cache(self):
+        with mock.patch('easypay.payment_cache.invalidate_payment') as invalidate_payment:
+            response = await async_delete_payment('p1')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((self.requests[0].method, self.requests[0].url.path), ('DELETE', '/2.0/single/p1'))
+        self.assertEqual(invalidate_payment.call_args[0], ('p1',))
+
+    async def test_explicit_client(self):
+        client = AsyncEasypayClient(account_id='other', api_key='other-key')
+        await async_get_payment('p1', client=client)
+        await client.close()
+        self.assertEqual(self.requests[0].headers['AccountId'], 'other')
+        self.assertNotIn(asyncio.get_running_loop(), async_api._default_clients)
+
+
+@skipIf(async_api.httpx is None, 'requires httpx')
+@override_settings(EASYPAY_ACCOUNT_ID='acc', EASYPAY_API_KEY='key')
+class DefaultAsyncClientTests(SimpleTestCase):
+
+    def test_one_client_per_loop(self):
+        async def clients():
+            return get_default_async_client(), get_default_async_client()
+
+        first, again = asyncio.run(clients())
+        self.assertIs(first, again)
+        self.assertIsNot(asyncio.run(clients())[0], first)
+
+    def test_clients_are_dropped_with_their_loop(self):
+        loop = asyncio.new_event_loop()
+
+        async def client():
+            return get_default_async_client()
+
+        loop.run_until_complete(client())
+        self.assertIn(loop, async_api._default_clients)
+        loop.close()
+        count = len(async_api._default_clients)
+        del loop
+        gc.collect()
+        self.assertEqual(len(async_api._default_clients), count - 1)
+
+    def test_settings_change_drops_the_clients(self):
+        async def client():
+            return get_default_async_client()
+
+        async def main():
+            first = await client()
+            with override_settings(EASYPAY_API_KEY='other'):
+                second = await client()
+            return first, second
+
+        first, second = asyncio.run(main())
+        self.assertIsNot(first, second)
+        self.assertEqual(second.api_key, 'other')
+
+    def test_invalid_credentials(self):
+        async def client():
+            return get_default_async_client()
+
+        with override_settings(EASYPAY_API_KEY=None), self.assertRaises(ValueError):
+            asyncio.run(client())
+
+
+@skipIf(async_api.httpx is None, 'requires httpx')
+@override_settings(EASYPAY_ACCOUNT_ID='acc', EASYPAY_API_KEY='key', EASYPAY_ACCOUNT_CLIENTS_MAXSIZE=2,
+                   EASYPAY_ACCOUNTS={'m1': 'key-1', 'm2': {'api_key': 'key-2', 'pool_connections': 2,
+                                                          'read_timeout': 5}, 'm3': 'key-3'})
+class AccountAsyncClientTests(SimpleTestCase):
+
+    def setUp(self):
+        self.requests = []
+        patcher = mock_transport(self.handle)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def handle(self, request):
+        self.requests.append(request)
+        return async_api.httpx.Response(200, json=PAYMENT)
+
+    async def test_account_calls_use_its_credentials(self):
+        await async_single_payment(10, method='mb', account='m1')
+        await async_get_payment('p1', account='m2')
+        with mock.patch('easypay.payment_cache.invalidate_payment') as invalidate_payment:
+            await async_delete_payment('p1', account='m1')
+        self.assertEqual([(r.headers['AccountId'], r.headers['ApiKey']) for r in self.requests],
+                         [('m1', 'key-1'), ('m2', 'key-2'), ('m1', 'key-1')])
+        self.assertEqual(invalidate_payment.call_args[1]['client'].account_id, 'm1')
+        await close_async_clients()
+
+    async def test_default_account(self):
+        self.assertIs(get_async_client(), get_default_async_client())
+        self.assertIs(get_async_client('acc'), get_default_async_client())
+        await close_async_clients()
+
+    async def test_least_recently_used_client_is_dropped(self):
+        m1, m2 = get_async_client('m1'), get_async_client('m2')
+        self.assertIs(get_async_client('m1'), m1)
+        get_async_client('m3')
+        self.assertEqual(list(async_api._account_clients[asyncio.get_running_loop()]), ['m1', 'm3'])
+        self.assertIsNot(get_async_client('m2'), m2)
+        await close_async_clients()
+        await m2.close()
+        self.assertNotIn(asyncio.get_running_loop(), async_api._account_clients)
+
+    async def test_unknown_account(self):
+        with self.assertRaises(ValueError):
+            await async_get_payment('p1', account='unknown')
+        self.assertEqual(self.requests, [])
+
+    def test_clients_are_per_loop(self):
+        async def client():
+            return get_async_client('m1')
+
+        self.assertIsNot(asyncio.run(client()), asyncio.run(client()))
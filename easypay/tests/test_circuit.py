@@ -0,0 +1,124 @@
+import asyncio
+from unittest import mock
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import SimpleTestCase, override_settings
+
+from ..circuit import CircuitBreaker, EasypayCircuitOpenException, EasypayRateLimitException, EndpointGuard
+from ..circuit import CacheCircuitBreaker, CacheRateLimiter, TokenBucket, get_guard
+
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def expire(self, breaker):
+        breaker._opened_at -= breaker.reset_timeout
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        self.assertFalse(breaker.record_failure())
+        breaker.record_success()
+        self.assertFalse(breaker.record_failure())
+        self.assertTrue(breaker.record_failure())
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertGreater(breaker.before_call(), 29)
+
+    def test_half_open_lets_a_single_trial_through(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        breaker.record_failure()
+        self.expire(breaker)
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertIsNone(breaker.before_call())
+        self.assertIsNotNone(breaker.before_call())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertIsNone(breaker.before_call())
+
+    def test_failed_trial_opens_again(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        breaker.record_failure()
+        self.expire(breaker)
+        self.assertIsNone(breaker.before_call())
+        self.assertTrue(breaker.record_failure())
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    def test_guard_fails_fast_and_counts_5xx(self):
+        guard = EndpointGuard('single', breaker=CircuitBreaker(failure_threshold=2, reset_timeout=30))
+        guard.before_call()
+        guard.record(404)
+        guard.record(503)
+        guard.record(None)
+        with self.assertRaises(EasypayCircuitOpenException):
+            guard.before_call()
+
+    def test_guard_rate_limit(self):
+        guard = EndpointGuard('single', limiter=TokenBucket(rate=1, burst=2), max_wait=0)
+        guard.before_call()
+        guard.before_call()
+        with self.assertRaises(EasypayRateLimitException):
+            guard.before_call()
+
+    def test_async_guard_does_not_block_the_loop(self):
+        guard = EndpointGuard('single', limiter=TokenBucket(rate=20, burst=1), max_wait=1)
+        ticks = []
+
+        async def ticker():
+            for _ in range(3):
+                ticks.append(1)
+                await asyncio.sleep(0.01)
+
+        async def main():
+            await guard.before_call_async()
+            await asyncio.gather(guard.before_call_async(), ticker())
+
+        asyncio.run(main())
+        self.assertEqual(len(ticks), 3)
+
+
+class SharedCircuitTests(SimpleTestCase):
+
+    def setUp(self):
+        self.cache = LocMemCache('easypay-circuit-tests', {})
+        self.addCleanup(self.cache.clear)
+
+    def test_processes_open_and_close_together(self):
+        first, second = (CacheCircuitBreaker(self.cache, 'breaker', failure_threshold=2, reset_timeout=30)
+                         for _ in range(2))
+        self.assertFalse(first.record_failure())
+        self.assertTrue(second.record_failure())
+        self.assertEqual(first.state, CacheCircuitBreaker.OPEN)
+        self.assertGreater(first.before_call(), 29)
+
+        self.cache.set('breaker:opened', self.cache.get('breaker:opened') - 30, timeout=None)
+        self.assertIsNone(first.before_call())
+        self.assertIsNotNone(second.before_call())  # a single trial call
+        first.record_success()
+        self.assertEqual(second.state, CacheCircuitBreaker.CLOSED)
+
+    def test_shared_rate_limit(self):
+        first, second = (CacheRateLimiter(self.cache, 'rate', rate=2) for _ in range(2))
+        with mock.patch('easypay.circuit.time.time', return_value=1000.25):
+            self.assertIsNone(first.try_acquire())
+            self.assertIsNone(second.try_acquire())
+            self.assertEqual(first.try_acquire(), 0.75)
+        with mock.patch('easypay.circuit.time.time', return_value=1001.0):
+            self.assertIsNone(second.try_acquire())
+
+
+class GetGuardTests(SimpleTestCase):
+
+    @override_settings(EASYPAY_CIRCUIT_RATE_LIMIT=None, EASYPAY_CIRCUIT_FAILURE_THRESHOLD=None)
+    def test_disabled(self):
+        self.assertIsNone(get_guard('acc', 'single'))
+
+    @override_settings(EASYPAY_CIRCUIT_RATE_LIMIT=None, EASYPAY_CIRCUIT_FAILURE_THRESHOLD=5,
+                       EASYPAY_CIRCUIT_ENDPOINTS={'single': {'rate': 20, 'failure_threshold': 3}})
+    def test_endpoint_options(self):
+        guard = get_guard('acc', 'single')
+        self.assertIs(get_guard('acc', 'single'), guard)
+        self.assertIsNot(get_guard('other', 'single'), guard)
+        self.assertEqual((guard.limiter.rate, guard.breaker.failure_threshold), (20, 3))
+        other = get_guard('acc', 'payments')
+        self.assertIsNone(other.limiter)
+        self.assertEqual(other.breaker.failure_threshold, 5)
+        with override_settings(EASYPAY_CIRCUIT_CACHE_ALIAS='default'):
+            self.assertIsInstance(get_guard('acc', 'single').breaker, CacheCircuitBreaker)
@@ -0,0 +1,163 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from ..client import RETRY_STATUS_CODES, ClientRegistry, EasypayClient, _build_retry, account_credentials
+from ..client import close_default_client, get_client, get_default_client, get_registry
+
+
+class UnavailableHandler(BaseHTTPRequestHandler):
+    """Answers every request with 503, counts them per method and records the client ports"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.reply()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.reply()
+
+    def reply(self):
+        with self.server.lock:
+            self.server.hits[self.command] = self.server.hits.get(self.command, 0) + 1
+            self.server.ports.add(self.client_address[1])
+        self.send_response(503)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class RetryTests(SimpleTestCase):
+
+    def test_retry_configuration(self):
+        retry = _build_retry(3, 0.3)
+        self.assertEqual((retry.total, retry.connect, retry.read, retry.status), (3, 3, 3, 3))
+        self.assertEqual(set(retry.status_forcelist), set(RETRY_STATUS_CODES))
+        self.assertEqual(retry.backoff_factor, 0.3)
+        self.assertFalse(retry.raise_on_status)
+        allowed = getattr(retry, 'allowed_methods', None) or retry.method_whitelist
+        self.assertEqual(set(allowed), {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+
+    def test_post_is_never_retried(self):
+        retry = _build_retry(3, 0)
+        self.assertTrue(retry.is_retry('GET', 503))
+        self.assertTrue(retry.is_retry('DELETE', 502))
+        self.assertFalse(retry.is_retry('POST', 503))
+        self.assertFalse(retry.is_retry('GET', 500))
+
+    def test_client_adapter_settings(self):
+        client = EasypayClient(account_id='acc', api_key='key', pool_connections=3, pool_maxsize=7, max_retries=2,
+                               retry_backoff_factor=0.5)
+        self.addCleanup(client.close)
+        adapter = client.session.get_adapter('https://api.test.easypay.pt/2.0/single')
+        self.assertIs(adapter, client.session.get_adapter('http://localhost'))
+        self.assertEqual((adapter._pool_connections, adapter._pool_maxsize), (3, 7))
+        self.assertEqual((adapter.max_retries.total, adapter.max_retries.backoff_factor), (2, 0.5))
+        self.assertEqual(client.session.headers['AccountId'], 'acc')
+        self.assertEqual(client.session.headers['ApiKey'], 'key')
+
+
+class RetryServerTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), UnavailableHandler)
+        cls.server.lock = threading.Lock()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.hits = {}
+        self.server.ports = set()
+        self.client = EasypayClient(account_id='acc', api_key='key', max_retries=2, retry_backoff_factor=0,
+                                    backend_url='http://127.0.0.1:{}'.format(self.server.server_port))
+        self.addCleanup(self.client.close)
+
+    def test_get_is_retried(self):
+        self.assertEqual(self.client.get('single/p1').status_code, 503)
+        self.assertEqual(self.server.hits, {'GET': 3})
+
+    def test_post_is_sent_once(self):
+        self.assertEqual(self.client.post('single', data='{}').status_code, 503)
+        self.assertEqual(self.server.hits, {'POST': 1})
+
+    def test_connection_is_kept_alive(self):
+        for _ in range(3):
+            self.client.post('single', data='{}')
+        self.assertEqual(self.server.hits, {'POST': 3})
+        self.assertEqual(len(self.server.ports), 1)
+
+
+@override_settings(EASYPAY_ACCOUNT_ID='acc', EASYPAY_API_KEY='key')
+class DefaultClientTests(SimpleTestCase):
+
+    def tearDown(self):
+        close_default_client()
+
+    def test_session_is_reused(self):
+        client = get_default_client()
+        self.assertIs(get_default_client(), client)
+        self.assertIs(get_default_client().session, client.session)
+
+    def test_settings_change_builds_a_new_client(self):
+        client = get_default_client()
+        with override_settings(EASYPAY_API_KEY='other'):
+            self.assertIsNot(get_default_client(), client)
+            self.assertEqual(get_default_client().api_key, 'other')
+
+    def test_invalid_credentials(self):
+        with override_settings(EASYPAY_API_KEY=None), self.assertRaises(ValueError):
+            get_default_client()
+
+
+def load_account(account_id):
+    return {'loaded': {'api_key': 'loaded-key'}, 'bad': {'api_key': 1}}.get(account_id)
+
+
+@override_settings(EASYPAY_ACCOUNTS={'m1': 'key-1', 'm2': {'api_key': 'key-2', 'read_timeout': 5}, 'm3': 'key-3'},
+                   EASYPAY_ACCOUNT_LOADER='easypay.tests.test_client.load_account')
+class AccountClientTests(SimpleTestCase):
+
+    def test_account_credentials(self):
+        self.assertEqual(account_credentials('m1'), {'account_id': 'm1', 'api_key': 'key-1'})
+        self.assertEqual(account_credentials('m2'), {'account_id': 'm2', 'api_key': 'key-2', 'read_timeout': 5})
+        self.assertEqual(account_credentials('loaded'), {'account_id': 'loaded', 'api_key': 'loaded-key'})
+
+    def test_missing_or_invalid_credentials(self):
+        for account_id in ('unknown', 'bad'):
+            with self.assertRaises(ValueError):
+                account_credentials(account_id)
+        with override_settings(EASYPAY_ACCOUNT_LOADER=None), self.assertRaises(ValueError):
+            account_credentials('loaded')
+
+    def test_least_recently_used_client_is_closed(self):
+        registry = ClientRegistry(maxsize=2)
+        with mock.patch.object(EasypayClient, 'close', autospec=True) as close:
+            m1, m2 = registry.get('m1'), registry.get('m2')
+            self.assertIs(registry.get('m1'), m1)
+            self.assertEqual(m2.timeout[1], 5)
+            registry.get('m3')
+            close.assert_called_once_with(m2)
+            self.assertIsNot(registry.get('m2'), m2)
+            self.assertEqual(close.call_args[0], (m1,))
+            registry.clear()
+        self.assertEqual(close.call_count, 4)
+
+    def test_get_client(self):
+        self.assertIs(get_client(), get_default_client())
+        self.assertIs(get_client('acc'), get_default_client())
+        self.assertIs(get_client('m1'), get_registry().get('m1'))
+        self.assertEqual(get_client('m1').api_key, 'key-1')
+        with override_settings(EASYPAY_ACCOUNTS={'m1': 'other'}):
+            self.assertEqual(get_client('m1').api_key, 'other')
+        get_registry().clear()
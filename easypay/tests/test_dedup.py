@@ -0,0 +1,76 @@
+import json
+
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import signals
+from ..api import GenericNotification
+from ..dedup import forget_notification, process_once, register_notification
+from ..models import QueuedNotification
+from ..notification_queue import claim_notifications, enqueue_notification, process_notification
+from .utils import generic_body
+
+
+@override_settings(EASYPAY_NOTIFICATION_DEDUP=True, ROOT_URLCONF='easypay.urls')
+class DedupTests(TestCase):
+
+    def test_register_and_forget(self):
+        notification = GenericNotification(generic_body())
+        self.assertTrue(register_notification(notification))
+        self.assertFalse(register_notification(GenericNotification(generic_body())))
+        forget_notification(notification)
+        self.assertTrue(register_notification(notification))
+        self.assertTrue(register_notification(GenericNotification(generic_body(status='failed'))))
+
+    def test_process_once(self):
+        notification = GenericNotification(generic_body())
+        with self.assertRaises(RuntimeError), process_once(notification) as first:
+            self.assertTrue(first)
+            raise RuntimeError('processing failed')
+        with process_once(notification) as first:
+            self.assertTrue(first)
+        with process_once(notification) as first:
+            self.assertFalse(first)
+
+    @override_settings(EASYPAY_NOTIFICATION_DEDUP=False)
+    def test_disabled(self):
+        for _ in range(2):
+            with process_once(GenericNotification(generic_body())) as first:
+                self.assertTrue(first)
+
+    def test_retry_after_receiver_failure_is_processed(self):
+        calls = []
+
+        def receiver(notification, **kwargs):
+            calls.append(notification.id)
+            if len(calls) == 1:
+                raise RuntimeError('receiver failed')
+
+        signals.generic_notification.connect(receiver)
+        self.addCleanup(signals.generic_notification.disconnect, receiver)
+        client = Client()
+        body = json.dumps(generic_body())
+        with self.assertRaises(RuntimeError):
+            client.post(reverse('generic_notification'), body, content_type='application/json')
+        self.assertEqual(client.post(reverse('generic_notification'), body,
+                                     content_type='application/json').status_code, 200)
+        self.assertEqual(client.post(reverse('generic_notification'), body,
+                                     content_type='application/json').status_code, 200)
+        self.assertEqual(calls, ['p1', 'p1'])
+
+    def test_failed_queued_notification_is_retried(self):
+        calls = []
+
+        def receiver(notification, **kwargs):
+            calls.append(notification.id)
+            if len(calls) == 1:
+                raise RuntimeError('receiver failed')
+
+        signals.generic_notification.connect(receiver)
+        self.addCleanup(signals.generic_notification.disconnect, receiver)
+        enqueue_notification(QueuedNotification.KIND_GENERIC, json.dumps(generic_body()).encode())
+        self.assertFalse(process_notification(claim_notifications(10)[0]))
+        QueuedNotification.objects.update(next_attempt_at=timezone.now())
+        self.assertTrue(process_notification(claim_notifications(10)[0]))
+        self.assertEqual(calls, ['p1', 'p1'])
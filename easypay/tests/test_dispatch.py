@@ -0,0 +1,103 @@
+import asyncio
+import threading
+
+from django.dispatch import Signal
+from django.test import SimpleTestCase, override_settings
+
+from .. import dispatch, signals
+from ..dispatch import Dispatcher, _live_receivers
+
+
+class DispatcherTests(SimpleTestCase):
+
+    def setUp(self):
+        self.dispatcher = Dispatcher(workers=2, timeout=0.05)
+        self.addCleanup(self.dispatcher.executor.shutdown)
+
+    def test_live_receivers_follow_the_sender(self):
+        signal = Signal()
+
+        def receiver(**kwargs):
+            pass
+
+        def other_receiver(**kwargs):
+            pass
+
+        signal.connect(receiver)
+        signal.connect(other_receiver, sender='other')
+        self.assertEqual(_live_receivers(signal, 'sender'), [receiver])
+        self.assertEqual(_live_receivers(signal, 'other'), [receiver, other_receiver])
+        self.assertEqual(_live_receivers(Signal(), 'sender'), [])
+
+    def test_receivers_run_off_the_calling_thread(self):
+        signal = Signal()
+        threads = []
+        done = threading.Event()
+
+        def receiver(sender, value, **kwargs):
+            threads.append((threading.current_thread(), sender, value))
+            done.set()
+
+        signal.connect(receiver)
+        self.dispatcher.send(signal, 'test', 'sender', value=1)
+        self.assertTrue(done.wait(5))
+        thread, sender, value = threads[0]
+        self.assertIsNot(thread, threading.current_thread())
+        self.assertEqual((sender, value), ('sender', 1))
+
+    def test_failing_receiver_is_logged(self):
+        with self.assertLogs('easypay.dispatch', 'ERROR') as logs:
+            self.dispatcher.call_now(lambda **kwargs: 1 / 0, 'test')
+        self.assertIn('ZeroDivisionError', logs.output[0])
+
+    def test_slow_sync_receiver_is_logged(self):
+        with self.assertLogs('easypay.dispatch', 'WARNING') as logs:
+            self.dispatcher.call_now(lambda **kwargs: threading.Event().wait(0.1), 'test')
+        self.assertIn('over the 0.05s timeout', logs.output[0])
+
+    def test_slow_coroutine_receiver_is_cancelled(self):
+        finished = []
+
+        async def receiver(**kwargs):
+            await asyncio.sleep(1)
+            finished.append(True)
+
+        with self.assertLogs('easypay.dispatch', 'WARNING') as logs:
+            self.dispatcher.call_now(receiver, 'test')
+        self.assertIn('cancelled after 0.05s', logs.output[0])
+        self.assertEqual(finished, [])
+
+
+class BatchDispatchTests(SimpleTestCase):
+
+    def test_sync_flush_delivers_after_pool_shutdown(self):
+        delivered = []
+
+        def receiver(notifications, **kwargs):
+            delivered.append((threading.current_thread(), notifications))
+
+        dispatch.connect_batch(signals.generic_notification, receiver, batch_size=10, interval=60)
+        self.addCleanup(dispatch.disconnect_batch, signals.generic_notification, receiver)
+        self.addCleanup(dispatch._reset_dispatcher)
+        dispatch.send(signals.generic_notification, 'generic_notification', sender=None, notification='n1')
+        dispatch.get_dispatcher().executor.shutdown()
+
+        dispatch.flush_batches(sync=True)
+        self.assertEqual(delivered, [(threading.current_thread(), ['n1'])])
+
+    @override_settings(EASYPAY_SIGNAL_DISPATCH='sync')
+    def test_full_batch_is_delivered(self):
+        delivered = []
+        done = threading.Event()
+
+        def receiver(notifications, **kwargs):
+            delivered.append(notifications)
+            done.set()
+
+        dispatch.connect_batch(signals.generic_notification, receiver, batch_size=2, interval=60)
+        self.addCleanup(dispatch.disconnect_batch, signals.generic_notification, receiver)
+        for notification in ('n1', 'n2', 'n3'):
+            dispatch.send(signals.generic_notification, 'generic_notification', sender=None,
+                          notification=notification)
+        self.assertTrue(done.wait(5))
+        self.assertEqual(delivered, [['n1', 'n2']])
@@ -0,0 +1,70 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .. import transaction
+from .utils import PAYMENT_MODEL, api_exception, get_payment_model, payment_response, requires_payments
+
+
+class SinglePaymentTests(TestCase):
+
+    @override_settings(EASYPAY_PERSIST_TRANSACTIONS_CLASS=None)
+    def test_expiration_time_is_sent_as_given(self):
+        with mock.patch('easypay.transaction.api_single_payment', return_value=payment_response()) as api:
+            transaction.single_payment(10, method='mbw', expiration_time='2030-01-01 10:00:00')
+        self.assertEqual(api.call_args[1]['expiration_time'], '2030-01-01 10:00:00')
+
+    @requires_payments
+    @override_settings(EASYPAY_PERSIST_TRANSACTIONS_CLASS=PAYMENT_MODEL)
+    def test_unparseable_expiration_time_is_not_stored(self):
+        with mock.patch('easypay.transaction.api_single_payment', return_value=payment_response()), \
+                self.assertLogs('easypay.transaction', 'WARNING'):
+            payment_record = transaction.single_payment_db(10, method='mbw', expiration_time='soon')[1]
+        self.assertIsNone(payment_record.expiration_time)
+        with mock.patch('easypay.transaction.api_single_payment', return_value=payment_response('p2')):
+            payment_record = transaction.single_payment_db(10, method='mbw', expiration_time='2030-01-01 10:00')[1]
+        self.assertEqual(payment_record.expiration_time.minute, 0)
+
+
+@requires_payments
+@override_settings(EASYPAY_PERSIST_TRANSACTIONS_CLASS=PAYMENT_MODEL)
+class ExpirePaymentsTests(TestCase):
+
+    def setUp(self):
+        Payment = get_payment_model()
+        now = timezone.now()
+        # p0 to p3 expired long ago, all with the same expiration_time, p4 a minute ago, p5 not yet
+        self.payments = [Payment.objects.create(easypay_id='p{}'.format(i), status='pending',
+                                                expiration_time=now - timedelta(days=1)) for i in range(4)]
+        Payment.objects.create(easypay_id='p4', status='pending', expiration_time=now - timedelta(minutes=1))
+        Payment.objects.create(easypay_id='p5', status='pending', expiration_time=now + timedelta(days=1))
+
+    def expire(self, get_payments):
+        get_payments = mock.Mock(side_effect=get_payments)
+        with mock.patch('easypay.management.commands.easypay_expire_payments.get_payments', get_payments):
+            call_command('easypay_expire_payments', batch_size=2, confirm_window=3600, stdout=mock.Mock(),
+                         stderr=mock.Mock())
+        return [id for call in get_payments.call_args_list for id in call[0][0]]
+
+    def statuses(self):
+        return dict(get_payment_model().objects.values_list('easypay_id', 'status'))
+
+    def test_expired_payments_are_marked(self):
+        self.assertEqual(self.expire(lambda ids, **kwargs: [payment_response(id, 'paid') for id in ids]), ['p4'])
+        self.assertEqual(self.statuses(), {'p0': 'expired', 'p1': 'expired', 'p2': 'expired', 'p3': 'expired',
+                                           'p4': 'paid', 'p5': 'pending'})
+
+    def test_failed_confirmations_are_read_once(self):
+        self.assertEqual(self.expire(lambda ids, **kwargs: [api_exception(503) for id in ids]), ['p4'])
+        self.assertEqual(self.statuses()['p4'], 'pending')
+
+    def test_notification_updates_are_kept(self):
+        def get_payments(ids, **kwargs):
+            get_payment_model().objects.filter(easypay_id='p4').update(status='paid')
+            return [payment_response(id) for id in ids]
+
+        self.expire(get_payments)
+        self.assertEqual(self.statuses()['p4'], 'paid')
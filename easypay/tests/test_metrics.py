@@ -0,0 +1,83 @@
+from unittest import mock
+
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from .. import views
+from ..metrics import NoOpMetrics, PrometheusMetrics, get_metrics
+
+
+class NoOpMetricsTests(SimpleTestCase):
+
+    def test_timer_observes_the_block_with_late_labels(self):
+        backend = NoOpMetrics()
+        with mock.patch.object(backend, 'observe') as observe:
+            with backend.timer('easypay_test_seconds', view='v') as labels:
+                labels['status'] = 200
+        name, seconds = observe.call_args[0]
+        self.assertEqual(name, 'easypay_test_seconds')
+        self.assertGreaterEqual(seconds, 0)
+        self.assertEqual(observe.call_args[1], {'view': 'v', 'status': 200})
+
+    def test_timer_observes_failed_blocks(self):
+        backend = NoOpMetrics()
+        with mock.patch.object(backend, 'observe') as observe:
+            with self.assertRaises(RuntimeError), backend.timer('easypay_test_seconds') as labels:
+                labels['status'] = 'error'
+                raise RuntimeError
+        self.assertEqual(observe.call_args[1], {'status': 'error'})
+
+
+class PrometheusMetricsTests(SimpleTestCase):
+
+    def test_render_counters(self):
+        backend = PrometheusMetrics()
+        backend.increment('easypay_test_total', result='hits')
+        backend.increment('easypay_test_total', 2, result='hits')
+        backend.increment('easypay_test_total', result='misses')
+        self.assertEqual(backend.render(), '# TYPE easypay_test_total counter\n'
+                                           'easypay_test_total{result="hits"} 3\n'
+                                           'easypay_test_total{result="misses"} 1\n')
+
+    def test_render_histograms(self):
+        backend = PrometheusMetrics(buckets=(0.1, 1))
+        for seconds in (0.05, 0.1, 0.5, 5):
+            backend.observe('easypay_test_seconds', seconds, endpoint='single')
+        self.assertEqual(backend.render().splitlines(), [
+            '# TYPE easypay_test_seconds histogram',
+            'easypay_test_seconds_bucket{endpoint="single",le="0.1"} 2',
+            'easypay_test_seconds_bucket{endpoint="single",le="1"} 3',
+            'easypay_test_seconds_bucket{endpoint="single",le="+Inf"} 4',
+            'easypay_test_seconds_sum{endpoint="single"} 5.65',
+            'easypay_test_seconds_count{endpoint="single"} 4',
+        ])
+
+    def test_label_values_are_escaped(self):
+        backend = PrometheusMetrics()
+        backend.increment('easypay_test_total', view='a"b\\c')
+        self.assertIn('easypay_test_total{view="a\\"b\\\\c"} 1', backend.render())
+
+
+class MetricsViewTests(SimpleTestCase):
+
+    def test_noop_backend_has_no_metrics(self):
+        with self.assertRaises(Http404):
+            views.metrics(RequestFactory().get('/metrics'))
+
+    @override_settings(EASYPAY_METRICS_BACKEND='easypay.metrics.PrometheusMetrics')
+    def test_prometheus_backend(self):
+        backend = get_metrics()
+        self.assertIsInstance(backend, PrometheusMetrics)
+        self.assertIs(get_metrics(), backend)
+        backend.increment('easypay_test_total')
+
+        response = views.metrics(RequestFactory().get('/metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn(b'easypay_test_total 1', response.content)
+
+    def test_backend_follows_the_setting(self):
+        self.assertIsInstance(get_metrics(), NoOpMetrics)
+        with override_settings(EASYPAY_METRICS_BACKEND='easypay.metrics.PrometheusMetrics'):
+            self.assertIsInstance(get_metrics(), PrometheusMetrics)
+        self.assertNotIsInstance(get_metrics(), PrometheusMetrics)
@@ -0,0 +1,26 @@
+from django.test import TestCase, override_settings
+
+from .utils import PAYMENT_MODEL, get_payment_model, payment_response, requires_payments
+
+
+@requires_payments
+@override_settings(EASYPAY_PERSIST_TRANSACTIONS_CLASS=PAYMENT_MODEL)
+class PaymentStatusUpdateTests(TestCase):
+
+    def setUp(self):
+        self.payment = get_payment_model().objects.create(easypay_id='p1', status='pending', method_type='mb')
+
+    def test_update_status_is_conditional(self):
+        Payment = get_payment_model()
+        self.assertTrue(Payment.update_status_by_easypay_id('p1', 'active'))
+        self.assertFalse(Payment.update_status_by_easypay_id('p1', 'active'))
+        self.assertFalse(Payment.update_status_by_easypay_id('missing', 'active'))
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'active')
+
+    def test_update_status_is_a_single_query(self):
+        with self.assertNumQueries(1):
+            self.assertTrue(self.payment.update_status('active'))
+        self.assertEqual(self.payment.status, 'active')
+        with self.assertNumQueries(1):
+            self.assertFalse(self.payment.update(payment_response(status='active')))
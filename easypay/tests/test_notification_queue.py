@@ -0,0 +1,53 @@
+from datetime import timedelta
+import json
+from unittest import mock
+
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from ..models import QueuedNotification
+from ..notification_queue import claim_notifications, enqueue_notification, process_notification
+from .utils import generic_body
+
+
+class NotificationQueueTests(TestCase):
+
+    def setUp(self):
+        self.queued = enqueue_notification(QueuedNotification.KIND_GENERIC, json.dumps(generic_body()).encode())
+
+    def test_claimed_notifications_are_leased(self):
+        claimed = claim_notifications(10)
+        self.assertEqual([n.pk for n in claimed], [self.queued.pk])
+        self.assertEqual(claimed[0].attempts, 1)
+        self.assertEqual(claim_notifications(10), [])
+
+    @override_settings(EASYPAY_NOTIFICATION_QUEUE_RETRY_DELAY=30, EASYPAY_NOTIFICATION_QUEUE_MAX_ATTEMPTS=2)
+    def test_failures_are_retried_with_backoff_then_failed(self):
+        with mock.patch('easypay.views.process_generic_notification', side_effect=RuntimeError('boom')):
+            queued = claim_notifications(10)[0]
+            self.assertFalse(process_notification(queued))
+            queued.refresh_from_db()
+            self.assertEqual(queued.status, QueuedNotification.STATUS_PENDING)
+            self.assertEqual(queued.last_error, 'boom')
+            self.assertGreater(queued.next_attempt_at, timezone.now() + timedelta(seconds=25))
+
+            QueuedNotification.objects.filter(pk=queued.pk).update(next_attempt_at=timezone.now())
+            queued = claim_notifications(10)[0]
+            self.assertFalse(process_notification(queued))
+            queued.refresh_from_db()
+            self.assertEqual(queued.status, QueuedNotification.STATUS_FAILED)
+        self.assertEqual(claim_notifications(10), [])
+
+    def test_processed_notifications_are_removed(self):
+        self.assertTrue(process_notification(claim_notifications(10)[0]))
+        self.assertFalse(QueuedNotification.objects.exists())
+
+    @override_settings(EASYPAY_NOTIFICATION_QUEUE=True, ROOT_URLCONF='easypay.urls')
+    def test_webhook_stores_the_notification(self):
+        with mock.patch('easypay.views.process_generic_notification') as process_generic_notification:
+            response = Client().post(reverse('generic_notification'), json.dumps(generic_body('p2')),
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        process_generic_notification.assert_not_called()
+        self.assertEqual(QueuedNotification.objects.count(), 2)
@@ -0,0 +1,67 @@
+import json
+from unittest import mock
+
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from ..api import TransactionNotification, notification_method_status
+from .utils import PAYMENT_MODEL, get_payment_model, payment_response, requires_payments, transaction_body
+
+
+def deleted_status(notification):
+    return 'deleted'
+
+
+class NotificationStatusTests(SimpleTestCase):
+
+    def test_paid_capture_is_active(self):
+        self.assertEqual(notification_method_status(TransactionNotification(transaction_body())), 'active')
+
+    def test_ambiguous_transactions_fall_back_to_the_api(self):
+        for body in (transaction_body(paid=5), transaction_body(transaction_type='authorisation'),
+                     dict(transaction_body(), transaction={'type': 'capture'})):
+            self.assertIsNone(notification_method_status(TransactionNotification(body)))
+
+    def test_method_status_in_payload_wins(self):
+        body = dict(transaction_body(paid=0), method={'type': 'mb', 'status': 'deleted'})
+        self.assertEqual(notification_method_status(TransactionNotification(body)), 'deleted')
+
+
+@requires_payments
+@override_settings(EASYPAY_PERSIST_TRANSACTIONS_CLASS=PAYMENT_MODEL, EASYPAY_NOTIFICATION_UPDATE_POLICY='payload',
+                   ROOT_URLCONF='easypay.urls')
+class NotificationUpdatePolicyTests(TestCase):
+
+    def setUp(self):
+        self.payment = get_payment_model().objects.create(easypay_id='p1', status='pending', method_type='mb')
+
+    def test_payload_policy_skips_get_payment(self):
+        with mock.patch('easypay.views.get_payment') as get_payment:
+            response = Client().post(reverse('transaction_notification'), json.dumps(transaction_body()),
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        get_payment.assert_not_called()
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'active')
+
+    def test_payload_policy_falls_back_to_get_payment(self):
+        with mock.patch('easypay.views.get_payment', return_value=payment_response(status='active')) as get_payment:
+            Client().post(reverse('transaction_notification'), json.dumps(transaction_body(paid=5)),
+                          content_type='application/json')
+        get_payment.assert_called_once_with('p1', account='acc')
+
+    @override_settings(EASYPAY_NOTIFICATION_UPDATE_POLICY='api')
+    def test_api_policy_always_calls_get_payment(self):
+        with mock.patch('easypay.views.get_payment', return_value=payment_response(status='active')) as get_payment:
+            Client().post(reverse('transaction_notification'), json.dumps(transaction_body()),
+                          content_type='application/json')
+        get_payment.assert_called_once_with('p1', account='acc')
+
+    @override_settings(EASYPAY_NOTIFICATION_STATUS_RESOLVER='easypay.tests.test_notification_status.deleted_status')
+    def test_custom_resolver(self):
+        with mock.patch('easypay.views.get_payment') as get_payment:
+            Client().post(reverse('transaction_notification'), json.dumps(transaction_body()),
+                          content_type='application/json')
+        get_payment.assert_not_called()
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'deleted')
@@ -0,0 +1,127 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.db import transaction as db_transaction
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .. import transaction
+from ..api import EasypayApiException
+from ..models import PaymentOutbox
+from ..outbox import flush_outbox
+from .utils import PAYMENT_MODEL, api_exception, get_payment_model, payment_response, requires_payments
+
+
+@requires_payments
+@override_settings(EASYPAY_PERSIST_TRANSACTIONS_CLASS=PAYMENT_MODEL, EASYPAY_PAYMENT_OUTBOX=True,
+                   EASYPAY_PAYMENT_OUTBOX_FLUSH_DELAY=0, EASYPAY_PAYMENT_OUTBOX_PENDING_TIMEOUT=0)
+class OutboxTests(TransactionTestCase):
+
+    def single_payment(self, **api):
+        with mock.patch('easypay.transaction.api_single_payment', **api):
+            return transaction.single_payment_db(10, method='mb')
+
+    def test_saved_payment_leaves_no_entry(self):
+        payment_record = self.single_payment(return_value=payment_response())[1]
+        self.assertEqual(payment_record.easypay_id, 'p1')
+        self.assertFalse(PaymentOutbox.objects.exists())
+
+    def test_failed_save_is_flushed(self):
+        with mock.patch.object(get_payment_model(), 'save', side_effect=RuntimeError('db down')), \
+                self.assertLogs('easypay.outbox', 'ERROR'):
+            self.assertIsNone(self.single_payment(return_value=payment_response())[1])
+        entry = PaymentOutbox.objects.get()
+        self.assertEqual((entry.status, entry.easypay_id), (PaymentOutbox.STATUS_RECEIVED, 'p1'))
+
+        self.assertEqual(flush_outbox(), (1, 0, 0))
+        payment_record = get_payment_model().objects.get()
+        self.assertEqual((payment_record.easypay_id, payment_record.amount, payment_record.method_type),
+                         ('p1', 10, 'mb'))
+        self.assertFalse(PaymentOutbox.objects.exists())
+
+    def test_unknown_outcomes_are_kept_and_marked_unresolved(self):
+        for error in (TimeoutError('timeout'), api_exception(502)):
+            with self.assertRaises(type(error)), self.assertLogs('easypay.outbox', 'WARNING'):
+                self.single_payment(side_effect=error)
+        self.assertEqual(PaymentOutbox.objects.filter(status=PaymentOutbox.STATUS_PENDING).count(), 2)
+        with self.assertLogs('easypay.outbox', 'WARNING'):
+            self.assertEqual(flush_outbox(), (0, 0, 2))
+        self.assertEqual(PaymentOutbox.objects.filter(status=PaymentOutbox.STATUS_UNRESOLVED).count(), 2)
+
+    def test_refused_payment_is_discarded(self):
+        with self.assertRaises(EasypayApiException):
+            self.single_payment(side_effect=api_exception(400))
+        self.assertFalse(PaymentOutbox.objects.exists())
+
+    def test_entry_kept_until_the_caller_transaction_commits(self):
+        with self.assertLogs('easypay.outbox', 'WARNING'):
+            with self.assertRaises(RuntimeError), db_transaction.atomic():
+                self.single_payment(return_value=payment_response())
+                raise RuntimeError('rollback')
+        # journaled on the caller's connection, the entry rolled back with it
+        self.assertFalse(get_payment_model().objects.exists())
+        self.assertFalse(PaymentOutbox.objects.exists())
+
+        with self.assertLogs('easypay.outbox', 'WARNING'), db_transaction.atomic():
+            self.single_payment(return_value=payment_response('p2'))
+            self.assertTrue(PaymentOutbox.objects.exists())
+        self.assertFalse(PaymentOutbox.objects.exists())
+
+    def test_bulk_payments_are_journaled(self):
+        specs = [{'value': 10, 'method': 'mb', 'merchant_key': 'k{}'.format(i)} for i in range(3)]
+        responses = {'k0': payment_response('p0'), 'k1': api_exception(502), 'k2': api_exception(400)}
+
+        def api(*args, merchant_key, **kwargs):
+            response = responses[merchant_key]
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        with mock.patch('easypay.transaction.api_single_payment', side_effect=api), \
+                self.assertLogs('easypay.outbox', 'WARNING'):
+            results = transaction.bulk_single_payment(specs, max_concurrency=2)
+        self.assertEqual(results[0][1].easypay_id, 'p0')
+        self.assertEqual([type(result) for result in results[1:]], [EasypayApiException, EasypayApiException])
+        # the payment whose outcome is unknown stays journaled
+        entry = PaymentOutbox.objects.get()
+        self.assertEqual((entry.merchant_key, entry.status), ('k1', PaymentOutbox.STATUS_PENDING))
+        self.assertEqual(list(get_payment_model().objects.values_list('easypay_id', flat=True)), ['p0'])
+
+    def journal_received(self, count):
+        with mock.patch.object(get_payment_model(), 'save', side_effect=RuntimeError('db down')), \
+                self.assertLogs('easypay.outbox', 'ERROR'):
+            for i in range(count):
+                self.single_payment(return_value=payment_response('p{}'.format(i)))
+        return list(PaymentOutbox.objects.order_by('created_at', 'pk'))
+
+    @override_settings(EASYPAY_PAYMENT_OUTBOX_RETRY_BACKOFF=60, EASYPAY_PAYMENT_OUTBOX_RETRY_BACKOFF_MAX=100)
+    def test_failing_entry_backs_off(self):
+        entry = self.journal_received(1)[0]
+        PaymentOutbox.objects.filter(pk=entry.pk).update(response=b'not json')
+        for attempts, backoff in ((1, 60), (2, 100)):
+            with self.assertLogs('easypay.outbox', 'ERROR'):
+                self.assertEqual(flush_outbox(), (0, 1, 0))
+            entry.refresh_from_db()
+            self.assertEqual(entry.attempts, attempts)
+            self.assertAlmostEqual((entry.next_attempt_at - timezone.now()).total_seconds(), backoff, delta=5)
+            # skipped until its next attempt
+            self.assertEqual(flush_outbox(), (0, 0, 0))
+            PaymentOutbox.objects.filter(pk=entry.pk).update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+
+    def test_failing_entries_do_not_block_the_others(self):
+        first, *others = self.journal_received(3)
+        PaymentOutbox.objects.filter(pk=first.pk).update(response=b'not json')
+        with self.assertLogs('easypay.outbox', 'ERROR'):
+            self.assertEqual(flush_outbox(batch_size=1), (0, 1, 0))
+        self.assertEqual(flush_outbox(batch_size=1), (1, 0, 0))
+        self.assertEqual(flush_outbox(batch_size=1), (1, 0, 0))
+        self.assertEqual(list(PaymentOutbox.objects.all()), [first])
+
+    def test_failed_insert_is_retried_later(self):
+        self.journal_received(2)
+        with mock.patch.object(get_payment_model().objects, 'bulk_create', side_effect=RuntimeError('db down')), \
+                self.assertLogs('easypay.outbox', 'WARNING'):
+            self.assertEqual(flush_outbox(), (0, 2, 0))
+        self.assertEqual(set(PaymentOutbox.objects.values_list('attempts', 'last_error')), {(1, 'db down')})
+        PaymentOutbox.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(flush_outbox(), (2, 0, 0))
@@ -0,0 +1,88 @@
+import json
+import logging
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from ..api import GenericNotification
+from ..payload_logging import REDACTED, LazyPayload, log_payload, redact
+from .utils import generic_body
+
+
+class RedactTests(SimpleTestCase):
+
+    def test_keys_are_masked_at_any_depth(self):
+        data = {'id': 'p1', 'customer': {'Name': 'John', 'EMAIL': 'john@example.com', 'phone': ''},
+                'items': [{'fiscal_number': 'PT1', 'value': 10}]}
+        self.assertEqual(redact(data), {'id': 'p1', 'customer': {'Name': REDACTED, 'EMAIL': REDACTED, 'phone': ''},
+                                        'items': [{'fiscal_number': REDACTED, 'value': 10}]})
+        self.assertEqual(data['customer']['Name'], 'John')
+
+    def test_custom_fields(self):
+        self.assertEqual(redact({'name': 'John', 'key': 'k'}, fields={'key'}), {'name': 'John', 'key': REDACTED})
+
+    @override_settings(EASYPAY_PAYLOAD_LOG_REDACT_FIELDS=['Reference'])
+    def test_fields_setting(self):
+        self.assertEqual(redact({'reference': 'r', 'name': 'John'}), {'reference': REDACTED, 'name': 'John'})
+
+
+class LazyPayloadTests(SimpleTestCase):
+
+    def test_json_body(self):
+        self.assertEqual(LazyPayload(b'{"id": "p1", "name": "John"}').to_data(), {'id': 'p1', 'name': REDACTED})
+
+    def test_latin1_body(self):
+        body = json.dumps({'id': 'p\xe9'}, ensure_ascii=False).encode('latin-1')
+        self.assertEqual(LazyPayload(body, 'latin-1').to_data(), {'id': 'p\xe9'})
+
+    def test_form_body(self):
+        self.assertEqual(LazyPayload(b'Reference=r1&Name=John').to_data(), {'Reference': 'r1', 'Name': REDACTED})
+
+    def test_unknown_charset_falls_back_to_the_size(self):
+        self.assertEqual(LazyPayload(b'{"id": "p1"}', 'bogus').to_data(), '<12 bytes>')
+        self.assertEqual(str(LazyPayload(b'{"id": "p1"}', 'bogus')), '"<12 bytes>"')
+
+    def test_api_objects(self):
+        data = LazyPayload(GenericNotification(generic_body())).to_data()
+        self.assertEqual((data['id'], data['type'], data['status']), ('p1', 'capture', 'success'))
+
+
+class LogPayloadTests(SimpleTestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger('easypay.tests.payload')
+
+    def test_payload_is_formatted_into_the_message(self):
+        with self.assertLogs(self.logger, 'INFO') as logs:
+            log_payload(self.logger, 'Incoming', b'{"name": "John"}')
+        self.assertEqual(logs.output, ['INFO:easypay.tests.payload:Incoming: \n{"name": "***"}'])
+
+    def test_disabled_level_does_not_serialize(self):
+        with mock.patch('easypay.payload_logging.LazyPayload') as lazy_payload, self.assertLogs(self.logger, 'INFO'):
+            log_payload(self.logger, 'Incoming', b'{}', level=logging.DEBUG)
+            self.logger.info('keeps assertLogs happy')
+        lazy_payload.assert_not_called()
+
+    @override_settings(EASYPAY_PAYLOAD_LOG_SAMPLE_RATE=0.25)
+    def test_sample_rate(self):
+        with self.assertLogs(self.logger, 'INFO') as logs:
+            for draw in (0.1, 0.24, 0.25, 0.9):
+                with mock.patch('easypay.payload_logging.random.random', return_value=draw):
+                    log_payload(self.logger, 'draw {}'.format(draw), b'{}')
+        self.assertEqual([record.getMessage().split(':')[0] for record in logs.records], ['draw 0.1', 'draw 0.24'])
+
+    @override_settings(EASYPAY_PAYLOAD_LOG_SAMPLE_RATE=0)
+    def test_sample_rate_zero(self):
+        with mock.patch.object(self.logger, 'log') as log:
+            log_payload(self.logger, 'Incoming', b'{}')
+        log.assert_not_called()
+
+    @override_settings(EASYPAY_STRUCTURED_LOGGING=True)
+    def test_structured_extra(self):
+        with self.assertLogs(self.logger, 'INFO') as logs:
+            log_payload(self.logger, 'Incoming', b'{"id": "p1", "email": "john@example.com"}', view='notify')
+        record = logs.records[0]
+        self.assertEqual(record.getMessage(), 'Incoming')
+        self.assertEqual(record.easypay['view'], 'notify')
+        self.assertIsInstance(record.easypay['payload'], LazyPayload)
+        self.assertEqual(record.easypay['payload'].to_data(), {'id': 'p1', 'email': REDACTED})
@@ -0,0 +1,147 @@
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from .. import payment_cache
+from ..payment_cache import get_payment, invalidate_payment, notification_received
+from .utils import payment_response
+
+
+class CountingCall(payment_cache._Call):
+    """_Call counting the lookups waiting for the leader's result"""
+    waiting = 0
+    lock = threading.Lock()
+
+    def __init__(self):
+        super().__init__()
+        wait = self.event.wait
+
+        def counting_wait(*args):
+            with CountingCall.lock:
+                CountingCall.waiting += 1
+            return wait(*args)
+        self.event.wait = counting_wait
+
+
+class SingleFlightTests(SimpleTestCase):
+
+    def setUp(self):
+        CountingCall.waiting = 0
+        self.release = threading.Event()
+        patcher = mock.patch.object(payment_cache, '_Call', CountingCall)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def lookup_concurrently(self, api_get_payment, followers=4):
+        results = []
+
+        def lookup():
+            try:
+                results.append(get_payment('p1'))
+            except Exception as e:
+                results.append(e)
+
+        with mock.patch('easypay.payment_cache.api_get_payment', side_effect=api_get_payment) as api:
+            threads = [threading.Thread(target=lookup) for _ in range(followers + 1)]
+            threads[0].start()
+            self.assertTrue(self.entered.wait(5))
+            for thread in threads[1:]:
+                thread.start()
+            deadline = time.monotonic() + 5
+            while CountingCall.waiting < followers and time.monotonic() < deadline:
+                time.sleep(0.001)
+            self.release.set()
+            for thread in threads:
+                thread.join(5)
+        self.assertFalse(payment_cache._in_flight)
+        return api, results
+
+    def blocking(self, result):
+        self.entered = threading.Event()
+
+        def api_get_payment(id, **kwargs):
+            self.entered.set()
+            self.release.wait(5)
+            if isinstance(result, Exception):
+                raise result
+            return result
+        return api_get_payment
+
+    def test_concurrent_lookups_share_one_call(self):
+        expected = payment_response()
+        api, results = self.lookup_concurrently(self.blocking(expected))
+        self.assertEqual(api.call_count, 1)
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(result is expected for result in results))
+
+    def test_error_reaches_every_waiting_lookup(self):
+        error = RuntimeError('api down')
+        api, results = self.lookup_concurrently(self.blocking(error))
+        self.assertEqual(api.call_count, 1)
+        self.assertEqual(results, [error] * 5)
+
+        # the failed call is not remembered
+        with mock.patch('easypay.payment_cache.api_get_payment', return_value=payment_response()) as api:
+            self.assertEqual(get_payment('p1').id, 'p1')
+        api.assert_called_once_with('p1', client=None, account=None)
+
+
+@override_settings(EASYPAY_PAYMENT_CACHE_TTL=60, EASYPAY_ACCOUNT_ID='acc')
+class PaymentCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        patcher = mock.patch('easypay.payment_cache.api_get_payment',
+                             side_effect=lambda id, **kwargs: payment_response(id))
+        self.api = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_results_are_cached_for_the_ttl(self):
+        now = time.time()
+        with mock.patch('time.time', return_value=now):
+            get_payment('p1')
+            get_payment('p1')
+        self.assertEqual(self.api.call_count, 1)
+        with mock.patch('time.time', return_value=now + 61):
+            get_payment('p1')
+        self.assertEqual(self.api.call_count, 2)
+
+    @override_settings(EASYPAY_PAYMENT_CACHE_TTL=0)
+    def test_ttl_zero_disables_the_cache(self):
+        get_payment('p1')
+        get_payment('p1')
+        self.assertEqual(self.api.call_count, 2)
+
+    def test_accounts_are_cached_apart(self):
+        get_payment('p1')
+        get_payment('p1', account='acc')
+        get_payment('p1', account='other')
+        self.assertEqual(self.api.call_count, 2)
+
+    def test_invalidate_payment(self):
+        get_payment('p1')
+        invalidate_payment('p1')
+        get_payment('p1')
+        self.assertEqual(self.api.call_count, 2)
+
+    def test_only_newer_notifications_invalidate(self):
+        notification_received('p1', '2020-01-01 10:00:00')
+        get_payment('p1')
+        for date in ('2020-01-01 10:00:00', '2020-01-01 09:59:59'):
+            notification_received('p1', date)
+            get_payment('p1')
+        self.assertEqual(self.api.call_count, 1)
+
+        notification_received('p1', '2020-01-01 10:00:01')
+        get_payment('p1')
+        self.assertEqual(self.api.call_count, 2)
+
+    def test_undated_notifications_invalidate(self):
+        notification_received('p1', '2020-01-01 10:00:00')
+        get_payment('p1')
+        notification_received('p1', None)
+        get_payment('p1')
+        self.assertEqual(self.api.call_count, 2)
@@ -0,0 +1,41 @@
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from .utils import PAYMENT_MODEL, get_payment_model, payment_response, requires_payments
+
+
+@requires_payments
+@override_settings(EASYPAY_PERSIST_TRANSACTIONS_CLASS=PAYMENT_MODEL)
+class ReconcileTests(TestCase):
+
+    def setUp(self):
+        Payment = get_payment_model()
+        self.payments = [Payment.objects.create(easypay_id='p{}'.format(i), status='pending') for i in range(5)]
+        self.checkpoint = os.path.join(tempfile.mkdtemp(), 'checkpoint.json')
+        self.addCleanup(lambda: os.path.exists(self.checkpoint) and os.remove(self.checkpoint))
+
+    def reconcile(self, status='pending'):
+        get_payments = mock.Mock(side_effect=lambda ids, **kwargs: [payment_response(id, status) for id in ids])
+        with mock.patch('easypay.management.commands.easypay_reconcile.get_payments', get_payments):
+            call_command('easypay_reconcile', chunk_size=2, checkpoint=self.checkpoint, stdout=mock.Mock())
+        return [id for call in get_payments.call_args_list for id in call[0][0]]
+
+    def test_checkpoint_is_removed_after_a_full_sweep(self):
+        self.assertEqual(len(self.reconcile()), 5)
+        self.assertFalse(os.path.exists(self.checkpoint))
+        self.assertEqual(len(self.reconcile()), 5)
+
+    def test_updated_rows_are_checked_once(self):
+        self.assertEqual(self.reconcile('active'), ['p{}'.format(i) for i in range(5)])
+        self.assertEqual(set(get_payment_model().objects.values_list('status', flat=True)), {'active'})
+        self.assertEqual(self.reconcile('active'), [])
+
+    def test_interrupted_sweep_resumes_from_the_checkpoint(self):
+        with open(self.checkpoint, 'w') as f:
+            json.dump({'last_pk': self.payments[2].pk}, f)
+        self.assertEqual(self.reconcile(), ['p3', 'p4'])
@@ -0,0 +1,61 @@
+import json
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from ..management.commands.easypay_replay import Command
+from ..metrics import percentile
+from .utils import PAYMENT_MODEL, api_exception, get_payment_model, payment_response, requires_payments
+
+
+@override_settings(ROOT_URLCONF='easypay.urls', EASYPAY_PERSIST_TRANSACTIONS_CLASS=None)
+class ReplayTests(SimpleTestCase):
+
+    def replay(self, *args):
+        stdout = StringIO()
+        call_command('easypay_replay', *args, '--json', stdout=stdout)
+        return json.loads(stdout.getvalue())
+
+    @override_settings(ALLOWED_HOSTS=['*.internal', '.example.com'], DEBUG=False)
+    def test_in_process_requests_pass_host_validation(self):
+        self.assertEqual(Command.client_host(), 'example.com')
+        with mock.patch('easypay.signals.mbway_notification.send'):
+            report = self.replay('--synthetic', 'mbway', '--count', '6', '--payments', '2', '--concurrency', '2')
+        self.assertEqual((report['notifications'], report['errors'], report['statuses']), (6, 0, {'200': 6}))
+
+    @override_settings(ALLOWED_HOSTS=['*'])
+    def test_wildcard_hosts(self):
+        self.assertEqual(Command.client_host(), 'localhost')
+
+    def test_duplicates_are_added(self):
+        with mock.patch('easypay.signals.mbway_notification.send') as send:
+            report = self.replay('--synthetic', 'mbway', '--count', '10', '--duplicates', '1', '--seed', '1')
+        self.assertEqual((report['notifications'], send.call_count), (20, 20))
+
+    def test_system_checks_are_not_overridden(self):
+        self.assertIs(Command.check, BaseCommand.check)
+        self.assertEqual(Command().check(display_num_errors=False), None)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual([percentile(values, f) for f in (0, 0.5, 0.99, 1)], [1, 50, 99, 100])
+        self.assertIsNone(percentile([], 0.5))
+
+
+@requires_payments
+@override_settings(EASYPAY_PERSIST_TRANSACTIONS_CLASS=PAYMENT_MODEL)
+class CheckConvergenceTests(TestCase):
+
+    def test_persisted_status_is_compared(self):
+        Payment = get_payment_model()
+        for id in ('p1', 'p2', 'p3'):
+            Payment.objects.create(easypay_id=id, status='paid')
+        deliveries = [('transaction', {'id': id}) for id in ('p1', 'p2', 'p3', 'p4')] + [('mbway', {'id': 'p5'})]
+        responses = [payment_response('p1', 'paid'), payment_response('p2', 'pending'), api_exception(503)]
+        with mock.patch('easypay.management.commands.easypay_replay.get_payments', return_value=responses):
+            result = Command().check_convergence(deliveries)
+        self.assertEqual(result, {'payments': 4, 'converged': 1, 'missing': 1, 'failed': 1,
+                                  'diverged': [{'id': 'p2', 'persisted': 'paid', 'easypay': 'pending'}]})
@@ -0,0 +1,49 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from .. import settings
+
+
+class SettingsTests(SimpleTestCase):
+
+    def on_change(self, *names):
+        callback = mock.Mock()
+        settings.on_change(*names)(callback)
+        self.addCleanup(settings._callbacks.remove, (frozenset(names), callback))
+        return callback
+
+    def test_override_settings_reloads(self):
+        self.assertEqual(settings.POOL_MAXSIZE, 10)
+        with override_settings(EASYPAY_POOL_MAXSIZE=3):
+            self.assertEqual(settings.POOL_MAXSIZE, 3)
+        self.assertEqual(settings.POOL_MAXSIZE, 10)
+
+    def test_same_as_default(self):
+        with override_settings(EASYPAY_POOL_MAXSIZE=3):
+            self.assertEqual(settings.BULK_MAX_CONCURRENCY, 3)
+            with override_settings(EASYPAY_BULK_MAX_CONCURRENCY=5):
+                self.assertEqual(settings.BULK_MAX_CONCURRENCY, 5)
+
+    def test_on_change_callbacks(self):
+        pool_callback = self.on_change('POOL_MAXSIZE', 'POOL_CONNECTIONS')
+        any_callback = self.on_change()
+        with override_settings(EASYPAY_PAYMENT_CACHE_TTL=1):
+            pass
+        self.assertEqual((pool_callback.call_count, any_callback.call_count), (0, 2))
+        with override_settings(EASYPAY_POOL_MAXSIZE=3):
+            pool_callback.assert_called_once_with()
+        self.assertEqual((pool_callback.call_count, any_callback.call_count), (2, 4))
+
+    def test_other_settings_are_ignored(self):
+        any_callback = self.on_change()
+        settings.POOL_MAXSIZE
+        with override_settings(POOL_MAXSIZE=3):
+            self.assertIn('POOL_MAXSIZE', vars(settings))
+        any_callback.assert_not_called()
+
+    def test_unknown_name(self):
+        with self.assertRaises(AttributeError):
+            settings.NOT_A_SETTING
+        with override_settings(EASYPAY_NOT_A_SETTING=1), self.assertRaises(AttributeError):
+            settings.NOT_A_SETTING
@@ -0,0 +1,79 @@
+from unittest import mock
+
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from ..views import build_handlers, get_handlers
+
+
+@override_settings(ROOT_URLCONF='easypay.urls')
+class WebhookViewTests(TestCase):
+
+    @override_settings(EASYPAY_NOTIFICATION_CODE_AUTHORISATION='secret')
+    def test_auth_code(self):
+        url = reverse('authorisation_notification')
+        with self.assertLogs('easypay.views', 'WARNING'):
+            self.assertEqual(Client().post(url, '{}', content_type='application/json').status_code, 403)
+        with self.assertRaises(NotImplementedError):
+            Client().post(url, '{}', content_type='application/json', HTTP_X_EASYPAY_CODE='secret')
+
+    @override_settings(EASYPAY_WEBHOOK_HANDLERS={'authorisation_notification': mock.Mock()})
+    def test_custom_handler(self):
+        from django.conf import settings as django_settings
+        handler = django_settings.EASYPAY_WEBHOOK_HANDLERS['authorisation_notification']
+        response = Client().post(reverse('authorisation_notification'), '{"id": "p1"}',
+                                 content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        handler.assert_called_once_with({'id': 'p1'})
+
+    def test_routes_are_anchored(self):
+        self.assertEqual(Client().post('/notifyXYZ', '{}', content_type='application/json').status_code, 404)
+
+    def test_invalid_body(self):
+        with self.assertLogs('easypay.views', 'WARNING'):
+            response = Client().post(reverse('generic_notification'), '{', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_only_post_is_allowed(self):
+        self.assertEqual(Client().get(reverse('generic_notification')).status_code, 405)
+
+    def test_auth_code_is_checked_before_decoding(self):
+        with override_settings(EASYPAY_NOTIFICATION_CODE_GENERIC='secret'), \
+                self.assertLogs('easypay.views', 'WARNING') as logs:
+            response = Client().post(reverse('generic_notification'), '{', content_type='application/json',
+                                     HTTP_X_EASYPAY_CODE='wrong')
+        self.assertEqual(response.status_code, 403)
+        self.assertIn('permission denied', logs.output[-1])
+
+
+def authorise(data):
+    pass
+
+
+class HandlerTableTests(SimpleTestCase):
+
+    def test_defaults(self):
+        handlers = build_handlers()
+        self.assertEqual(sorted(handlers), ['authorisation_notification', 'generic_notification',
+                                            'mbway_notification', 'transaction_notification'])
+        self.assertIsNone(handlers['mbway_notification'].code)
+        self.assertIsNone(handlers['authorisation_notification'].queue_kind)
+        self.assertIsNotNone(handlers['transaction_notification'].queue_kind)
+
+    @override_settings(EASYPAY_WEBHOOK_HANDLERS={'transaction_notification': 'easypay.tests.test_views.authorise'})
+    def test_custom_handler_is_never_queued(self):
+        handler = build_handlers()['transaction_notification']
+        self.assertIs(handler.handle, authorise)
+        self.assertIsNone(handler.queue_kind)
+
+    def test_unknown_notification_type(self):
+        with override_settings(EASYPAY_WEBHOOK_HANDLERS={'refund_notification': authorise}), \
+                self.assertRaises(ValueError):
+            build_handlers()
+
+    def test_table_is_rebuilt_on_settings_change(self):
+        handlers = get_handlers()
+        self.assertIs(get_handlers(), handlers)
+        with override_settings(EASYPAY_NOTIFICATION_CODE_GENERIC='secret'):
+            self.assertEqual(get_handlers()['generic_notification'].code, b'secret')
+        self.assertIsNot(get_handlers(), handlers)
@@ -0,0 +1,85 @@
+import io
+import json
+from unittest import mock
+
+from django.test import Client, RequestFactory, SimpleTestCase, override_settings
+from django.urls import reverse
+
+from ..webhooks import InvalidPayload, body_too_large, decode_form, decode_json, request_charset
+
+
+class DecodeTests(SimpleTestCase):
+
+    def test_request_charset(self):
+        factory = RequestFactory()
+        self.assertEqual(request_charset(factory.post('/', b'{}', content_type='application/json')), 'utf-8')
+        request = factory.post('/', b'{}', content_type='application/json; charset=ISO-8859-1 ')
+        self.assertEqual(request_charset(request), 'iso-8859-1')
+
+    def test_decode_json(self):
+        self.assertEqual(decode_json(b'{"id": "p1"}'), {'id': 'p1'})
+        self.assertEqual(decode_json(json.dumps({'id': 'p\xe9'}, ensure_ascii=False).encode('latin-1'), 'latin-1'),
+                         {'id': 'p\xe9'})
+
+    def test_decode_json_errors(self):
+        for body, charset in ((b'{', 'utf-8'), (b'{"id": "p\xe9"}', 'utf-8'), (b'{}', 'bogus')):
+            with self.assertRaises(InvalidPayload):
+                decode_json(body, charset)
+
+    def test_decode_form(self):
+        data = decode_form('Reference=r1&Name=Jos\xe9'.encode('latin-1'), 'latin-1')
+        self.assertEqual((data['Reference'], data['Name']), ('r1', 'Jos\xe9'))
+        data['Status'] = 'success'  # mutable copy
+        with self.assertRaises(InvalidPayload):
+            decode_form(b'Reference=r1', 'bogus')
+
+    @override_settings(EASYPAY_WEBHOOK_MAX_BODY_SIZE=10)
+    def test_body_too_large(self):
+        factory = RequestFactory()
+        self.assertFalse(body_too_large(factory.post('/', b'0123456789', content_type='application/json')))
+        self.assertTrue(body_too_large(factory.post('/', b'0123456789a', content_type='application/json')))
+        # a Content-Length over the limit is rejected before the body is read
+        request = factory.post('/', b'{}', content_type='application/json', CONTENT_LENGTH='11')
+        self.assertTrue(body_too_large(request))
+        with override_settings(EASYPAY_WEBHOOK_MAX_BODY_SIZE=0):
+            self.assertFalse(body_too_large(factory.post('/', b'0123456789a', content_type='application/json')))
+
+
+@override_settings(ROOT_URLCONF='easypay.urls')
+class WebhookBodyTests(SimpleTestCase):
+
+    def post(self, name, body, content_type):
+        # Client.post would re-encode the body in the content type charset
+        return Client().generic('POST', reverse(name), body, content_type=content_type)
+
+    def test_latin1_json_body(self):
+        handler = mock.Mock()
+        body = json.dumps({'id': 'p\xe9'}, ensure_ascii=False).encode('latin-1')
+        with override_settings(EASYPAY_WEBHOOK_HANDLERS={'generic_notification': handler}):
+            response = self.post('generic_notification', body, 'application/json; charset=latin-1')
+        self.assertEqual(response.status_code, 200)
+        handler.assert_called_once_with({'id': 'p\xe9'})
+
+    def test_latin1_form_body(self):
+        with mock.patch('easypay.signals.mbway_notification.send') as send:
+            response = self.post('mbway_notification', 'Reference=r1&Username=Jos\xe9'.encode('latin-1'),
+                                 'application/x-www-form-urlencoded; charset=latin-1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(send.call_args[1]['notification'].username, 'Jos\xe9')
+
+    def test_unknown_charset_is_a_bad_request(self):
+        stderr = io.StringIO()
+        with mock.patch('sys.stderr', stderr), self.assertLogs('easypay.views', 'INFO') as logs:
+            response = self.post('generic_notification', b'{"id": "p1"}', 'application/json; charset=bogus')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('<12 bytes>', logs.output[0])
+        self.assertNotIn('Logging error', stderr.getvalue())
+
+    @override_settings(EASYPAY_WEBHOOK_MAX_BODY_SIZE=16)
+    def test_large_body_is_rejected(self):
+        handler = mock.Mock()
+        with override_settings(EASYPAY_WEBHOOK_HANDLERS={'generic_notification': handler}), \
+                self.assertLogs('easypay.views', 'WARNING'):
+            response = self.post('generic_notification', json.dumps({'id': 'p' * 20}), 'application/json')
+        self.assertEqual(response.status_code, 413)
+        handler.assert_not_called()
@@ -0,0 +1,37 @@
+from unittest import mock, skipUnless
+
+from django.apps import apps
+
+from ..api import EasypayApiException, PaymentResponse
+
+
+PAYMENTS_INSTALLED = apps.is_installed('easypay.payments')
+requires_payments = skipUnless(PAYMENTS_INSTALLED, 'requires easypay.payments in INSTALLED_APPS')
+PAYMENT_MODEL = 'easypay_payments.Payment'
+
+
+def payment_response(id='p1', status='pending'):
+    return PaymentResponse.from_dict({'id': id, 'status': 'ok', 'messages': ['created'],
+                                      'method': {'type': 'mb', 'status': status}, 'customer': {'id': 'c1'}})
+
+
+def api_exception(status_code):
+    response = mock.Mock(status_code=status_code, url='https://api.test.easypay.pt/2.0/single', text='error')
+    response.json.side_effect = ValueError
+    return EasypayApiException(response)
+
+
+def generic_body(id='p1', status='success'):
+    return {'id': id, 'key': 'k', 'type': 'capture', 'status': status, 'messages': [],
+            'date': '2020-01-01 10:00:00'}
+
+
+def transaction_body(id='p1', transaction_type='capture', requested=10, paid=10):
+    return {'id': id, 'value': requested, 'currency': 'EUR', 'key': 'k', 'method': 'mb', 'customer': {'id': 'c1'},
+            'transaction': {'id': 't-' + id, 'key': 'k', 'type': transaction_type, 'date': '2020-01-01 10:00:00',
+                            'values': {'requested': requested, 'paid': paid}},
+            'account': {'id': 'acc'}}
+
+
+def get_payment_model():
+    return apps.get_model(PAYMENT_MODEL)
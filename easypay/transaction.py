@@ -1,15 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from django.apps import apps
+from django.conf import settings as django_settings
+from django.db import connections
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 import logging
 from uuid import uuid4
 
-from . import settings
-from .api import single_payment as api_single_payment
+from . import outbox, settings
+from .api import EXPIRATION_TIME_FORMAT, EasypayApiException, EasypayUnavailableException
+from .api import get_payment as api_get_payment, single_payment as api_single_payment
+from .metrics import get_metrics
 
 log = logging.getLogger(__name__)
 
 
-def _single_payment(*args, **kwargs):
-    value = args[0]
+def _expiration_datetime(expiration_time):
+    """
+    Parses expiration_time for the payment record, values that can't be parsed are stored as None, Easypay
+    validates what it is sent
+    :param expiration_time: string <YYYY-mm-dd HH:MM> or datetime, naive values are in the current time zone
+    :return: datetime, aware when USE_TZ is set, or None
+    """
+    if not expiration_time:
+        return None
+    if not isinstance(expiration_time, datetime):
+        try:
+            parsed = parse_datetime(expiration_time)
+        except (TypeError, ValueError):
+            parsed = None
+        if parsed is None:
+            log.warning('Payment expiration_time %r not stored, it is not a <%s> date.',
+                        expiration_time, EXPIRATION_TIME_FORMAT)
+            return None
+        expiration_time = parsed
+    if django_settings.USE_TZ and timezone.is_naive(expiration_time):
+        expiration_time = timezone.make_aware(expiration_time)
+    return expiration_time
+
+
+def _prepare_single_payment(args, kwargs):
+    """
+    Fills in the customer details from user and merchant_key
+    :return: Tuple of the single_payment kwargs, merchant_key, value, user and expiration_time as given
+    """
+    value = args[0] if args else kwargs.get('value')
+    expiration_time = args[6] if len(args) > 6 else kwargs.get('expiration_time')
+    kwargs = dict(kwargs)
     user = kwargs.pop('user', None)
     customer_name = kwargs.pop('customer_name', None)
     customer_email = kwargs.pop('customer_email', None)
@@ -27,28 +65,96 @@ def _single_payment(*args, **kwargs):
         if not customer_key:
             customer_key = str(user.id)
 
-    log.debug('Making easypay payment request with args: '
-              'merchant_key=%s, customer_name=%s, customer_email=%s, customer_key=%s, args: %s, kwargs: %s',
-              merchant_key, customer_name, customer_email, customer_key, args, kwargs)
+    kwargs.update(merchant_key=merchant_key, customer_name=customer_name, customer_email=customer_email,
+                  customer_key=customer_key)
+    return kwargs, merchant_key, value, user, expiration_time
+
+
+def _call_single_payment(args, kwargs):
+    """
+    Requests the payment from Easypay with the _prepare_single_payment kwargs
+    :return: PaymentResponse
+    """
+    log.debug('Making easypay payment request with args: %s, kwargs: %s', args, kwargs)
 
-    payment_response = api_single_payment(merchant_key=merchant_key, customer_name=customer_name,
-                                          customer_email=customer_email, customer_key=customer_key, *args, **kwargs)
+    payment_response = api_single_payment(*args, **kwargs)
 
     log.debug('easypay payment created with id [%s], method: %s',
-              payment_response.id, vars(payment_response.method))
+              payment_response.id, payment_response.method.as_dict())
+
+    return payment_response
+
+
+def _request_single_payment(*args, **kwargs):
+    """
+    Fills in the customer details from user and merchant_key, then requests the payment from Easypay
+    :return: Tuple of PaymentResponse, merchant_key, value, user and expiration_time as given
+    """
+    kwargs, merchant_key, value, user, expiration_time = _prepare_single_payment(args, kwargs)
+    return _call_single_payment(args, kwargs), merchant_key, value, user, expiration_time
+
+
+def _single_payment_outbox(*args, **kwargs):
+    """
+    _single_payment journaling the payment in the outbox before calling Easypay, see EASYPAY_PAYMENT_OUTBOX
+    """
+    kwargs, merchant_key, value, user, expiration_time = _prepare_single_payment(args, kwargs)
+    intent = outbox.record_intent(merchant_key, value, user, _expiration_datetime(expiration_time),
+                                  kwargs.get('account'))
+    try:
+        payment_response = _call_single_payment(args, kwargs)
+    except EasypayUnavailableException:
+        # never sent, no payment was created
+        outbox.discard_intent(intent)
+        raise
+    except EasypayApiException as e:
+        # a 5xx to the non-retried POST may still have created the payment
+        outbox.discard_intent(intent, e if e.response.status_code >= 500 else None)
+        raise
+    except Exception as e:
+        outbox.discard_intent(intent, e)
+        raise
+
+    return payment_response, outbox.complete_intent(intent, payment_response)
+
+
+def _single_payment(*args, **kwargs):
+    if settings.PERSIST_TRANSACTIONS_CLASS and settings.PAYMENT_OUTBOX:
+        return _single_payment_outbox(*args, **kwargs)
+
+    payment_response, merchant_key, value, user, expiration_time = _request_single_payment(*args, **kwargs)
 
     payment_record = None
     if settings.PERSIST_TRANSACTIONS_CLASS:
         try:
-            PaymentModel = apps.get_model(settings.PERSIST_TRANSACTIONS_CLASS)
-            payment_record = PaymentModel.create(merchant_key, value, payment_response, user)
-            payment_record.save()
+            with get_metrics().timer('easypay_persist_seconds', operation='create'):
+                PaymentModel = apps.get_model(settings.PERSIST_TRANSACTIONS_CLASS)
+                payment_record = PaymentModel.create(merchant_key, value, payment_response, user,
+                                                     _expiration_datetime(expiration_time))
+                payment_record.save()
         except Exception as e:
             log.error('Failed to save payment with id [%s] to database, error: %s.', payment_response.id, e, exc_info=True)
 
     return payment_response, payment_record
 
 
+def _map_concurrently(func, items, max_concurrency):
+    """
+    Calls func for each item using up to max_concurrency threads
+    :return: list, in input order, of the results or of the exception raised for each item
+    """
+    def call(item):
+        try:
+            return func(item)
+        except Exception as e:
+            return e
+
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(items)))) as executor:
+        return list(executor.map(call, items))
+
+
 def single_payment(*args, **kwargs):
     """
     Payments used on a one time purchase
@@ -59,7 +165,7 @@ def single_payment(*args, **kwargs):
     :param capture_transaction_key: string Your internal key identifying this capture
     :param capture_date: string <YYYY-mm-dd>
     :param capture_descriptive: string This will appear in the bank statement/mbway application
-    :param expiration_time: string <YYYY-mm-dd HH:MM> Optional - used only for expirable methods (mbw, cc , dd)
+    :param expiration_time: string <YYYY-mm-dd HH:MM> or datetime Optional - only for expirable methods (mbw, cc , dd)
     :param currency: string Default: "EUR" Valid values: "EUR" "BRL"
     :param customer_account_id:  string <uuid> Optional - uuid from previous created customers
     :param customer_name: string
@@ -70,6 +176,8 @@ def single_payment(*args, **kwargs):
     :param customer_key: string
     :param merchant_key: string Merchant identification key
     :param user: Django User object optional
+    :param client: EasypayClient optional, defaults to the shared pooled client
+    :param account: string Easypay AccountId optional, uses that merchant account's client instead
     :return: PaymentResponse
     """
     return _single_payment(*args, **kwargs)[0]
@@ -85,7 +193,7 @@ def single_payment_db(*args, **kwargs):
     :param capture_transaction_key: string Your internal key identifying this capture
     :param capture_date: string <YYYY-mm-dd>
     :param capture_descriptive: string This will appear in the bank statement/mbway application
-    :param expiration_time: string <YYYY-mm-dd HH:MM> Optional - used only for expirable methods (mbw, cc , dd)
+    :param expiration_time: string <YYYY-mm-dd HH:MM> or datetime Optional - only for expirable methods (mbw, cc , dd)
     :param currency: string Default: "EUR" Valid values: "EUR" "BRL"
     :param customer_account_id:  string <uuid> Optional - uuid from previous created customers
     :param customer_name: string
@@ -96,6 +204,67 @@ def single_payment_db(*args, **kwargs):
     :param customer_key: string
     :param merchant_key: string Merchant identification key
     :param user: Django User object optional
+    :param client: EasypayClient optional, defaults to the shared pooled client
+    :param account: string Easypay AccountId optional, uses that merchant account's client instead
     :return: Tuple of PaymentResponse and Payment record
     """
     return _single_payment(*args, **kwargs)
+
+
+def bulk_single_payment(specs, max_concurrency=None):
+    """
+    Creates many single payments at once. The API calls run in parallel over the shared connection pool and,
+    when EASYPAY_PERSIST_TRANSACTIONS_CLASS is set, the successful ones are saved with a single bulk_create.
+    With EASYPAY_PAYMENT_OUTBOX every payment is journaled and saved on its own like single_payment_db, on the
+    connections of the worker threads, so outside of any transaction of the caller
+
+    :param specs: iterable of dicts with the single_payment arguments, e.g. {'value': 10, 'method': 'mb', 'user': user}
+    :param max_concurrency: maximum number of API calls in flight, defaults to EASYPAY_BULK_MAX_CONCURRENCY
+    :return: list, in input order, of (PaymentResponse, Payment record) tuples or of the exception raised for that spec
+    """
+    specs = [dict(spec) for spec in specs]
+    if settings.PERSIST_TRANSACTIONS_CLASS and settings.PAYMENT_OUTBOX:
+        def create(spec):
+            try:
+                return _single_payment_outbox(**spec)
+            finally:
+                connections.close_all()  # the worker thread's own connections
+        return _map_concurrently(create, specs, max_concurrency or settings.BULK_MAX_CONCURRENCY)
+
+    created = _map_concurrently(lambda spec: _request_single_payment(**spec), specs,
+                                max_concurrency or settings.BULK_MAX_CONCURRENCY)
+
+    results = [c if isinstance(c, Exception) else (c[0], None) for c in created]
+    succeeded = [i for i, c in enumerate(created) if not isinstance(c, Exception)]
+
+    if settings.PERSIST_TRANSACTIONS_CLASS and succeeded:
+        try:
+            with get_metrics().timer('easypay_persist_seconds', operation='bulk_create'):
+                PaymentModel = apps.get_model(settings.PERSIST_TRANSACTIONS_CLASS)
+                records = PaymentModel.objects.bulk_create([
+                    PaymentModel.create(merchant_key, value, payment_response, user,
+                                        _expiration_datetime(expiration_time))
+                    for payment_response, merchant_key, value, user, expiration_time in (created[i] for i in succeeded)
+                ])
+        except Exception as e:
+            log.error('Failed to save payments with ids %s to database, error: %s.',
+                      [created[i][0].id for i in succeeded], e, exc_info=True)
+        else:
+            for i, payment_record in zip(succeeded, records):
+                results[i] = (results[i][0], payment_record)
+
+    return results
+
+
+def get_payments(ids, max_concurrency=None, client=None, account=None):
+    """
+    Shows the details of many payments, the API calls run in parallel over the shared connection pool
+
+    :param ids: iterable of string <uuid>
+    :param max_concurrency: maximum number of API calls in flight, defaults to EASYPAY_BULK_MAX_CONCURRENCY
+    :param client: EasypayClient optional, defaults to the shared pooled client
+    :param account: string Easypay AccountId optional, uses that merchant account's client instead
+    :return: list, in input order, of PaymentResponse or of the exception raised for that id
+    """
+    return _map_concurrently(lambda id: api_get_payment(id, client=client, account=account), list(ids),
+                             max_concurrency or settings.BULK_MAX_CONCURRENCY)
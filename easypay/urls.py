@@ -1,12 +1,10 @@
-from __future__ import unicode_literals
-
-from django.conf.urls import url
+from django.urls import path
 
 from . import views
 
 urlpatterns = [
-    url(r'^notify', views.generic_notification, name="generic_notification"),
-    url(r'^authorisation_notify', views.authorisation_notification, name="authorisation_notification"),
-    url(r'^transaction_notify', views.transaction_notification, name="transaction_notification"),
-    url(r'^mbway_notify', views.mbway_notification, name="mbway_notification"),
+    path('notify', views.generic_notification, name="generic_notification"),
+    path('authorisation_notify', views.authorisation_notification, name="authorisation_notification"),
+    path('transaction_notify', views.transaction_notification, name="transaction_notification"),
+    path('mbway_notify', views.mbway_notification, name="mbway_notification"),
 ]
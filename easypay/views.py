@@ -1,117 +1,277 @@
 from django.apps import apps
 from django.core.exceptions import PermissionDenied
-from django.http import HttpResponse, QueryDict
+from django.http import Http404, HttpResponse, HttpResponseBadRequest
+from django.utils.decorators import method_decorator
+from django.utils.module_loading import import_string
+from django.views import View
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_POST
-import json
+from functools import lru_cache
+import hmac
 import logging
+import threading
 
-from . import settings, signals
-from .api import GenericNotification, TransactionNotification, MbwayNotification, get_payment
+from . import dispatch, settings, signals
+from .api import GenericNotification, TransactionNotification, MbwayNotification
+from .dedup import process_once
+from .metrics import get_metrics
+from .models import QueuedNotification
+from .notification_queue import enqueue_notification
+from .payload_logging import log_payload
+from .payment_cache import get_payment, notification_received
+from .webhooks import InvalidPayload, body_too_large, decode_form, decode_json, request_charset
 
 
 log = logging.getLogger(__name__)
 
 
-# Create your views here.
-@require_POST
-@csrf_exempt
-def generic_notification(request):
+def get_status_resolver():
     """
-    Generic Notification endpoint
-    :param request:
-    :return:
+    :return: the EASYPAY_NOTIFICATION_STATUS_RESOLVER callable
     """
-    log.info("generic_notification, Easypay incoming POST data: \n%s", request.body)
+    return _import_status_resolver(settings.NOTIFICATION_STATUS_RESOLVER)
 
-    easypay_code = request.META.get('HTTP_X_EASYPAY_CODE')
-    log.debug("generic_notification, Easypay X_EASYPAY_CODE header: \n%s", easypay_code)
-    if settings.NOTIFICATION_CODE_GENERIC and settings.NOTIFICATION_CODE_GENERIC != easypay_code:
-        log.warning("generic_notification, permission denied, X_EASYPAY_CODE: \n%s", easypay_code)
-        raise PermissionDenied("Permission Denied")
 
-    encoding = request.POST.get('charset', 'utf-8')
-    data = json.loads(request.body.decode(encoding))
+@lru_cache(maxsize=None)
+def _import_status_resolver(path):
+    return import_string(path)
 
+
+def process_generic_notification(data):
+    """
+    Handles a decoded generic notification, dispatching the generic_notification signal
+    :param data: decoded notification body
+    :return: GenericNotification
+    """
     notification = GenericNotification(data)
 
-    log.debug("Easypay generic notification: %s", vars(notification))
+    log_payload(log, "Easypay generic notification", notification, level=logging.DEBUG)
+
+    with process_once(notification) as first:
+        if first:
+            notification_received(notification.id, notification.date)
 
-    signals.generic_notification.send(sender=generic_notification, notification=notification)
+            dispatch.send(signals.generic_notification, 'generic_notification',
+                          sender=generic_notification, notification=notification)
 
-    return HttpResponse("OK")
+    return notification
 
 
-@require_POST
-@csrf_exempt
-def authorisation_notification(request):
+def process_authorisation_notification(data):
     """
-    Authorisation Notification endpoint
-    :param request:
-    :return:
+    Default authorisation notification handler, set one in EASYPAY_WEBHOOK_HANDLERS
+    :param data: decoded notification body
     """
-    log.info("authorisation_notification, Easypay incoming POST data: \n%s", request.body)
+    raise NotImplementedError('authorisation_notification not implemented')
 
-    easypay_code = request.META.get('HTTP_X_EASYPAY_CODE')
-    log.debug("generic_notification, Easypay X_EASYPAY_CODE header: \n%s", easypay_code)
-    if settings.NOTIFICATION_CODE_AUTHORISATION and settings.NOTIFICATION_CODE_AUTHORISATION != easypay_code:
-        log.warning("authorisation_notification, permission denied, X_EASYPAY_CODE: \n%s", easypay_code)
-        raise PermissionDenied("Permission Denied")
 
-    raise NotImplementedError('authorisation_notification not implemented')
+def process_transaction_notification(data, fail_silently=True):
+    """
+    Handles a decoded transaction notification, refreshing the persisted payment and dispatching the
+    transaction_notification signal with payment_updated: True if the persisted payment changed, False for
+    duplicate notifications or unknown payments and None when payments aren't persisted or the update failed
+    :param data: decoded notification body
+    :param fail_silently: when False, errors updating the payment are raised instead of logged
+    :return: TransactionNotification
+    """
+    notification = TransactionNotification(data)
+
+    log_payload(log, "Easypay transaction notification", notification, level=logging.DEBUG)
 
+    with process_once(notification) as first:
+        if first:
+            payment_updated = _update_payment(notification, fail_silently)
 
-@require_POST
-@csrf_exempt
-def transaction_notification(request):
+            dispatch.send(signals.transaction_notification, 'transaction_notification',
+                          sender=transaction_notification, notification=notification, payment_updated=payment_updated)
+
+    return notification
+
+
+def _update_payment(notification, fail_silently):
     """
-    Transaction Notification endpoint
-    :param request:
-    :return:
+    Refreshes the status of the persisted payment of a transaction notification
+    :return: True if the persisted payment changed, False if it is missing or unchanged, None when payments aren't
+             persisted or the update failed silently
+    """
+    if not settings.PERSIST_TRANSACTIONS_CLASS:
+        return None
+    try:
+        PaymentModel = apps.get_model(settings.PERSIST_TRANSACTIONS_CLASS)
+        notification_received(notification.id, notification.transaction.date, account=notification.account_id)
+        status = None
+        if settings.NOTIFICATION_UPDATE_POLICY == 'payload':
+            status = get_status_resolver()(notification)
+        if status is None:
+            # notification.transaction.id can be different than id, account routes to the merchant's own client
+            payment_response = get_payment(notification.id, account=notification.account_id)
+            status = payment_response.method.status
+        with get_metrics().timer('easypay_persist_seconds', operation='update_status'):
+            payment_updated = PaymentModel.update_status_by_easypay_id(notification.id, status)
+        log.debug('Payment with id [%s] in the database %s.',
+                  notification.id, 'updated' if payment_updated else 'missing or unchanged')
+        return payment_updated
+    except Exception as e:
+        if not fail_silently:
+            raise
+        log.error('Failed to update payment with id [%s] in the database, error: %s.', notification.id, e, exc_info=True)
+        return None
+
+
+def process_mbway_notification(data):
+    """
+    Handles a decoded MB WAY notification, dispatching the mbway_notification signal
+    :param data: decoded notification body
+    :return: MbwayNotification
     """
-    log.info("transaction_notification, Easypay incoming POST data: \n%s", request.body)
+    notification = MbwayNotification(data)
+    log_payload(log, "Easypay MBWay notification", notification, level=logging.DEBUG)
 
-    easypay_code = request.META.get('HTTP_X_EASYPAY_CODE')
-    log.debug("generic_notification, Easypay X_EASYPAY_CODE header: \n%s", easypay_code)
-    if settings.NOTIFICATION_CODE_TRANSACTION and settings.NOTIFICATION_CODE_TRANSACTION != easypay_code:
-        log.warning("transaction_notification, permission denied, X_EASYPAY_CODE: \n%s", easypay_code)
-        raise PermissionDenied("Permission Denied")
+    dispatch.send(signals.mbway_notification, 'mbway_notification',
+                  sender=mbway_notification, notification=notification)
 
-    encoding = request.POST.get('charset', 'utf-8')
-    data = json.loads(request.body.decode(encoding))
+    return notification
 
-    notification = TransactionNotification(data)
 
-    log.debug("Easypay transaction notification: %s, transaction: %s",
-              vars(notification), vars(notification.transaction))
+class WebhookHandler:
+    """
+    Entry of the WebhookView handler table: how a notification type is authorised, decoded and handled
+    """
 
-    if settings.PERSIST_TRANSACTIONS_CLASS:
-        try:
-            PaymentModel = apps.get_model(settings.PERSIST_TRANSACTIONS_CLASS)
-            payment_record = PaymentModel.objects.get(easypay_id=notification.id)
-            payment_response = get_payment(notification.id)  # notification.transaction.id can be different than id
-            payment_record.update(payment_response)
-            log.debug('Updated payment with id [%s] in the database.', notification.id)
-        except Exception as e:
-            log.error('Failed to update payment with id [%s] in the database, error: %s.', notification.id, e, exc_info=True)
+    def __init__(self, handle, decode=decode_json, code=None, queue_kind=None):
+        """
+        :param handle: callable receiving the decoded body
+        :param decode: callable(body, charset) decoding the request body
+        :param code: string expected X-Easypay-Code header, None accepts any request
+        :param queue_kind: QueuedNotification kind, stored instead of handled when EASYPAY_NOTIFICATION_QUEUE is set
+        """
+        self.handle = handle
+        self.decode = decode
+        self.code = code.encode('utf-8') if code else None
+        self.queue_kind = queue_kind
 
-    signals.transaction_notification.send(sender=transaction_notification, notification=notification)
+    def authorised(self, request):
+        if self.code is None:
+            return True
+        received = request.META.get('HTTP_X_EASYPAY_CODE') or ''
+        return hmac.compare_digest(self.code, received.encode('utf-8'))
 
-    return HttpResponse("OK")
 
+def build_handlers():
+    """
+    Builds the handler table from the settings. EASYPAY_WEBHOOK_HANDLERS maps notification types to a handler
+    (or its dotted path) replacing the default one, e.g. {'authorisation_notification': 'shop.easypay.authorise'},
+    notifications with a custom handler are always handled in the request, never queued
+    :return: dict of notification type to WebhookHandler
+    """
+    defaults = {
+        'generic_notification': (process_generic_notification, decode_json, settings.NOTIFICATION_CODE_GENERIC,
+                                  QueuedNotification.KIND_GENERIC),
+        'authorisation_notification': (process_authorisation_notification, decode_json,
+                                       settings.NOTIFICATION_CODE_AUTHORISATION, None),
+        'transaction_notification': (process_transaction_notification, decode_json,
+                                     settings.NOTIFICATION_CODE_TRANSACTION, QueuedNotification.KIND_TRANSACTION),
+        'mbway_notification': (process_mbway_notification, decode_form, None, None),
+    }
+    custom = settings.WEBHOOK_HANDLERS
+    unknown = set(custom) - set(defaults)
+    if unknown:
+        raise ValueError('EASYPAY_WEBHOOK_HANDLERS: unknown notification types {}.'.format(
+            ', '.join(sorted(unknown))))
 
-# Create your views here.
-@require_POST
-@csrf_exempt
-def mbway_notification(request):
-    log.info("mbway_notification, Easypay incoming POST data: \n%s", request.body)
+    handlers = {}
+    for notification_type, (handle, decode, code, queue_kind) in defaults.items():
+        if notification_type in custom:
+            handle = custom[notification_type]
+            handle = import_string(handle) if isinstance(handle, str) else handle
+            queue_kind = None
+        handlers[notification_type] = WebhookHandler(handle, decode=decode, code=code, queue_kind=queue_kind)
+    return handlers
 
-    encoding = request.POST.get('charset', 'utf-8')
-    data = QueryDict(request.body, encoding=encoding).copy()
 
-    notification = MbwayNotification(data)
-    log.debug("Easypay MBWay notification: %s", vars(notification))
+_handlers = None
+_handlers_lock = threading.Lock()
+
+
+def get_handlers():
+    """
+    :return: the handler table, built on first use and rebuilt when the settings it depends on change
+    """
+    global _handlers
+    if _handlers is None:
+        with _handlers_lock:
+            if _handlers is None:
+                _handlers = build_handlers()
+    return _handlers
+
+
+@settings.on_change('WEBHOOK_HANDLERS', 'NOTIFICATION_CODE_GENERIC', 'NOTIFICATION_CODE_AUTHORISATION',
+                    'NOTIFICATION_CODE_TRANSACTION')
+def _reset_handlers():
+    global _handlers
+    _handlers = None
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class WebhookView(View):
+    """
+    Single view behind every Easypay webhook: checks the body size and the X-Easypay-Code header, logs the
+    payload, then queues or decodes it and calls the notification_type handler from get_handlers()
+    """
+    http_method_names = ['post']
+    notification_type = None
+
+    def dispatch(self, request, *args, **kwargs):
+        with get_metrics().timer('easypay_webhook_seconds', view=self.notification_type) as labels:
+            labels['status'] = 'error'
+            response = super(WebhookView, self).dispatch(request, *args, **kwargs)
+            labels['status'] = response.status_code
+            return response
 
-    signals.mbway_notification.send(sender=mbway_notification, notification=notification)
+    def post(self, request, *args, **kwargs):
+        name = self.notification_type
+        handler = get_handlers()[name]
 
-    return HttpResponse("OK")
+        if body_too_large(request):
+            log.warning('%s, request body larger than %s bytes rejected.', name, settings.WEBHOOK_MAX_BODY_SIZE)
+            return HttpResponse('Payload Too Large', status=413)
+
+        charset = request_charset(request)
+        log_payload(log, "%s, Easypay incoming POST data" % name, request.body, encoding=charset, view=name)
+
+        if not handler.authorised(request):
+            log.warning("%s, permission denied, X_EASYPAY_CODE: \n%s", name, request.META.get('HTTP_X_EASYPAY_CODE'))
+            raise PermissionDenied("Permission Denied")
+
+        if handler.queue_kind and settings.NOTIFICATION_QUEUE:
+            enqueue_notification(handler.queue_kind, request.body, charset)
+            return HttpResponse("OK")
+
+        try:
+            data = handler.decode(request.body, charset)
+        except InvalidPayload as e:
+            log.warning('%s, invalid request body: %s', name, e)
+            return HttpResponseBadRequest('Bad Request')
+        handler.handle(data)
+
+        return HttpResponse("OK")
+
+
+# The view names are kept as the signal senders and url names
+generic_notification = WebhookView.as_view(notification_type='generic_notification')
+authorisation_notification = WebhookView.as_view(notification_type='authorisation_notification')
+transaction_notification = WebhookView.as_view(notification_type='transaction_notification')
+mbway_notification = WebhookView.as_view(notification_type='mbway_notification')
+
+
+def metrics(request):
+    """
+    Exports the EASYPAY_METRICS_BACKEND metrics in the Prometheus text format. Not routed by easypay.urls,
+    which is exposed to Easypay, add it to an internal urlconf:
+        path('easypay/metrics', easypay.views.metrics)
+    :param request:
+    :return:
+    """
+    backend = get_metrics()
+    if not hasattr(backend, 'render'):
+        raise Http404('EASYPAY_METRICS_BACKEND does not export metrics')
+    return HttpResponse(backend.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,62 @@
+from django.http import QueryDict
+
+from . import json_backend, settings
+
+UTF8_CHARSETS = frozenset(['utf-8', 'utf8'])
+
+
+class InvalidPayload(ValueError):
+    """Raised for webhook bodies that can't be decoded"""
+
+
+def request_charset(request):
+    """
+    :param request:
+    :return: charset from the Content-Type header, utf-8 when missing
+    """
+    return (request.content_params.get('charset') or 'utf-8').strip().lower()
+
+
+def decode_json(body, charset='utf-8'):
+    """
+    Decodes a JSON webhook body with the EASYPAY_JSON_BACKEND, UTF-8 bodies are parsed straight from the bytes
+    :param body: bytes
+    :param charset: string
+    :return: decoded object
+    """
+    try:
+        if charset in UTF8_CHARSETS:
+            return json_backend.loads(bytes(body))
+        return json_backend.loads(bytes(body).decode(charset))
+    except (ValueError, LookupError) as e:  # JSON and Unicode decode errors are ValueErrors
+        raise InvalidPayload(str(e))
+
+
+def decode_form(body, charset='utf-8'):
+    """
+    Decodes a form encoded webhook body
+    :param body: bytes
+    :param charset: string
+    :return: mutable QueryDict
+    """
+    try:
+        return QueryDict(body, encoding=charset).copy()
+    except (ValueError, LookupError) as e:
+        raise InvalidPayload(str(e))
+
+
+def body_too_large(request):
+    """
+    :param request:
+    :return: True if the body is larger than EASYPAY_WEBHOOK_MAX_BODY_SIZE, checked before the body is read when
+             Content-Length is sent
+    """
+    max_size = settings.WEBHOOK_MAX_BODY_SIZE
+    if not max_size:
+        return False
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+    return content_length > max_size or len(request.body) > max_size
+
@@ -22,15 +22,21 @@ setuptools.setup(
     version=version,
     author="Dario Marcelino",
     author_email="dario@appscot.com",
+    python_requires='>=3.7',
     install_requires=[
-        'Django>=1.10',
+        'Django>=2.2',
         'requests>=2.18.4',
     ],
+    extras_require={
+        'async': ['httpx>=0.18'],
+        'fast': ['orjson'],
+    },
     description="A Django package for Easypay",
     long_description=long_description,
     long_description_content_type="text/markdown",
     url="https://github.com/dmarcelino/django-easypay",
     packages=setuptools.find_packages(),
+    package_data={'easypay': ['templates/admin/easypay/*.html']},
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",